@@ -27,6 +27,58 @@ def create_app():
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev_key')
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt_dev_key')
     
+    # Structured logs written to stdout from a background thread
+    from . import log
+    log.init_app(app)
+    
+    # Per-endpoint latency and query histograms, served at /api/metrics
+    from . import metrics
+    metrics.init_app(app)
+    
+    # Serializes datetimes, Decimals and bytes directly, with orjson when installed
+    from . import json_provider
+    json_provider.init_app(app)
+    
+    # gzip/brotli for larger JSON responses, negotiated with Accept-Encoding
+    from . import compression
+    compression.init_app(app)
+    
+    # Load the JWT secret once for token signing and verification
+    from . import auth_middleware
+    auth_middleware.init_app(app)
+    
+    # Pooled database connections, returned to the pool on request teardown
+    from . import database
+    database.init_app(app)
+    
+    # Negative-lookup filter over product codes, built in the background
+    from . import bloom
+    bloom.init_app(app)
+    
+    # Term vocabulary for search autocomplete and typo correction, built in the background
+    from . import search
+    search.init_app(app)
+    
+    # `flask rebuild-ratings` backfills or repairs the rating aggregates
+    from . import ratings
+    ratings.init_app(app)
+    
+    # Hourly and daily scan counts, rolled up from product_verifications in the background
+    from . import scan_rollups
+    scan_rollups.init_app(app)
+    
+    # `flask export` streams feedback and verification history to CSV, NDJSON or Parquet
+    from . import export
+    export.init_app(app)
+    
+    # `flask migrate-photos` moves inline images out of feedback and certification rows
+    from . import photo_store
+    photo_store.init_app(app)
+    
+    # Inspect the schema once and fail fast if expected columns are missing
+    from . import schema
+    schema.init_app(app)
+    
     # Register blueprints
     from .auth import auth_bp
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -34,8 +86,9 @@ def create_app():
     from .business import business_bp
     app.register_blueprint(business_bp, url_prefix='/api/business')
     
-    from .business_dashboard import business_dashboard_bp
+    from .business_dashboard import business_dashboard_bp, business_v2_bp
     app.register_blueprint(business_dashboard_bp, url_prefix='/api/business')
+    app.register_blueprint(business_v2_bp, url_prefix='/api/v2/business')
     
     from .products import products_bp
     app.register_blueprint(products_bp, url_prefix='/api/products')
@@ -46,6 +99,9 @@ def create_app():
     from .consumer import consumer_bp
     app.register_blueprint(consumer_bp, url_prefix='/api/consumer')
     
+    from .photos import photos_bp
+    app.register_blueprint(photos_bp, url_prefix='/api/photos')
+    
     @app.route('/api/health')
     def health_check():
         return {'status': 'OK', 'message': 'Swach Village API is running'}
@@ -0,0 +1,144 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+import aiomysql
+from .database import _record_query
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPoolTimeout(Exception):
+    """Raised when no async connection becomes available in time."""
+
+
+class InstrumentedAsyncCursor:
+    """aiomysql cursor proxy that times execute() and executemany() into the process totals."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.execute(query, args)
+        finally:
+            _record_query(query, time.perf_counter() - started)
+
+    async def executemany(self, query, args):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.executemany(query, args)
+        finally:
+            _record_query(query, time.perf_counter() - started)
+
+
+class AsyncDatabase:
+    """
+    aiomysql connection pool for the ASGI server, configured like the
+    threaded pool in app/database.py. Connections run in autocommit mode:
+    the async endpoints only read, plus the occasional verification insert,
+    so no transaction is ever left open on a pooled connection.
+    As in the threaded pool, connections are pinged on checkout and
+    replaced once they exceed max_lifetime seconds; aiomysql's own
+    pool_recycle only looks at idle time.
+    """
+
+    def __init__(self, min_size=1, max_size=20, max_lifetime=1800, timeout=5):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self._pool = None
+
+    async def start(self):
+        self._pool = await aiomysql.create_pool(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=int(os.getenv('DB_PORT', 3306)),
+            user=os.getenv('DB_USER', 'root'),
+            password=os.getenv('DB_PASSWORD', 'password'),
+            db=os.getenv('DB_NAME', 'swach_village'),
+            minsize=self.min_size,
+            maxsize=self.max_size,
+            pool_recycle=self.max_lifetime,
+            autocommit=True,
+            cursorclass=aiomysql.DictCursor
+        )
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    def _expired(self, conn):
+        created = getattr(conn, '_pool_created_at', None)
+        if created is None:
+            created = conn._pool_created_at = time.monotonic()
+        return time.monotonic() - created > self.max_lifetime
+
+    async def _healthy(self, conn, timeout):
+        if conn.closed or self._expired(conn):
+            return False
+        try:
+            # Bounded, so a half-open socket cannot hold the request past the deadline
+            await asyncio.wait_for(conn.ping(reconnect=False), timeout)
+            return True
+        except (asyncio.TimeoutError, aiomysql.Error, OSError):
+            return False
+
+    async def acquire(self):
+        """Check out a live connection, waiting up to timeout seconds."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        while True:
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                conn = await asyncio.wait_for(self._pool.acquire(), remaining)
+            except asyncio.TimeoutError:
+                raise AsyncPoolTimeout(f'No database connection available after {self.timeout}s')
+
+            if await self._healthy(conn, max(deadline - loop.time(), 0.001)):
+                return conn
+
+            # Stale or expired connection; a closed one is dropped from the pool on release
+            conn.close()
+            self._pool.release(conn)
+
+    @asynccontextmanager
+    async def cursor(self):
+        """Borrow a connection for one cursor, waiting up to timeout seconds."""
+        conn = await self.acquire()
+        try:
+            async with conn.cursor() as cursor:
+                yield InstrumentedAsyncCursor(cursor)
+        finally:
+            self._pool.release(conn)
+
+    @property
+    def running(self):
+        return self._pool is not None
+
+    def stats(self):
+        if self._pool is None:
+            return {'size': 0, 'idle': 0, 'in_use': 0, 'max_size': self.max_size}
+        return {
+            'size': self._pool.size,
+            'idle': self._pool.freesize,
+            'in_use': self._pool.size - self._pool.freesize,
+            'max_size': self._pool.maxsize
+        }
+
+
+async_db = AsyncDatabase(
+    min_size=int(os.getenv('ASYNC_DB_POOL_MIN_SIZE', 1)),
+    max_size=int(os.getenv('ASYNC_DB_POOL_MAX_SIZE', 20)),
+    max_lifetime=int(os.getenv('DB_POOL_MAX_LIFETIME', 1800)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 5))
+)
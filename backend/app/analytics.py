@@ -0,0 +1,230 @@
+import os
+import threading
+from datetime import date, timedelta
+import numpy as np
+import pymysql
+from .cache import TTLCache
+from .database import pool
+from .ratings import SUBJECT_TYPES
+
+STARS = np.arange(1, 6, dtype=np.float64)
+QUARTILES = (25, 50, 75)
+
+# Weight of the global mean in a smoothed rating, in ratings.
+# Unset means the median rating count of the subject type.
+PRIOR_WEIGHT = os.getenv('ANALYTICS_PRIOR_WEIGHT')
+
+rating_tables = TTLCache(maxsize=len(SUBJECT_TYPES), ttl=float(os.getenv('ANALYTICS_CACHE_TTL', 300)))
+_load_lock = threading.Lock()
+
+
+class RatingTable:
+    """
+    Every rating aggregate of one subject type as columns: ids and an
+    (n, 5) star histogram. Means, Bayesian-smoothed ratings, rating
+    quartiles and percentile ranks are computed for all subjects at once.
+    """
+
+    def __init__(self, subject_type, ids, histograms, prior_weight=None):
+        self.subject_type = subject_type
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.histograms = np.asarray(histograms, dtype=np.int64).reshape(-1, 5)
+        self.counts = self.histograms.sum(axis=1)
+        self.sums = self.histograms @ STARS
+
+        rated = self.counts > 0
+        total = self.counts.sum()
+        self.global_mean = float(self.sums.sum() / total) if total else 0.0
+        if prior_weight is None:
+            prior_weight = float(np.median(self.counts[rated])) if rated.any() else 0.0
+        self.prior_weight = float(prior_weight)
+
+        self.means = np.divide(self.sums, self.counts, out=np.zeros(len(self.ids)), where=rated)
+
+        # Shrink each mean towards the global mean in proportion to how few ratings it has
+        weights = self.prior_weight + self.counts
+        self.smoothed = np.divide(
+            self.prior_weight * self.global_mean + self.sums, weights,
+            out=np.full(len(self.ids), self.global_mean), where=weights > 0
+        )
+
+        # Rating quartiles: first star at which the cumulative histogram reaches q% of the count
+        cumulative = np.cumsum(self.histograms, axis=1)
+        self.quartiles = {}
+        for q in QUARTILES:
+            reached = cumulative >= (self.counts * q / 100.0)[:, None]
+            self.quartiles[q] = np.where(rated, reached.argmax(axis=1) + 1, 0)
+
+        # Percentile rank of the smoothed rating among rated subjects (100 = best)
+        self.rated = rated
+        rated_positions = np.flatnonzero(rated)
+        n = len(rated_positions)
+        ranks = np.empty(n, dtype=np.int64)
+        ranks[np.argsort(self.smoothed[rated_positions], kind='stable')] = np.arange(n)
+        self.percentiles = np.full(len(self.ids), np.nan)
+        self.percentiles[rated_positions] = ranks * (100.0 / (n - 1)) if n > 1 else 100.0
+
+        self._positions = {int(subject_id): i for i, subject_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _entry(self, i):
+        return {
+            'subject_id': int(self.ids[i]),
+            'count': int(self.counts[i]),
+            'average_rating': round(float(self.means[i]), 2),
+            'smoothed_rating': round(float(self.smoothed[i]), 3),
+            'percentile': None if np.isnan(self.percentiles[i]) else round(float(self.percentiles[i]), 1),
+            'quartiles': {str(q): int(self.quartiles[q][i]) for q in QUARTILES},
+            'distribution': {str(star): int(self.histograms[i, star - 1]) for star in range(5, 0, -1)}
+        }
+
+    def top(self, limit, min_count=1):
+        """Best subjects by smoothed rating, more ratings first on ties."""
+        candidates = np.flatnonzero(self.rated & (self.counts >= min_count))
+        order = np.lexsort((-self.counts[candidates], -self.smoothed[candidates]))
+        return [
+            dict(self._entry(i), rank=position + 1)
+            for position, i in enumerate(candidates[order[:limit]])
+        ]
+
+    def lookup(self, subject_id):
+        i = self._positions.get(int(subject_id))
+        if i is None:
+            return None
+        entry = self._entry(i)
+        entry['rank'] = int((self.smoothed[self.rated] > self.smoothed[i]).sum()) + 1 if self.rated[i] else None
+        return entry
+
+    def summary(self):
+        return {
+            'subjects': int(self.rated.sum()),
+            'ratings': int(self.counts.sum()),
+            'global_mean': round(self.global_mean, 3),
+            'prior_weight': self.prior_weight,
+            'distribution': {
+                str(star): int(total) for star, total
+                in zip(range(5, 0, -1), self.histograms.sum(axis=0)[::-1])
+            }
+        }
+
+
+def load_rating_table(conn, subject_type):
+    """Stream one subject type out of rating_aggregates into a RatingTable."""
+    cursor = conn.cursor(pymysql.cursors.SSCursor)
+    try:
+        cursor.execute("""
+            SELECT subject_id, rating_1, rating_2, rating_3, rating_4, rating_5
+            FROM rating_aggregates
+            WHERE subject_type = %s
+        """, (subject_type,))
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64))
+    finally:
+        cursor.close()
+
+    data = np.concatenate(chunks) if chunks else np.empty((0, 6), dtype=np.int64)
+    prior_weight = float(PRIOR_WEIGHT) if PRIOR_WEIGHT else None
+    return RatingTable(subject_type, data[:, 0], data[:, 1:], prior_weight)
+
+
+def get_rating_table(subject_type):
+    """Cached RatingTable for a subject type, reloaded every ANALYTICS_CACHE_TTL seconds."""
+    table = rating_tables.get(subject_type)
+    if table is None:
+        with _load_lock:
+            table = rating_tables.get(subject_type)
+            if table is None:
+                conn = pool.connection()
+                try:
+                    table = load_rating_table(conn, subject_type)
+                finally:
+                    conn.close()
+                rating_tables.set(subject_type, table)
+    return table
+
+
+def daily_totals(day_offsets, values, days):
+    """Per-day counts and sums of values, indexed by day offset from the start of the range."""
+    day_offsets = np.asarray(day_offsets, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    counts = np.bincount(day_offsets, minlength=days)[:days]
+    sums = np.bincount(day_offsets, weights=values, minlength=days)[:days]
+    return counts, sums
+
+
+def moving_average(sums, counts, window):
+    """
+    Trailing `window`-day average of sums / counts for every day.
+    Days whose window holds no data are NaN.
+    """
+    window = max(1, int(window))
+    cumulative_sums = np.concatenate(([0.0], np.cumsum(sums, dtype=np.float64)))
+    cumulative_counts = np.concatenate(([0.0], np.cumsum(counts, dtype=np.float64)))
+    starts = np.maximum(np.arange(len(sums)) + 1 - window, 0)
+    window_sums = cumulative_sums[1:] - cumulative_sums[starts]
+    window_counts = cumulative_counts[1:] - cumulative_counts[starts]
+    return np.divide(
+        window_sums, window_counts,
+        out=np.full(len(sums), np.nan), where=window_counts > 0
+    )
+
+
+def _rounded(values, digits=3):
+    return [None if np.isnan(value) else round(float(value), digits) for value in values]
+
+
+def rating_trend(cursor, business_id, days=90, window=7, today=None):
+    """
+    Daily rating counts and averages for a business's products over the
+    last `days` days, with a trailing moving average of the rating and of
+    the daily scan count.
+    """
+    today = today or date.today()
+    start = today - timedelta(days=days - 1)
+
+    cursor.execute("""
+        SELECT DATEDIFF(f.created_at, %s) AS day_offset, f.rating
+        FROM feedback f
+        JOIN products p ON f.product_id = p.id
+        WHERE p.business_id = %s AND f.created_at >= %s AND f.rating IS NOT NULL
+    """, (start, business_id, start))
+    rows = cursor.fetchall()
+    offsets = np.fromiter((row['day_offset'] for row in rows), dtype=np.int64, count=len(rows))
+    ratings = np.fromiter((row['rating'] for row in rows), dtype=np.float64, count=len(rows))
+    in_range = (offsets >= 0) & (offsets < days)
+    rating_counts, rating_sums = daily_totals(offsets[in_range], ratings[in_range], days)
+
+    cursor.execute("""
+        SELECT DATEDIFF(bucket_date, %s) AS day_offset, SUM(scan_count) AS scans
+        FROM scan_rollups_daily
+        WHERE business_id = %s AND bucket_date >= %s
+        GROUP BY bucket_date
+    """, (start, business_id, start))
+    rows = [row for row in cursor.fetchall() if 0 <= row['day_offset'] < days]
+    scans = np.zeros(days)
+    scans[[row['day_offset'] for row in rows]] = [float(row['scans']) for row in rows]
+
+    daily_average = np.divide(
+        rating_sums, rating_counts,
+        out=np.full(days, np.nan), where=rating_counts > 0
+    )
+    rating_ma = moving_average(rating_sums, rating_counts, window)
+    scan_ma = moving_average(scans, np.ones(days), window)
+
+    return {
+        'start': start,
+        'end': today,
+        'window': window,
+        'days': [start + timedelta(days=i) for i in range(days)],
+        'ratings': rating_counts.tolist(),
+        'average_rating': _rounded(daily_average),
+        'average_rating_moving': _rounded(rating_ma),
+        'scans': scans.astype(np.int64).tolist(),
+        'scans_moving': _rounded(scan_ma, 2)
+    }
@@ -0,0 +1,280 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import AsyncExitStack, asynccontextmanager
+import jwt
+from a2wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route, Router
+from werkzeug.datastructures import MultiDict
+from . import create_app
+from .aio_database import AsyncPoolTimeout, async_db
+from .auth_middleware import decode_token
+from .compression import compress_body, negotiate
+from .consumer import business_directory, catalog_search, leaderboard, product_scan, search_suggestions_reply
+from .feedback import product_feedback
+from .json_provider import dumps_bytes
+from .metrics import request_latency
+from .products import barcode_verification, code_verification
+from .steps import Blocking, Query, RecordVerification, Reply, busy_reply
+from .verification_log import INSERT_VERIFICATIONS_QUERY, verification_writer
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', '1') != '0'
+
+
+# ---------------------- Responses and auth ---------------------- #
+
+def respond(request, body, status=200, etag=None, cache_control=None):
+    """JSON response encoded and compressed as the Flask app does it."""
+    data = dumps_bytes(body) + b'\n'
+    # flask-cors answers every origin; the async routes do the same
+    headers = {'Access-Control-Allow-Origin': '*', 'Vary': 'Accept-Encoding'}
+    encoding = negotiate(request.headers.get('accept-encoding')) if COMPRESS_ENABLED else None
+    if encoding:
+        compressed = compress_body(data, encoding)
+        if compressed is not None:
+            data = compressed
+            headers['Content-Encoding'] = encoding
+            if etag:
+                etag = f'{etag}-{encoding}'
+    if etag:
+        headers['ETag'] = f'"{etag}"'
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+    return Response(data, status_code=status, headers=headers, media_type='application/json')
+
+
+def busy(request):
+    """Shed load quickly while the async pool has no free connection."""
+    return render(request, busy_reply())
+
+
+def render(request, reply):
+    """Starlette response for the Reply of a shared handler."""
+    if reply.status == 304:
+        return Response(status_code=304, headers={
+            'Cache-Control': reply.cache_control, 'ETag': reply.etag, 'Access-Control-Allow-Origin': '*'
+        })
+    response = respond(request, reply.body, reply.status, reply.etag, reply.cache_control)
+    response.headers.update(reply.headers)
+    return response
+
+
+def authenticate(request, roles=None):
+    """The verified token payload, or an error response; mirrors token_required."""
+    auth_header = request.headers.get('authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None, respond(request, {'message': 'Authorization token is missing'}, 401)
+    try:
+        payload = decode_token(auth_header.split(' ')[1])
+    except jwt.ExpiredSignatureError:
+        return None, respond(request, {'message': 'Token expired'}, 401)
+    except jwt.InvalidTokenError:
+        return None, respond(request, {'message': 'Invalid token'}, 401)
+    if roles and payload['role'] not in roles:
+        return None, respond(request, {
+            'message': f'Access denied. This endpoint requires one of these roles: {", ".join(roles)}'
+        }, 403)
+    return payload, None
+
+
+def query_args(request):
+    """Query parameters as the MultiDict the shared Flask helpers expect."""
+    return MultiDict(request.query_params.multi_items())
+
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+# ---------------------- Driving shared handlers ---------------------- #
+# The endpoint logic lives with the Flask routes as step generators
+# (app/steps.py); here each step is awaited instead of run on a thread
+
+async def perform(step, borrow):
+    """Run one step on the event loop; borrow() returns the request's cursor, checking one out first."""
+    if isinstance(step, Query):
+        cursor = await borrow()
+        await cursor.execute(step.sql, step.params)
+        if step.fetch == 'all':
+            return await cursor.fetchall()
+        if step.fetch == 'one':
+            return await cursor.fetchone()
+        return None
+    if isinstance(step, RecordVerification):
+        # Queue for the background writer, writing it here only if the queue is full
+        row = verification_writer.offer(step.product_id, step.user_id, step.method)
+        if row is not None:
+            cursor = await borrow()
+            await cursor.executemany(INSERT_VERIFICATIONS_QUERY, [row])
+        return None
+    if isinstance(step, Blocking):
+        return await asyncio.to_thread(step.func, *step.args)
+    raise TypeError(f'Unknown step {step!r}')
+
+
+async def run(request, handler):
+    """
+    Response of a shared handler, or of a Reply built without I/O. A
+    connection is checked out at the first query and returned once the
+    handler finishes; AsyncPoolTimeout is answered with 503, not thrown
+    into the handler.
+    """
+    if isinstance(handler, Reply):
+        return render(request, handler)
+
+    try:
+        async with AsyncExitStack() as stack:
+            cursor = None
+
+            async def borrow():
+                nonlocal cursor
+                if cursor is None:
+                    cursor = await stack.enter_async_context(async_db.cursor())
+                return cursor
+
+            try:
+                step = next(handler)
+                while True:
+                    try:
+                        result = await perform(step, borrow)
+                    except AsyncPoolTimeout:
+                        raise
+                    except Exception as e:
+                        step = handler.throw(e)
+                    else:
+                        step = handler.send(result)
+            except StopIteration as stop:
+                reply = stop.value
+            finally:
+                handler.close()
+    except AsyncPoolTimeout:
+        return busy(request)
+    return render(request, reply)
+
+
+# ---------------------- Endpoints ---------------------- #
+
+async def verify_product_by_code(request):
+    """GET /api/products/verify"""
+    return await run(request, code_verification(request.query_params.get('code')))
+
+
+async def verify_product(request):
+    """POST /api/products/verify"""
+    _, error = authenticate(request, ['consumer'])
+    if error:
+        return error
+    return await run(request, barcode_verification(await json_body(request)))
+
+
+async def consumer_verify_product(request):
+    """POST /api/consumer/verify-product"""
+    payload, error = authenticate(request, ['consumer'])
+    if error:
+        return error
+    return await run(request, product_scan(payload['user_id'], await json_body(request)))
+
+
+async def get_businesses(request):
+    """GET /api/consumer/businesses"""
+    return await run(request, business_directory(query_args(request), request.headers.get('if-none-match')))
+
+
+async def search_catalog(request):
+    """GET /api/consumer/search"""
+    return await run(request, catalog_search(query_args(request)))
+
+
+async def search_suggestions(request):
+    """GET /api/consumer/search/suggest"""
+    return await run(request, search_suggestions_reply(query_args(request)))
+
+
+async def get_leaderboard(request):
+    """GET /api/consumer/leaderboard"""
+    return await run(request, leaderboard(query_args(request)))
+
+
+async def get_product_feedback(request):
+    """GET /api/feedback/get/<product_id>"""
+    _, error = authenticate(request, ['consumer', 'business'])
+    if error:
+        return error
+    return await run(request, product_feedback(
+        request.path_params['product_id'], query_args(request), request.headers.get('if-none-match')
+    ))
+
+
+# (path, Flask rule used as the metrics label, method, handler)
+ASYNC_ROUTES = (
+    ('/api/products/verify', '/api/products/verify', 'GET', verify_product_by_code),
+    ('/api/products/verify', '/api/products/verify', 'POST', verify_product),
+    ('/api/consumer/verify-product', '/api/consumer/verify-product', 'POST', consumer_verify_product),
+    ('/api/consumer/businesses', '/api/consumer/businesses', 'GET', get_businesses),
+    ('/api/consumer/search', '/api/consumer/search', 'GET', search_catalog),
+    ('/api/consumer/search/suggest', '/api/consumer/search/suggest', 'GET', search_suggestions),
+    ('/api/consumer/leaderboard', '/api/consumer/leaderboard', 'GET', get_leaderboard),
+    ('/api/feedback/get/{product_id:int}', '/api/feedback/get/<int:product_id>', 'GET', get_product_feedback)
+)
+
+
+class AsyncEndpoint:
+    """
+    ASGI wrapper around one async handler. Records request latency under
+    the Flask rule, so both serving modes report the same series, and
+    passes CORS preflights to the Flask app, which answers them.
+    """
+
+    def __init__(self, handler, rule, fallback):
+        self.handler = handler
+        self.rule = rule
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] == 'OPTIONS':
+            await self.fallback(scope, receive, send)
+            return
+
+        request = Request(scope, receive)
+        started = time.perf_counter()
+        try:
+            response = await self.handler(request)
+        except Exception:
+            logger.exception('Unhandled error in async endpoint', extra={'endpoint': self.rule})
+            response = respond(request, {'message': 'Internal server error'}, 500)
+        request_latency.observe(
+            (self.rule, request.method, str(response.status_code)), time.perf_counter() - started
+        )
+        await response(scope, receive, send)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await async_db.start()
+    try:
+        yield
+    finally:
+        await async_db.close()
+
+
+def create_asgi_app(flask_app=None):
+    """
+    ASGI application: the high fan-in consumer read paths run on the event
+    loop against the aiomysql pool, and every other request is handed to
+    the Flask app on a thread pool.
+    """
+    flask_app = flask_app or create_app()
+    fallback = WSGIMiddleware(flask_app, workers=int(os.getenv('ASGI_WSGI_THREADS', 10)))
+    routes = [
+        Route(path, AsyncEndpoint(handler, rule, fallback), methods=[method, 'OPTIONS'])
+        for path, rule, method, handler in ASYNC_ROUTES
+    ]
+    return Router(routes=routes, default=fallback, lifespan=lifespan)
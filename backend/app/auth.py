@@ -1,12 +1,36 @@
-import os
 import jwt
+import logging
 import datetime
 from flask import Blueprint, request, jsonify
-import bcrypt
 from .database import get_db_connection
+from .passwords import hasher, PasswordPoolBusy
+from .auth_middleware import encode_token, decode_token
+
+logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__)
 
+def _busy_response():
+    """Shed load quickly while the password hashing pool is saturated."""
+    response = jsonify({'message': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def _store_rehash(user_id, password_hash):
+    """Save an upgraded hash; runs on the hashing pool after login has returned."""
+    try:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (password_hash, user_id))
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+    except Exception as e:
+        # Tried again on a later login
+        logger.warning('Password rehash failed', extra={'user_id': user_id, 'error': str(e)})
+
 # Generate JWT token
 def generate_token(user_id, email, role):
     payload = {
@@ -15,11 +39,7 @@ def generate_token(user_id, email, role):
         'role': role,
         'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)
     }
-    token = jwt.encode(
-        payload,
-        os.getenv('JWT_SECRET_KEY', 'jwt_dev_key'),
-        algorithm='HS256'
-    )
+    token = encode_token(payload)
     return token
 
 @auth_bp.route('/login', methods=['POST'])
@@ -70,9 +90,19 @@ def login():
             return jsonify({'message': f'User is not registered as a {role}'}), 403
         
         # Verify password
-        if not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+        if not hasher.check(password, user['password_hash']):
             return jsonify({'message': 'Invalid credentials'}), 401
         
+        # Transparently upgrade hashes made with an older cost factor, in the
+        # background so the login does not wait for a second bcrypt round
+        if hasher.needs_rehash(user['password_hash']):
+            user_id = user['id']
+            try:
+                hasher.hash_later(password, lambda password_hash: _store_rehash(user_id, password_hash))
+            except PasswordPoolBusy:
+                # Try again on a later login
+                pass
+        
         # Generate JWT token
         token = generate_token(user['id'], user['email'], user['role'])
         
@@ -88,6 +118,8 @@ def login():
             }
         }), 200
     
+    except PasswordPoolBusy:
+        return _busy_response()
     except Exception as e:
         return jsonify({'message': f'Error: {str(e)}'}), 500
 
@@ -127,7 +159,7 @@ def register():
             return jsonify({'message': 'Phone number already registered'}), 400
         
         # Hash the password
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        password_hash = hasher.hash(password)
         
         # Insert new user
         cursor.execute(
@@ -164,6 +196,8 @@ def register():
             'message': 'Registration successful'
         }), 201
         
+    except PasswordPoolBusy:
+        return _busy_response()
     except Exception as e:
         return jsonify({'message': f'Error: {str(e)}'}), 500
 
@@ -177,11 +211,7 @@ def verify_token():
     token = auth_header.split(' ')[1]
     
     try:
-        payload = jwt.decode(
-            token, 
-            os.getenv('JWT_SECRET_KEY', 'jwt_dev_key'),
-            algorithms=['HS256']
-        )
+        payload = decode_token(token)
         
         return jsonify({
             'valid': True, 
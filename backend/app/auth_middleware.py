@@ -1,7 +1,58 @@
 import os
+import time
+import hashlib
 import jwt
 from functools import wraps
 from flask import request, jsonify
+from .cache import TTLCache
+
+# Verified payloads keyed by token digest, each kept no longer than its exp
+token_cache = TTLCache(
+    maxsize=int(os.getenv('TOKEN_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('TOKEN_CACHE_TTL', 300))
+)
+token_rejects = 0
+
+_jwt_secret = os.getenv('JWT_SECRET_KEY', 'jwt_dev_key')
+
+def init_app(app):
+    """Load the signing secret once when the app is created."""
+    global _jwt_secret
+    _jwt_secret = app.config['JWT_SECRET_KEY']
+    token_cache.clear()
+
+def encode_token(payload):
+    return jwt.encode(payload, _jwt_secret, algorithm='HS256')
+
+def decode_token(token):
+    """
+    Verify a token and return its payload.
+    Repeat presentations of the same token are served from the cache
+    until the token expires; failures raise jwt.InvalidTokenError.
+    """
+    global token_rejects
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
+
+    try:
+        payload = jwt.decode(token, _jwt_secret, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        token_rejects += 1
+        raise
+
+    ttl = token_cache.ttl
+    if 'exp' in payload:
+        ttl = min(ttl, payload['exp'] - time.time())
+    if ttl > 0:
+        token_cache.set(key, payload, ttl)
+    return payload
+
+def token_stats():
+    stats = token_cache.stats()
+    stats['rejects'] = token_rejects
+    return stats
 
 def token_required(roles=None):
     def decorator(f):
@@ -15,11 +66,7 @@ def token_required(roles=None):
             token = auth_header.split(' ')[1]
             
             try:
-                payload = jwt.decode(
-                    token, 
-                    os.getenv('JWT_SECRET_KEY', 'jwt_dev_key'),
-                    algorithms=['HS256']
-                )
+                payload = decode_token(token)
                 
                 # Add user info to kwargs
                 kwargs['user_id'] = payload['user_id']
@@ -0,0 +1,232 @@
+import os
+import math
+import time
+import logging
+import hashlib
+import threading
+import unicodedata
+import pymysql
+from .database import pool
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+    Sized for `capacity` items at the requested false-positive rate, using
+    double hashing over a single blake2b digest.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def false_positive_rate(self):
+        """Expected false-positive rate for the items added so far."""
+        if not self.count:
+            return 0.0
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def memory_bytes(self):
+        return len(self.bits)
+
+
+def normalize_code(product_code):
+    """
+    Fold a code at least as far as MySQL's default accent- and
+    case-insensitive collation does, so the filter never rejects a code the
+    database would find: accents are stripped, case folded and trailing
+    spaces dropped (PAD SPACE collations ignore them).
+    """
+    decomposed = unicodedata.normalize('NFKD', product_code.rstrip(' '))
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+class ProductCodeFilter:
+    """
+    Bloom filter over every products.product_code.
+    Built from a streamed scan of products, topped up every
+    refresh_interval seconds and rebuilt from scratch every
+    rebuild_interval seconds. Until the first build completes every code
+    is treated as possibly present.
+
+    Refreshes read rows by updated_at rather than by id: auto-increment ids
+    can commit out of order, so an id watermark skips rows for good. Each
+    refresh window reaches refresh_overlap seconds back past the previous
+    one, which covers transactions that committed after a later refresh
+    had already run. Adding a code twice does no harm.
+    """
+
+    def __init__(self, error_rate=0.001, refresh_interval=5, rebuild_interval=3600, headroom=1.5,
+                 refresh_overlap=120):
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.refresh_overlap = refresh_overlap
+        self.headroom = headroom
+        self._filter = None
+        self._watermark = None
+        self._pending = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.built_at = None
+        self.build_seconds = None
+        self.rejects = 0
+
+    def might_contain(self, product_code):
+        bloom = self._filter
+        if bloom is None:
+            return True
+        if normalize_code(product_code) in bloom:
+            return True
+        self.rejects += 1
+        return False
+
+    def add(self, product_code):
+        """Record a newly registered product code."""
+        code = normalize_code(product_code)
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(code)
+            if self._pending is not None:
+                self._pending.append(code)
+
+    def build(self):
+        """Rebuild the filter from a streamed scan of the products table."""
+        started = time.monotonic()
+        with self._lock:
+            self._pending = []
+
+        conn = pool.connection()
+        try:
+            cursor = conn.cursor()
+            # Database time, so the refresh window does not depend on this host's clock
+            cursor.execute("SELECT COUNT(*) AS count, CURRENT_TIMESTAMP AS now FROM products")
+            totals = cursor.fetchone()
+            cursor.close()
+
+            bloom = BloomFilter(max(totals['count'] * self.headroom, 1000), self.error_rate)
+
+            # Unbuffered cursor so the codes are streamed, not materialised
+            cursor = conn.cursor(pymysql.cursors.SSCursor)
+            cursor.execute("SELECT product_code FROM products")
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                for (product_code,) in rows:
+                    bloom.add(normalize_code(product_code))
+            cursor.close()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        finally:
+            conn.close()
+
+        with self._lock:
+            for code in self._pending:
+                bloom.add(code)
+            self._pending = None
+            self._filter = bloom
+            self._watermark = totals['now']
+
+        self.built_at = time.time()
+        self.build_seconds = round(time.monotonic() - started, 3)
+
+    def refresh(self):
+        """Add products inserted or recoded since the last build or refresh."""
+        if self._filter is None:
+            return self.build()
+
+        conn = pool.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT CURRENT_TIMESTAMP AS now")
+            now = cursor.fetchone()['now']
+            cursor.execute(
+                "SELECT product_code FROM products WHERE updated_at >= %s - INTERVAL %s SECOND",
+                (self._watermark, self.refresh_overlap)
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+
+        with self._lock:
+            for row in rows:
+                self._filter.add(normalize_code(row['product_code']))
+            self._watermark = now
+
+    def _run(self):
+        next_rebuild = 0
+        while True:
+            try:
+                if time.monotonic() >= next_rebuild:
+                    self.build()
+                    next_rebuild = time.monotonic() + self.rebuild_interval
+                else:
+                    self.refresh()
+            except Exception as e:
+                logger.warning('Product code filter update failed', extra={'error': str(e)})
+            time.sleep(self.refresh_interval)
+
+    def start(self):
+        """Build the filter in the background and keep it up to date."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='product-code-filter', daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        bloom = self._filter
+        if bloom is None:
+            return {'ready': False, 'rejects': self.rejects}
+        return {
+            'ready': True,
+            'items': bloom.count,
+            'capacity': bloom.capacity,
+            'bits': bloom.num_bits,
+            'hashes': bloom.num_hashes,
+            'memory_bytes': bloom.memory_bytes(),
+            'target_false_positive_rate': bloom.error_rate,
+            'estimated_false_positive_rate': round(bloom.false_positive_rate(), 6),
+            'built_at': self.built_at,
+            'build_seconds': self.build_seconds,
+            'rejects': self.rejects
+        }
+
+
+product_filter = ProductCodeFilter(
+    error_rate=float(os.getenv('PRODUCT_FILTER_ERROR_RATE', 0.001)),
+    refresh_interval=int(os.getenv('PRODUCT_FILTER_REFRESH_INTERVAL', 5)),
+    rebuild_interval=int(os.getenv('PRODUCT_FILTER_REBUILD_INTERVAL', 3600)),
+    refresh_overlap=int(os.getenv('PRODUCT_FILTER_REFRESH_OVERLAP', 120))
+)
+
+
+def init_app(app):
+    if os.getenv('PRODUCT_FILTER_ENABLED', '1') == '1':
+        product_filter.start()
@@ -2,6 +2,10 @@ import os
 from flask import Blueprint, request, jsonify
 from .database import get_db_connection
 from .auth_middleware import token_required
+from .product_cache import invalidate_business
+from .dashboard import invalidate_snapshot
+from .etags import make_etag, not_modified, with_etag
+from .photo_store import InvalidPhoto, normalize_photos, photo_refs
 
 business_bp = Blueprint('business', __name__)
 
@@ -24,6 +28,11 @@ def submit_certification(user_id, role):
         # Get the current step being submitted
         current_step = data.get('step', 'full_submission')
         
+        # Only the cleanliness step and a new entry write the photos column. Rows
+        # keep photo ids only; inline images are moved into photo storage
+        if current_step == 'cleanliness' or not existing_cert:
+            photos = normalize_photos(data.get('photos', '[]'))
+        
         if existing_cert:
             # Handle step-by-step updates
             if current_step == 'business_details':
@@ -34,6 +43,7 @@ def submit_certification(user_id, role):
                     pan_card = %s,
                     aadhaar_card = %s,
                     gst_number = %s,
+                    version = version + 1,
                     updated_at = CURRENT_TIMESTAMP
                     WHERE user_id = %s
                 """, (
@@ -53,6 +63,7 @@ def submit_certification(user_id, role):
                     owner_email = %s,
                     pan_card_owner = %s,
                     aadhaar_card_owner = %s,
+                    version = version + 1,
                     updated_at = CURRENT_TIMESTAMP
                     WHERE user_id = %s
                 """, (
@@ -69,6 +80,7 @@ def submit_certification(user_id, role):
                     UPDATE business_certification SET 
                     vendor_count = %s,
                     vendor_certification = %s,
+                    version = version + 1,
                     updated_at = CURRENT_TIMESTAMP
                     WHERE user_id = %s
                 """, (
@@ -83,11 +95,12 @@ def submit_certification(user_id, role):
                     photos = %s,
                     sanitation_practices = %s,
                     waste_management = %s,
+                    version = version + 1,
                     updated_at = CURRENT_TIMESTAMP
                     WHERE user_id = %s
                 """, (
                     data.get('cleanliness_rating', 0),
-                    data.get('photos', '[]'),
+                    photos,
                     data.get('sanitation_practices', False),
                     data.get('waste_management', False),
                     user_id
@@ -98,6 +111,7 @@ def submit_certification(user_id, role):
                     is_vegetarian = %s,
                     is_vegan = %s,
                     cruelty_free = %s,
+                    version = version + 1,
                     updated_at = CURRENT_TIMESTAMP
                     WHERE user_id = %s
                 """, (
@@ -110,6 +124,7 @@ def submit_certification(user_id, role):
                 cursor.execute("""
                     UPDATE business_certification SET 
                     sustainability = %s,
+                    version = version + 1,
                     updated_at = CURRENT_TIMESTAMP
                     WHERE user_id = %s
                 """, (
@@ -130,6 +145,7 @@ def submit_certification(user_id, role):
                     cruelty_free = %s,
                     sustainability = %s,
                     status = 'pending',
+                    version = version + 1,
                     updated_at = CURRENT_TIMESTAMP
                     WHERE user_id = %s
                 """, (
@@ -171,7 +187,7 @@ def submit_certification(user_id, role):
                 data.get('vendor_count', 0),
                 data.get('vendor_certification', ''),
                 data.get('cleanliness_rating', 0),
-                data.get('photos', '[]'),
+                photos,
                 data.get('sanitation_practices', False),
                 data.get('waste_management', False),
                 data.get('is_vegetarian', False),
@@ -184,11 +200,17 @@ def submit_certification(user_id, role):
         cursor.close()
         conn.close()
         
+        # Cached product rows and the dashboard carry this business's certification details
+        invalidate_business(user_id)
+        invalidate_snapshot(user_id)
+        
         return jsonify({
             'message': 'Business certification submitted successfully',
             'status': 'pending'
         }), 201
         
+    except InvalidPhoto as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'Error: {str(e)}'}), 500
 
@@ -223,6 +245,14 @@ def get_certification(user_id, role):
         if not certification:
             return jsonify({'message': 'No certification found'}), 404
         
+        etag = make_etag(
+            'certification', user_id, certification['version'], certification['updated_at'],
+            user_email, user_phone
+        )
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
         # Create a certification dictionary with safe null handling
         cert_data = {
             'id': certification['id'],
@@ -241,6 +271,7 @@ def get_certification(user_id, role):
             'vendor_certification': certification['vendor_certification'] or '',
             'cleanliness_rating': int(certification['cleanliness_rating']) if certification['cleanliness_rating'] is not None else 0,
             'photos': certification['photos'] or '[]',
+            'photo_urls': photo_refs(certification['photos']),
             'sanitation_practices': bool(certification['sanitation_practices']),
             'waste_management': bool(certification['waste_management']),
             'is_vegetarian': bool(certification['is_vegetarian']),
@@ -248,321 +279,13 @@ def get_certification(user_id, role):
             'cruelty_free': bool(certification['cruelty_free']),
             'sustainability': certification['sustainability'] or '',
             'status': certification['status'] or 'pending',
-            'created_at': certification['created_at'].isoformat() if certification['created_at'] else None,
-            'updated_at': certification['updated_at'].isoformat() if certification['updated_at'] else None
+            'created_at': certification['created_at'],
+            'updated_at': certification['updated_at']
         }
         
-        # Print the owner details for debugging
-        print(f"Owner details: {cert_data['owner_name']}, {cert_data['owner_mobile']}, {cert_data['owner_email']}")
-        
-        return jsonify({
+        return with_etag(jsonify({
             'certification': cert_data
-        }), 200
+        }), etag), 200
         
     except Exception as e:
         return jsonify({'message': f'Error: {str(e)}'}), 500 
-
-@business_bp.route('/dashboard', methods=['GET'])
-@token_required(roles=['business'])
-def get_dashboard_data(user_id, role):
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get comprehensive business certification data
-        cursor.execute("""
-            SELECT 
-                bc.id, 
-                bc.business_name,
-                bc.status AS certification_status,
-                bc.cleanliness_rating,
-                bc.is_vegetarian,
-                bc.is_vegan,
-                bc.cruelty_free,
-                bc.created_at,
-                bc.updated_at,
-                -- Check completion of each section by checking if essential fields are filled
-                CASE WHEN bc.business_name IS NOT NULL AND 
-                          bc.registration_number IS NOT NULL 
-                     THEN 1 ELSE 0 END AS business_details_complete,
-                CASE WHEN bc.owner_name IS NOT NULL AND 
-                          bc.owner_mobile IS NOT NULL AND 
-                          bc.owner_email IS NOT NULL 
-                     THEN 1 ELSE 0 END AS owner_details_complete,
-                CASE WHEN bc.vendor_count > 0 OR 
-                          bc.vendor_certification IS NOT NULL 
-                     THEN 1 ELSE 0 END AS vendor_compliance_complete,
-                CASE WHEN bc.cleanliness_rating > 0 OR
-                          bc.sanitation_practices = TRUE OR
-                          bc.waste_management = TRUE 
-                     THEN 1 ELSE 0 END AS cleanliness_complete,
-                CASE WHEN bc.cruelty_free = TRUE 
-                     THEN 1 ELSE 0 END AS cruelty_free_complete,
-                CAST(IFNULL((SELECT COUNT(*) FROM feedback f 
-                 JOIN products p ON f.product_id = p.id 
-                 WHERE p.business_id = bc.user_id), 0) AS UNSIGNED) AS total_feedback,
-                CAST(IFNULL((SELECT AVG(f.rating) FROM feedback f 
-                 JOIN products p ON f.product_id = p.id 
-                 WHERE p.business_id = bc.user_id), 0) AS DECIMAL(10,2)) AS average_rating
-            FROM business_certification bc
-            WHERE bc.user_id = %s
-        """, (user_id))
-        
-        columns = [col[0] for col in cursor.description]
-        result = cursor.fetchone()
-        
-        business_data = None
-        if result:
-            business_data = dict(zip(columns, result))
-        else:
-            # No data found at all, return default
-            return jsonify({
-                'stats': {
-                    'total_scans': 0,
-                    'total_feedback': 0,
-                    'average_rating': 0,
-                    'certification_status': 'not_submitted',
-                    'cleanliness_rating': 0,
-                    'business_name': 'Your Business'
-                },
-                'progress': {
-                    'business_details': False,
-                    'owner_details': False,
-                    'vendor_compliance': False,
-                    'cleanliness': False,
-                    'cruelty_free': False
-                },
-                'completion_percentage': 0,
-                'recent_activity': [],
-                'certification_complete': False
-            }), 200
-            
-        # Progress data from the certification fields - convert to boolean for frontend consistency
-        progress = {
-            'business_details': bool(business_data.get('business_details_complete')),
-            'owner_details': bool(business_data.get('owner_details_complete')),
-            'vendor_compliance': bool(business_data.get('vendor_compliance_complete')),
-            'cleanliness': bool(business_data.get('cleanliness_complete')),
-            'cruelty_free': bool(business_data.get('cruelty_free_complete'))
-        }
-        
-        # Debug output
-        print(f"Progress data: {progress}")
-        print(f"Business data keys: {business_data.keys()}")
-        print(f"Business details complete: {business_data.get('business_details_complete')}")
-        print(f"Owner details complete: {business_data.get('owner_details_complete')}")
-        
-        # Calculate completion percentage
-        completed_steps = sum(1 for step in progress.values() if step)
-        completion_percentage = int((completed_steps / 5) * 100)
-        
-        # Get recent products for this business
-        cursor.execute("""
-            SELECT 
-                p.id, 
-                p.product_name,
-                p.created_at,
-                p.certification_status
-            FROM products p
-            WHERE p.business_id = %s
-            ORDER BY p.created_at DESC
-            LIMIT 5
-        """, (user_id,))
-        
-        columns = [col[0] for col in cursor.description]
-        products_results = cursor.fetchall()
-        
-        recent_products = []
-        if products_results:
-            for res in products_results:
-                recent_products.append(dict(zip(columns, res)))
-        
-        # Get recent feedback
-        cursor.execute("""
-            SELECT 
-                f.id, 
-                f.rating,
-                f.feedback_text as comment,
-                f.created_at,
-                u.full_name as consumer_name,
-                p.product_name
-            FROM feedback f
-            JOIN users u ON f.consumer_id = u.id
-            JOIN products p ON f.product_id = p.id
-            WHERE p.business_id = %s
-            ORDER BY f.created_at DESC
-            LIMIT 5
-        """, (user_id,))
-        
-        columns = [col[0] for col in cursor.description]
-        recent_feedback_results = cursor.fetchall()
-        
-        recent_feedback = []
-        if recent_feedback_results:
-            for res in recent_feedback_results:
-                recent_feedback.append(dict(zip(columns, res)))
-        
-        # Combine recent activity
-        recent_activity = []
-        
-        # Add product activity
-        for product in recent_products:
-            recent_activity.append({
-                'id': str(product['id']),
-                'type': 'product',
-                'product_name': product['product_name'],
-                'certification_status': product['certification_status'],
-                'timestamp': product['created_at'].isoformat() if product['created_at'] else None
-            })
-            
-        # Add feedback activity
-        for feedback in recent_feedback:
-            recent_activity.append({
-                'id': str(feedback['id']),
-                'type': 'feedback',
-                'rating': feedback['rating'],
-                'comment': feedback['comment'],
-                'product_name': feedback['product_name'],
-                'consumer_name': feedback['consumer_name'],
-                'timestamp': feedback['created_at'].isoformat() if feedback['created_at'] else None
-            })
-            
-        # Sort by timestamp descending
-        recent_activity.sort(key=lambda x: x['timestamp'] if x['timestamp'] else '', reverse=True)
-        
-        # Convert numeric values explicitly to avoid type issues
-        try:
-            total_feedback = int(business_data.get('total_feedback', 0))
-        except (ValueError, TypeError):
-            total_feedback = 0
-            
-        try:
-            average_rating = float(business_data.get('average_rating', 0))
-        except (ValueError, TypeError):
-            average_rating = 0.0
-            
-        try:
-            cleanliness_rating = float(business_data.get('cleanliness_rating', 0) or 0)
-        except (ValueError, TypeError):
-            cleanliness_rating = 0.0
-            
-        # Debug information
-        print(f"Average rating (raw): {business_data.get('average_rating')}")
-        print(f"Average rating (converted): {average_rating}")
-            
-        response_data = {
-            'stats': {
-                'total_scans': len(recent_products),
-                'total_feedback': total_feedback,
-                'average_rating': average_rating,
-                'certification_status': business_data.get('certification_status', 'not_submitted'),
-                'cleanliness_rating': cleanliness_rating,
-                'business_name': business_data.get('business_name', 'Your Business')
-            },
-            'progress': progress,
-            'completion_percentage': completion_percentage,
-            'recent_activity': recent_activity[:5],  # Limit to 5 most recent activities
-            'certification_complete': business_data.get('certification_status') == 'approved'
-        }
-        
-        return jsonify(response_data), 200
-        
-    except Exception as e:
-        print(f"Dashboard error: {str(e)}")
-        return jsonify({'message': f'Error: {str(e)}'}), 500
-
-@business_bp.route('/feedback', methods=['GET'])
-@token_required(roles=['business'])
-def get_business_feedback(user_id, role):
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        print(f"Getting feedback for business ID: {user_id}")
-        
-        # Get all feedback for this business
-        cursor.execute("""
-            SELECT 
-                f.id, 
-                f.rating,
-                f.feedback_text,
-                f.created_at,
-                u.full_name as consumer_name,
-                p.product_name
-            FROM feedback f
-            JOIN users u ON f.consumer_id = u.id
-            JOIN products p ON f.product_id = p.id
-            WHERE p.business_id = %s
-            ORDER BY f.created_at DESC
-        """, (user_id,))
-        
-        columns = [col[0] for col in cursor.description]
-        feedback_results = cursor.fetchall()
-        
-        feedback_list = []
-        for result in feedback_results:
-            feedback_list.append(dict(zip(columns, result)))
-        
-        # Transform data for frontend
-        feedback_data = []
-        for feedback in feedback_list:
-            feedback_data.append({
-                'id': feedback['id'],
-                'rating': feedback['rating'],
-                'comment': feedback['feedback_text'],
-                'consumer_name': feedback['consumer_name'],
-                'product_name': feedback['product_name'],
-                'created_at': feedback['created_at'].isoformat() if feedback['created_at'] else None
-            })
-        
-        # Get summary stats
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_feedback,
-                COALESCE(AVG(f.rating), 0) as average_rating,
-                SUM(CASE WHEN f.rating = 5 THEN 1 ELSE 0 END) as five_star,
-                SUM(CASE WHEN f.rating = 4 THEN 1 ELSE 0 END) as four_star,
-                SUM(CASE WHEN f.rating = 3 THEN 1 ELSE 0 END) as three_star,
-                SUM(CASE WHEN f.rating = 2 THEN 1 ELSE 0 END) as two_star,
-                SUM(CASE WHEN f.rating = 1 THEN 1 ELSE 0 END) as one_star
-            FROM feedback f
-            JOIN products p ON f.product_id = p.id
-            WHERE p.business_id = %s
-        """, (user_id,))
-        
-        columns = [col[0] for col in cursor.description]
-        stats_result = cursor.fetchone()
-        
-        stats = None
-        if stats_result:
-            stats = dict(zip(columns, stats_result))
-        
-        # Create summary data
-        summary = {
-            'total_feedback': stats['total_feedback'] if stats and stats['total_feedback'] is not None else 0,
-            'average_rating': 0,  # Default value
-            'rating_distribution': {
-                '5': stats['five_star'] if stats and stats['five_star'] is not None else 0,
-                '4': stats['four_star'] if stats and stats['four_star'] is not None else 0,
-                '3': stats['three_star'] if stats and stats['three_star'] is not None else 0,
-                '2': stats['two_star'] if stats and stats['two_star'] is not None else 0,
-                '1': stats['one_star'] if stats and stats['one_star'] is not None else 0
-            }
-        }
-        
-        # Safely convert average_rating to float
-        if stats and stats['average_rating'] is not None:
-            try:
-                summary['average_rating'] = float(stats['average_rating'])
-            except (ValueError, TypeError):
-                print(f"Warning: Could not convert average_rating value to float: {stats['average_rating']}")
-                summary['average_rating'] = 0
-        
-        return jsonify({
-            'feedback': feedback_data,
-            'summary': summary
-        }), 200
-        
-    except Exception as e:
-        print(f"Feedback error: {str(e)}")
-        return jsonify({'message': f'Error: {str(e)}'}), 500
\ No newline at end of file
@@ -1,93 +1,168 @@
 import os
-import json
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from .database import get_db_connection
 from .auth_middleware import token_required
+from .ratings import get_rating, get_ratings
+from .dashboard import get_snapshot
+from .analytics import get_rating_table, rating_trend
+from .scan_rollups import GRANULARITIES, MAX_SERIES_DAYS, scan_series
+from .pagination import InvalidCursor, page_params, keyset_clause, keyset_params, paginate
+from .photo_store import photo_refs
+from .export import CONTENT_TYPES, DATASETS, ExportBusy, ExportStream, InvalidExport, parse_range
 
+# /api/business serves the original response shapes; /api/v2/business lets
+# clients pick sections with ?fields= so a poll only pays for what it renders
 business_dashboard_bp = Blueprint('business_dashboard', __name__)
+business_v2_bp = Blueprint('business_v2', __name__)
+
+DASHBOARD_FIELDS = ('stats', 'progress', 'completion_percentage', 'recent_activity',
+                    'certification_complete', 'certification')
+LEGACY_DASHBOARD_FIELDS = DASHBOARD_FIELDS[:-1]
+
+FEEDBACK_FIELDS = ('summary', 'feedback', 'products')
+DEFAULT_FEEDBACK_FIELDS = ('summary', 'feedback')
+
+
+class InvalidFields(ValueError):
+    """Raised when ?fields= names a section the endpoint does not have."""
+
+
+def _parse_fields(available, default):
+    """
+    Read the comma-separated `fields` query parameter.
+    Returns the requested sections in `available` order, or `default` when absent.
+    """
+    raw = request.args.get('fields')
+    if not raw:
+        return tuple(default)
+    requested = {field.strip() for field in raw.split(',') if field.strip()}
+    unknown = requested.difference(available)
+    if unknown:
+        raise InvalidFields(
+            f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(available)}"
+        )
+    return tuple(field for field in available if field in requested)
+
+
+def _feedback_page(cursor, user_id, limit, after):
+    """One page of feedback across a business's products, newest first."""
+    keyset = f"AND {keyset_clause('f.created_at', 'f.id')}" if after else ''
+    cursor.execute(f"""
+        SELECT 
+            f.id,
+            f.product_id,
+            f.rating,
+            f.feedback_text,
+            f.upvotes,
+            f.photos,
+            f.created_at,
+            u.full_name AS consumer_name,
+            p.product_name
+        FROM feedback f
+        JOIN products p ON f.product_id = p.id
+        LEFT JOIN users u ON f.consumer_id = u.id
+        WHERE p.business_id = %s {keyset}
+        ORDER BY f.created_at DESC, f.id DESC
+        LIMIT %s
+    """, (user_id, *(keyset_params(after) if after else ()), limit + 1))
+
+    rows, next_cursor = paginate(
+        cursor.fetchall(), limit, lambda row: (row['created_at'], row['id'])
+    )
+
+    feedback_data = []
+    for item in rows:
+        feedback_data.append({
+            'id': item['id'],
+            'product_id': item['product_id'],
+            'rating': item['rating'],
+            'comment': item['feedback_text'],
+            'upvotes': item['upvotes'],
+            'photos': photo_refs(item['photos']),
+            'consumer_name': item['consumer_name'],
+            'product_name': item['product_name'],
+            'created_at': item['created_at']
+        })
+    return feedback_data, next_cursor
+
+
+def _feedback_summary(cursor, user_id):
+    rating = get_rating(cursor, 'business', user_id)
+    return {
+        'total_feedback': rating['count'],
+        'average_rating': rating['average_rating'],
+        'rating_distribution': rating['distribution']
+    }
+
+
+def _product_ratings(cursor, user_id):
+    """Every product of the business with its rating aggregate, best rated first."""
+    cursor.execute("""
+        SELECT p.id AS product_id, p.product_name
+        FROM products p
+        WHERE p.business_id = %s
+    """, (user_id,))
+    products = cursor.fetchall()
+
+    ratings = get_ratings(cursor, 'product', [product['product_id'] for product in products])
+    product_list = []
+    for product in products:
+        rating = ratings[product['product_id']]
+        product_list.append({
+            'product_id': product['product_id'],
+            'product_name': product['product_name'],
+            'average_rating': rating['average_rating'],
+            'feedback_count': rating['count'],
+            'rating_distribution': rating['distribution']
+        })
+
+    product_list.sort(key=lambda x: x['average_rating'], reverse=True)
+    return product_list
+
 
 @business_dashboard_bp.route('/dashboard', methods=['GET'])
 @token_required(roles=['business'])
 def get_dashboard_data(user_id, role):
-    """
-    Get business certification dashboard data for the authenticated business user.
-    Shows certification status, progress, and completion details.
-    """
+    """Certification progress, stats and recent activity in the original shape."""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Get business certification data
-        cursor.execute("""
-            SELECT 
-                bc.business_name,
-                bc.status AS application_status,
-                bc.business_details IS NOT NULL AS has_business_details,
-                bc.owner_name IS NOT NULL AS has_owner_details,
-                bc.vendor_compliance IS NOT NULL AS has_vendor_compliance,
-                bc.cleanliness_rating IS NOT NULL AS has_cleanliness_hygiene,
-                bc.cruelty_free IS NOT NULL AS has_cruelty_free,
-                bc.sustainability IS NOT NULL AS has_sustainability,
-                bc.audit_required,
-                CASE 
-                    WHEN bc.photos IS NULL THEN 0
-                    WHEN JSON_LENGTH(bc.photos) IS NULL THEN 0
-                    ELSE JSON_LENGTH(bc.photos)
-                END AS document_count,
-                bc.updated_at
-            FROM business_certification bc
-            WHERE bc.user_id = %s
-        """, (user_id,))
+        # Served from the per-business snapshot cache, built in one round trip
+        snapshot = get_snapshot(cursor, user_id)
 
-        cert_data = cursor.fetchone()
+        return jsonify({field: snapshot[field] for field in LEGACY_DASHBOARD_FIELDS}), 200
 
-        if not cert_data:
-            # No certification data found
-            return jsonify({
-                'message': 'No certification data found',
-                'data': None
-            }), 404
+    except Exception as e:
+        return jsonify({'message': f'Error: {str(e)}'}), 500
+    finally:
+        if 'cursor' in locals() and cursor:
+            cursor.close()
+        if 'conn' in locals() and conn:
+            conn.close()
 
-        # Calculate completion percentage based on completed sections
-        completed_fields = 0
-        total_fields = 6  # Total number of required sections
-
-        if cert_data['has_business_details']:
-            completed_fields += 1
-        if cert_data['has_owner_details']:
-            completed_fields += 1
-        if cert_data['has_vendor_compliance']:
-            completed_fields += 1
-        if cert_data['has_cleanliness_hygiene']:
-            completed_fields += 1
-        if cert_data['has_cruelty_free']:
-            completed_fields += 1
-        if cert_data['has_sustainability']:
-            completed_fields += 1
-
-        completion_percentage = int((completed_fields / total_fields) * 100)
-
-        # Prepare response data
-        dashboard_data = {
-            'business_name': cert_data['business_name'],
-            'application_status': cert_data['application_status'],
-            'completion_percentage': completion_percentage,
-            'sections': {
-                'business_details': bool(cert_data['has_business_details']),
-                'owner_details': bool(cert_data['has_owner_details']),
-                'vendor_compliance': bool(cert_data['has_vendor_compliance']),
-                'cleanliness_hygiene': bool(cert_data['has_cleanliness_hygiene']),
-                'cruelty_free': bool(cert_data['has_cruelty_free']),
-                'sustainability': bool(cert_data['has_sustainability'])
-            },
-            'document_uploads': cert_data['document_count'],
-            'audit_required': bool(cert_data['audit_required']),
-            'last_updated': cert_data['updated_at'].isoformat() if cert_data['updated_at'] else None
-        }
+
+@business_v2_bp.route('/dashboard', methods=['GET'])
+@token_required(roles=['business'])
+def get_dashboard_sections(user_id, role):
+    """
+    Dashboard sections selected with ?fields=stats,progress,...
+    All sections are returned when fields is omitted.
+    """
+    try:
+        fields = _parse_fields(DASHBOARD_FIELDS, DASHBOARD_FIELDS)
+    except InvalidFields as e:
+        return jsonify({'message': str(e)}), 400
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        snapshot = get_snapshot(cursor, user_id)
 
         return jsonify({
             'message': 'Dashboard data retrieved successfully',
-            'data': dashboard_data
+            'data': {field: snapshot[field] for field in fields}
         }), 200
 
     except Exception as e:
@@ -102,88 +177,143 @@ def get_dashboard_data(user_id, role):
 @business_dashboard_bp.route('/feedback', methods=['GET'])
 @token_required(roles=['business'])
 def get_business_feedback(user_id, role):
+    """One page of feedback on the business's products plus the rating summary."""
+    try:
+        limit, after = page_params(request.args)
+    except InvalidCursor as e:
+        return jsonify({'message': str(e)}), 400
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        feedback_data, next_cursor = _feedback_page(cursor, user_id, limit, after)
+
+        return jsonify({
+            'feedback': [
+                {key: item[key] for key in ('id', 'rating', 'comment', 'consumer_name', 'product_name', 'created_at')}
+                for item in feedback_data
+            ],
+            'summary': _feedback_summary(cursor, user_id),
+            'next_cursor': next_cursor
+        }), 200
+
+    except Exception as e:
+        return jsonify({'message': f'Error: {str(e)}'}), 500
+    finally:
+        if 'cursor' in locals() and cursor:
+            cursor.close()
+        if 'conn' in locals() and conn:
+            conn.close()
+
+
+@business_v2_bp.route('/feedback', methods=['GET'])
+@token_required(roles=['business'])
+def get_feedback_sections(user_id, role):
     """
-    Get all feedback related to the business's products.
-    Joins product and feedback tables to get relevant data.
+    Feedback sections selected with ?fields=summary,feedback,products.
+    Only the queries behind the requested sections are run; the feedback
+    section is paged with limit/cursor.
     """
+    try:
+        fields = _parse_fields(FEEDBACK_FIELDS, DEFAULT_FEEDBACK_FIELDS)
+        limit, after = page_params(request.args)
+    except (InvalidFields, InvalidCursor) as e:
+        return jsonify({'message': str(e)}), 400
+
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Get business products and their feedback
-        cursor.execute("""
-            SELECT 
-                p.id AS product_id,
-                p.product_name,
-                f.id AS feedback_id,
-                f.feedback_text,
-                f.rating,
-                f.upvotes,
-                f.created_at,
-                f.photos,
-                u.full_name AS consumer_name
-            FROM products p
-            LEFT JOIN feedback f ON p.id = f.product_id
-            LEFT JOIN users u ON f.consumer_id = u.id
-            WHERE p.business_id = %s
-            ORDER BY f.created_at DESC
-        """, (user_id,))
-
-        feedback_data = cursor.fetchall()
-
-        # Process and organize feedback by product
-        products = {}
-        for item in feedback_data:
-            product_id = item['product_id']
-            
-            # Add product to dict if not exists
-            if product_id not in products:
-                products[product_id] = {
-                    'product_id': product_id,
-                    'product_name': item['product_name'],
-                    'feedback': [],
-                    'average_rating': 0,
-                    'feedback_count': 0
-                }
-            
-            # Add feedback if it exists
-            if item['feedback_id']:
-                feedback_item = {
-                    'id': item['feedback_id'],
-                    'text': item['feedback_text'],
-                    'rating': item['rating'],
-                    'upvotes': item['upvotes'],
-                    'created_at': item['created_at'].isoformat() if item['created_at'] else None,
-                    'consumer_name': item['consumer_name'],
-                    'photos': [] if not item['photos'] else json.loads(item['photos'])
-                }
-                products[product_id]['feedback'].append(feedback_item)
-                products[product_id]['feedback_count'] += 1
-        
-        # Calculate average ratings for each product
-        product_list = []
-        for product_id, product in products.items():
-            if product['feedback_count'] > 0:
-                total_rating = sum(feedback['rating'] for feedback in product['feedback'])
-                product['average_rating'] = round(total_rating / product['feedback_count'], 1)
-            product_list.append(product)
-        
-        # Sort products by average rating (highest first)
-        product_list.sort(key=lambda x: x['average_rating'], reverse=True)
-        
-        # Get overall business rating
-        overall_rating = 0
-        total_feedback = sum(p['feedback_count'] for p in product_list)
-        if total_feedback > 0:
-            sum_ratings = sum(p['average_rating'] * p['feedback_count'] for p in product_list)
-            overall_rating = round(sum_ratings / total_feedback, 1)
+        data = {}
+        if 'summary' in fields:
+            data['summary'] = _feedback_summary(cursor, user_id)
+        if 'feedback' in fields:
+            data['feedback'], data['next_cursor'] = _feedback_page(cursor, user_id, limit, after)
+        if 'products' in fields:
+            data['products'] = _product_ratings(cursor, user_id)
 
         return jsonify({
             'message': 'Feedback retrieved successfully',
+            'data': data
+        }), 200
+
+    except Exception as e:
+        return jsonify({'message': f'Error: {str(e)}'}), 500
+    finally:
+        if 'cursor' in locals() and cursor:
+            cursor.close()
+        if 'conn' in locals() and conn:
+            conn.close()
+
+
+@business_dashboard_bp.route('/scans', methods=['GET'])
+@token_required(roles=['business'])
+def get_scan_series(user_id, role):
+    """
+    Scan counts over time from the rollup tables.
+    Query parameters: days (default 30), granularity (day or hour) and an
+    optional product_id.
+    """
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({'message': f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
+
+    try:
+        days = int(request.args.get('days', 30))
+        product_id = request.args.get('product_id', type=int)
+    except ValueError:
+        return jsonify({'message': 'days must be an integer'}), 400
+    days = max(1, min(days, MAX_SERIES_DAYS[granularity]))
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        series = scan_series(cursor, user_id, days, granularity, product_id)
+
+        return jsonify({
+            'message': 'Scan analytics retrieved successfully',
+            'data': series
+        }), 200
+
+    except Exception as e:
+        return jsonify({'message': f'Error: {str(e)}'}), 500
+    finally:
+        if 'cursor' in locals() and cursor:
+            cursor.close()
+        if 'conn' in locals() and conn:
+            conn.close()
+
+
+@business_dashboard_bp.route('/ratings', methods=['GET'])
+@token_required(roles=['business'])
+def get_rating_analytics(user_id, role):
+    """
+    The business's smoothed rating, rank and percentile among all businesses,
+    plus daily ratings and scans with a trailing moving average.
+    Query parameters: days (default 90, max 366) and window (default 7).
+    """
+    try:
+        days = max(1, min(int(request.args.get('days', 90)), 366))
+        window = max(1, min(int(request.args.get('window', 7)), days))
+    except ValueError:
+        return jsonify({'message': 'days and window must be integers'}), 400
+
+    try:
+        table = get_rating_table('business')
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        trend = rating_trend(cursor, user_id, days, window)
+
+        return jsonify({
+            'message': 'Rating analytics retrieved successfully',
             'data': {
-                'overall_rating': overall_rating,
-                'total_feedback': total_feedback,
-                'products': product_list
+                'standing': table.lookup(user_id),
+                'businesses_ranked': int(table.rated.sum()),
+                'trend': trend
             }
         }), 200
 
@@ -250,7 +380,7 @@ def get_business_profile(user_id, role):
             'email': profile_data['email'],
             'phone': profile_data['phone'],
             'role': profile_data['role'],
-            'joined_date': profile_data['joined_date'].isoformat() if profile_data['joined_date'] else None,
+            'joined_date': profile_data['joined_date'],
             'business': {
                 'business_name': profile_data['business_name'],
                 'registration_number': profile_data['registration_number'],
@@ -265,7 +395,7 @@ def get_business_profile(user_id, role):
                 'cruelty_free': bool(profile_data['cruelty_free']),
                 'sustainability': profile_data['sustainability'],
                 'certification_status': profile_data['certification_status'],
-                'certification_date': profile_data['certification_date'].isoformat() if profile_data['certification_date'] else None
+                'certification_date': profile_data['certification_date']
             }
         }
 
@@ -280,4 +410,32 @@ def get_business_profile(user_id, role):
         if 'cursor' in locals() and cursor:
             cursor.close()
         if 'conn' in locals() and conn:
-            conn.close() 
\ No newline at end of file
+            conn.close()
+
+
+@business_dashboard_bp.route('/export/<dataset>', methods=['GET'])
+@token_required(roles=['business'])
+def export_dataset(user_id, role, dataset):
+    """
+    Stream every feedback or verification row on the business's products as
+    CSV or NDJSON (?format=, default ndjson), optionally limited with ?since=
+    and ?until= ISO dates. Rows are read through an unbuffered cursor and
+    sent in chunks, so memory stays flat however long the history is.
+    """
+    if dataset not in DATASETS:
+        return jsonify({'message': f"dataset must be one of: {', '.join(DATASETS)}"}), 404
+
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        since, until = parse_range(request.args.get('since'), request.args.get('until'))
+        stream = ExportStream(dataset, fmt, user_id, since, until)
+    except InvalidExport as e:
+        return jsonify({'message': str(e)}), 400
+    except ExportBusy:
+        response = jsonify({'message': 'Too many exports in progress, please try again shortly'})
+        response.headers['Retry-After'] = '10'
+        return response, 503
+
+    response = Response(stream, mimetype=CONTENT_TYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
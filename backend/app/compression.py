@@ -0,0 +1,87 @@
+import os
+import gzip
+import threading
+from flask import request
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 5))
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/csv', 'text/html')
+
+# Preferred first; brotli is only offered when the package is installed
+ENCODINGS = (('br',) if brotli is not None else ()) + ('gzip',)
+
+_stats = {'responses': 0, 'bytes_in': 0, 'bytes_out': 0}
+_stats_lock = threading.Lock()
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def negotiate(accept_encoding):
+    """Best encoding an Accept-Encoding header allows, or None."""
+    return parse_accept_header(accept_encoding).best_match(ENCODINGS)
+
+
+def compress_body(data, encoding):
+    """Compressed body if it is worth sending, otherwise None."""
+    if len(data) < COMPRESS_MIN_SIZE:
+        return None
+    compressed = compress(data, encoding)
+    if len(compressed) >= len(data):
+        return None
+    with _stats_lock:
+        _stats['responses'] += 1
+        _stats['bytes_in'] += len(data)
+        _stats['bytes_out'] += len(compressed)
+    return compressed
+
+
+def compression_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _compress_response(response):
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    # The body differs by Accept-Encoding from here on, compressed or not
+    response.vary.add('Accept-Encoding')
+
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or request.method == 'HEAD'):
+        return response
+
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    compressed = compress_body(data, encoding)
+    if compressed is None:
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # A strong ETag names one exact byte sequence, so each encoding gets its own
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
+
+
+def init_app(app):
+    """Compress JSON and text responses for clients that accept gzip or brotli."""
+    if os.getenv('COMPRESS_ENABLED', '1') != '0':
+        app.after_request(_compress_response)
@@ -1,117 +1,137 @@
+import os
+import logging
 from flask import Blueprint, request, jsonify, g
 from marshmallow import Schema, fields, ValidationError
 from .database import get_db_connection as get_db
 from .auth_middleware import token_required
+from .product_cache import find_product
+from .ratings import normalize_rating, record_rating
+from .analytics import get_rating_table
+from .pagination import InvalidCursor, page_params, keyset_clause, keyset_params, paginate
+from .cache import TTLCache
+from .etags import make_etag
+from .search import SEARCH_MAX_LIMIT, SEARCH_TARGETS, find_matches, parse_query, suggest
+from .steps import Blocking, Query, RecordVerification, Reply, not_modified_reply, run
+from . import schema
+
+logger = logging.getLogger(__name__)
 
 # Create a Blueprint for consumer routes
 consumer_bp = Blueprint('consumer', __name__)
 
+# Directory total, shared by every page request until it expires
+directory_cache = TTLCache(maxsize=1, ttl=float(os.getenv('BUSINESS_COUNT_TTL', 60)))
+
 # ---------------------- Consumer API Routes ---------------------- #
 
+def _compile_user_feedback_query(with_cursor):
+    """
+    Build the consumer feedback query for the feedback table's actual columns.
+    Returns the SQL and how many times the consumer id must be bound.
+    """
+    columns = schema.columns('feedback')
+    
+    # Construct query based on available columns
+    select_clause = ["f.id", "f.rating"]
+    join_clause = []
+    where_clause = []
+    
+    # Handle comment/feedback_text field
+    if 'feedback_text' in columns and 'comment' in columns:
+        select_clause.append("COALESCE(f.comment, f.feedback_text, '') as comment")
+    elif 'feedback_text' in columns:
+        select_clause.append("COALESCE(f.feedback_text, '') as comment")
+    elif 'comment' in columns:
+        select_clause.append("COALESCE(f.comment, '') as comment")
+    else:
+        select_clause.append("'' as comment")
+    
+    # Add created_at
+    select_clause.append("f.created_at")
+    
+    # Handle business name via joins
+    if 'business_id' in columns:
+        select_clause.append("COALESCE(b.business_name, 'Unknown Business') as business_name")
+        join_clause.append("LEFT JOIN businesses b ON f.business_id = b.id")
+    else:
+        select_clause.append("'Unknown Business' as business_name")
+    
+    # Build WHERE clause based on available ID columns
+    if 'consumer_id' in columns:
+        where_clause.append("f.consumer_id = %s")
+    if 'user_id' in columns:
+        where_clause.append("f.user_id = %s")
+    
+    # If no valid ID columns found, use a placeholder that will return no results
+    where_sql = f"({' OR '.join(where_clause) or '1=0'})"
+    
+    # Continue after the cursor, newest first
+    if with_cursor:
+        where_sql += f" AND {keyset_clause('f.created_at', 'f.id')}"
+    
+    query = f"""
+    SELECT 
+        {', '.join(select_clause)}
+    FROM 
+        feedback f
+        {' '.join(join_clause)}
+    WHERE 
+        {where_sql}
+    ORDER BY 
+        f.created_at DESC, f.id DESC
+    LIMIT %s
+    """
+    return query, len(where_clause)
+
 @consumer_bp.route('/feedback', methods=['GET'])
 @token_required(roles=['consumer'])
 def get_user_feedback(user_id, role):
-    """Get all feedback submitted by a specific consumer"""
+    """Get feedback submitted by a specific consumer, one page at a time"""
+    try:
+        limit, after = page_params(request.args)
+    except InvalidCursor as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
     try:
-        print(f"Fetching feedback for user ID: {user_id}, role: {role}")
         db = get_db()
         query_user_id = request.args.get('user_id')
         
         # If no user_id provided in the query, use the authenticated user's ID
         if not query_user_id:
             query_user_id = user_id
-            
-        print(f"Using user_id: {query_user_id} for feedback query")
         
         # Initialize empty feedback list
         feedback_items = []
+        next_cursor = None
         
-        # First, check if the feedback table exists and what columns it has
         cursor = db.cursor()
         
         try:
-            # Get table structure
-            cursor.execute("DESCRIBE feedback")
-            columns = {row['Field']: row for row in cursor.fetchall()}
-            print(f"Feedback table columns: {list(columns.keys())}")
-            
-            # Build a query based on the actual table structure
-            has_consumer_id = 'consumer_id' in columns
-            has_business_id = 'business_id' in columns
-            has_user_id = 'user_id' in columns
-            has_feedback_text = 'feedback_text' in columns
-            has_comment = 'comment' in columns
+            # Query compiled once from the cached feedback column map
+            query, id_params = schema.compiled(
+                ('user_feedback', bool(after)),
+                lambda: _compile_user_feedback_query(bool(after))
+            )
             
-            # Construct dynamic query based on available columns
-            select_clause = ["f.id", "f.rating"]
-            join_clause = []
-            where_clause = []
-            
-            # Handle comment/feedback_text field
-            if has_feedback_text and has_comment:
-                select_clause.append("COALESCE(f.comment, f.feedback_text, '') as comment")
-            elif has_feedback_text:
-                select_clause.append("COALESCE(f.feedback_text, '') as comment")
-            elif has_comment:
-                select_clause.append("COALESCE(f.comment, '') as comment")
-            else:
-                select_clause.append("'' as comment")
-            
-            # Add created_at
-            select_clause.append("f.created_at")
-            
-            # Handle business name via joins
-            if has_business_id:
-                select_clause.append("COALESCE(b.business_name, 'Unknown Business') as business_name")
-                join_clause.append("LEFT JOIN businesses b ON f.business_id = b.id")
-            else:
-                select_clause.append("'Unknown Business' as business_name")
-            
-            # Build WHERE clause based on available ID columns
-            if has_consumer_id:
-                where_clause.append("f.consumer_id = %s")
-            if has_user_id:
-                where_clause.append("OR f.user_id = %s")
-            
-            # If no valid ID columns found, use a placeholder that will return no results
-            if not where_clause:
-                where_clause.append("1=0")
-            
-            # Build the final query
-            query = f"""
-            SELECT 
-                {', '.join(select_clause)}
-            FROM 
-                feedback f
-                {' '.join(join_clause)}
-            WHERE 
-                {' '.join(where_clause)}
-            ORDER BY 
-                f.created_at DESC
-            """
-            
-            print(f"Dynamic query built: {query}")
-            
-            # Prepare parameters based on where clause
-            params = []
-            if has_consumer_id:
-                params.append(query_user_id)
-            if has_user_id:
-                params.append(query_user_id)
+            params = [query_user_id] * id_params
+            if after:
+                params.extend(keyset_params(after))
+            params.append(limit + 1)
                 
-            cursor.execute(query, tuple(params) if params else None)
-            feedback_items = cursor.fetchall()
-            print(f"Query executed, found {len(feedback_items)} feedback items")
-            
-            # Format dates to string for JSON serialization
-            for item in feedback_items:
-                if 'created_at' in item and item['created_at']:
-                    item['created_at'] = item['created_at'].strftime('%Y-%m-%d %H:%M:%S')
+            cursor.execute(query, tuple(params))
+            feedback_items, next_cursor = paginate(
+                cursor.fetchall(), limit, lambda row: (row['created_at'], row['id'])
+            )
+            logger.debug('Fetched consumer feedback', extra={'user_id': query_user_id, 'count': len(feedback_items)})
         
-        except Exception as query_error:
-            print(f"Detailed feedback query error: {query_error}")
+        except Exception:
+            logger.exception('Consumer feedback query failed')
             # Return empty results rather than error
             feedback_items = []
+            next_cursor = None
         
         finally:
             if cursor:
@@ -121,11 +141,12 @@ def get_user_feedback(user_id, role):
         return jsonify({
             'success': True,
             'feedback': feedback_items,
-            'has_feedback': len(feedback_items) > 0
+            'has_feedback': len(feedback_items) > 0,
+            'next_cursor': next_cursor
         }), 200
         
-    except Exception as e:
-        print(f"Critical error in get_user_feedback: {e}")
+    except Exception:
+        logger.exception('Failed to fetch consumer feedback')
         # Return a user-friendly error that still allows frontend to show the no-feedback message
         return jsonify({
             'success': True,  # Set as true to not trigger error UI
@@ -155,8 +176,9 @@ def submit_feedback(user_id, role):
         rating = data.get('rating')
         comment = data.get('comment', '')
         
-        # Validate rating is between 1 and 5
-        if not isinstance(rating, (int, float)) or rating < 1 or rating > 5:
+        # Validate rating is between 1 and 5; the whole-star value is what gets stored
+        rating = normalize_rating(rating) if isinstance(rating, (int, float)) else None
+        if rating is None:
             return jsonify({
                 'success': False,
                 'message': 'Rating must be between 1 and 5'
@@ -181,10 +203,13 @@ def submit_feedback(user_id, role):
         """
         
         cursor.execute(query, (user_id, business_id, rating, comment))
-        db.commit()
         
         # Get the inserted feedback ID
         feedback_id = cursor.lastrowid
+        
+        # Keep the listing's rating aggregate in step, in the same transaction
+        record_rating(cursor, [('listing', business_id)], rating)
+        db.commit()
         cursor.close()
         
         return jsonify({
@@ -205,8 +230,6 @@ def submit_feedback(user_id, role):
 def get_user_profile(user_id, role):
     """Get the profile information for the current user"""
     try:
-        print(f"Getting profile for user_id: {user_id}, role: {role}")
-        
         if not user_id:
             return jsonify({
                 'success': False,
@@ -217,7 +240,6 @@ def get_user_profile(user_id, role):
         try:
             user_id = int(user_id)
         except (ValueError, TypeError):
-            print(f"Invalid user ID format: {user_id}")
             return jsonify({
                 'success': False,
                 'message': 'Invalid user ID format'
@@ -242,21 +264,16 @@ def get_user_profile(user_id, role):
             WHERE id = %s AND role = %s
             """
             
-            print(f"User profile query for ID: {user_id}, role: {role}")
             cursor.execute(query, (user_id, role))
             user = cursor.fetchone()
             
             if not user:
-                print(f"User with ID {user_id} and role {role} not found")
+                logger.info('Profile not found', extra={'user_id': user_id, 'role': role})
                 return jsonify({
                     'success': False,
                     'message': 'User not found or access denied'
                 }), 404
-                
-            # Format date fields for JSON serialization
-            if 'created_at' in user and user['created_at']:
-                user['created_at'] = user['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-            
+
             # Set the name field
             user['name'] = user.get('full_name', 'User')
             
@@ -264,15 +281,13 @@ def get_user_profile(user_id, role):
             user['is_verified'] = bool(int(user.get('is_verified', 0)))
             user['id'] = int(user['id'])
             
-            print(f"Successfully fetched user profile: {user['id']} - {user['name']}")
-            
             return jsonify({
                 'success': True,
                 'user': user
             }), 200
             
         except Exception as query_err:
-            print(f"Query error in profile: {str(query_err)}")
+            logger.exception('Profile query failed')
             # Return proper error status for database issues
             return jsonify({
                 'success': False,
@@ -285,140 +300,291 @@ def get_user_profile(user_id, role):
                 cursor.close()
 
     except Exception as e:
-        print(f"Critical profile error: {str(e)}")
+        logger.exception('Failed to fetch profile')
         return jsonify({
             'success': False,
             'message': 'An error occurred while fetching your profile.',
             'error_details': str(e)
         }), 500  # Return proper error code
 
-@consumer_bp.route('/verify-product', methods=['POST'])
-@token_required(roles=['consumer'])
-def verify_product(user_id, role):
-    """Verify a product by its barcode or product code"""
+def scan_result(row):
+    """The product fields a consumer scan returns, from a cached product row."""
+    return {
+        'id': row['id'],
+        'product_name': row['product_name'],
+        'product_code': row['product_code'],
+        'category': row['category'],
+        'description': row['description'],
+        'certification_status': row['certification_status'],
+        'certified_date': row['certified_date'],
+        'business_name': row['business_name'],
+        'business_id': row['listing_id']
+    }
+
+def product_scan(user_id, data):
+    """POST /verify-product, shared with the ASGI server."""
+    if not isinstance(data, dict) or not ('product_code' in data or 'barcode' in data):
+        return Reply({
+            'success': False,
+            'message': 'Product code or barcode is required'
+        }, 400)
+    
     try:
-        data = request.get_json()
-        
-        if not data or not ('product_code' in data or 'barcode' in data):
-            return jsonify({
-                'success': False,
-                'message': 'Product code or barcode is required'
-            }), 400
-            
-        product_code = data.get('product_code') or data.get('barcode')
-        db = get_db()
-        cursor = db.cursor()
-        
         # Find the product
-        query = """
-        SELECT p.id, p.product_name, p.product_code, p.category, p.description, 
-               p.certification_status, p.certification_date, b.business_name, b.id as business_id
-        FROM products p
-        JOIN businesses b ON p.business_id = b.id
-        WHERE p.product_code = %s
-        """
-        
-        cursor.execute(query, (product_code,))
-        product = cursor.fetchone()
+        row = yield from find_product(data.get('product_code') or data.get('barcode'))
         
-        if not product:
-            return jsonify({
+        if not row or row['listing_id'] is None:
+            return Reply({
                 'success': False,
                 'message': 'Product not found or not certified'
-            }), 404
+            }, 404)
             
-        # Record the verification
-        log_query = """
-        INSERT INTO product_verifications (product_id, user_id, verification_method)
-        VALUES (%s, %s, %s)
-        """
-        
+        product = scan_result(row)
+            
+        # Record the verification (written in the background)
         method = 'barcode_scan' if 'barcode' in data else 'manual_code'
-        cursor.execute(log_query, (product['id'], user_id, method))
-        db.commit()
-        
-        cursor.close()
+        yield RecordVerification(product['id'], user_id, method)
         
-        return jsonify({
+        return Reply({
             'success': True,
             'product': product
-        }), 200
+        })
         
     except Exception as e:
-        return jsonify({
+        return Reply({
             'success': False,
             'message': f'Failed to verify product: {str(e)}'
-        }), 500
+        }, 500)
+
+@consumer_bp.route('/verify-product', methods=['POST'])
+@token_required(roles=['consumer'])
+def verify_product(user_id, role):
+    """Verify a product by its barcode or product code"""
+    return run(product_scan(user_id, request.get_json(silent=True)))
+
+BUSINESS_COUNT_QUERY = "SELECT COUNT(*) AS count FROM businesses"
+
+def count_businesses():
+    """Number of listed businesses, recounted at most every BUSINESS_COUNT_TTL seconds."""
+    total = directory_cache.get('count')
+    if total is None:
+        row = yield Query(BUSINESS_COUNT_QUERY, fetch='one')
+        total = row['count'] if row else 0
+        directory_cache.set('count', total)
+    return total
+
+def directory_query(limit, after, offset):
+    """
+    One directory page in name order. Walks the (business_name, id) index
+    from the cursor; ratings come from the precomputed listing aggregates.
+    Returns the SQL and its parameters.
+    """
+    keyset = f"WHERE {keyset_clause('b.business_name', 'b.id', descending=False)}" if after else ''
+    return f"""
+    SELECT b.id, b.business_name, 
+           COALESCE(b.description, '') as description, 
+           COALESCE(b.certification_status, 'pending') as certification_status,
+           COALESCE(ra.rating_sum / NULLIF(ra.rating_count, 0), 0) as rating
+    FROM businesses b
+    LEFT JOIN rating_aggregates ra
+        ON ra.subject_type = 'listing' AND ra.subject_id = b.id
+    {keyset}
+    ORDER BY b.business_name, b.id
+    LIMIT %s OFFSET %s
+    """, (*(keyset_params(after) if after else ()), limit + 1, offset)
+
+def directory_page(rows, limit, after, page, total_count):
+    """Trim a directory query result to one page; returns (response body, ETag)."""
+    businesses, next_cursor = paginate(rows, limit, lambda row: (row['business_name'], row['id']))
+    
+    # Built from the page itself: ratings and listings change it, nothing else does
+    etag = make_etag(
+        'businesses', after, page, limit, total_count,
+        [tuple(row.values()) for row in businesses]
+    )
+    return {
+        'success': True,
+        'businesses': businesses,
+        'total': total_count,
+        'page': page,
+        'total_pages': max(1, (total_count + limit - 1) // limit),
+        'next_cursor': next_cursor
+    }, etag
+
+def directory_params(args):
+    """
+    limit, cursor values, page and offset of a directory request. `page`
+    without a cursor is kept for older clients; it falls back to OFFSET.
+    Raises InvalidCursor.
+    """
+    limit, after = page_params(args, default_limit=10)
+    try:
+        page = max(1, int(args.get('page', 1)))
+    except ValueError:
+        page = 1
+    offset = (page - 1) * limit if not after else 0
+    return limit, after, page, offset
+
+def business_directory(args, if_none_match):
+    """GET /businesses, shared with the ASGI server."""
+    try:
+        limit, after, page, offset = directory_params(args)
+    except InvalidCursor as e:
+        return Reply({
+            'success': False,
+            'message': str(e)
+        }, 400)
+    
+    try:
+        total_count = yield from count_businesses()
+        rows = yield Query(*directory_query(limit, after, offset))
+        body, etag = directory_page(rows, limit, after, page, total_count)
+        
+        cached = not_modified_reply(etag, if_none_match, 'public, no-cache')
+        if cached:
+            return cached
+        
+        return Reply(body, etag=etag, cache_control='public, no-cache')
+        
+    except Exception as db_error:
+        logger.exception('Business listing query failed')
+        # Fallback: return empty results instead of error
+        return Reply({
+            'success': True,
+            'businesses': [],
+            'total': 0,
+            'page': 1,
+            'total_pages': 1,
+            'next_cursor': None,
+            'error_details': str(db_error)
+        })
 
 @consumer_bp.route('/businesses', methods=['GET'])
 def get_businesses():
-    """Get all businesses (paginated)"""
+    """Get all businesses, one page at a time in name order"""
+    return run(business_directory(request.args, request.headers.get('If-None-Match')))
+
+class InvalidSearch(ValueError):
+    """Raised for a search request with an unknown type or no usable words."""
+
+def search_request(args):
+    """
+    Parse a search request. Returns the response body so far, the targets
+    to search, the parsed terms and the page size. Raises InvalidSearch.
+    """
+    query = args.get('q', '').strip()
+    search_type = args.get('type', 'all')
+    if search_type != 'all' and search_type not in SEARCH_TARGETS:
+        raise InvalidSearch(f"type must be one of: all, {', '.join(SEARCH_TARGETS)}")
+    
+    limit = max(1, min(args.get('limit', 10, type=int), SEARCH_MAX_LIMIT))
+    terms, corrected = parse_query(query)
+    if not terms:
+        raise InvalidSearch('Search query is too short')
+    
+    targets = [target for target in SEARCH_TARGETS if search_type in ('all', target)]
+    return {
+        'success': True,
+        'query': query,
+        'corrected_query': ' '.join(term for term, _ in terms) if corrected else None
+    }, targets, terms, limit
+
+def catalog_search(args):
+    """GET /search, shared with the ASGI server."""
     try:
-        db = get_db()
+        response, targets, terms, limit = search_request(args)
+    except InvalidSearch as e:
+        return Reply({
+            'success': False,
+            'message': str(e)
+        }, 400)
+    
+    try:
+        for target in targets:
+            response[target] = yield from find_matches(target, terms, limit)
         
-        # Pagination parameters
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 10))
-        offset = (page - 1) * limit
+        return Reply(response)
         
-        try:
-            # Get total count
-            count_cursor = db.cursor()
-            count_cursor.execute("SELECT COUNT(*) as count FROM businesses")
-            result = count_cursor.fetchone()
-            total_count = result['count'] if result else 0
-            count_cursor.close()
-            
-            # Get businesses with average rating
-            query = """
-            SELECT b.id, b.business_name, 
-                   COALESCE(b.description, '') as description, 
-                   COALESCE(b.certification_status, 'pending') as certification_status,
-                   COALESCE(AVG(f.rating), 0) as rating
-            FROM businesses b
-            LEFT JOIN feedback f ON b.id = f.business_id
-            GROUP BY b.id
-            ORDER BY b.business_name
-            LIMIT %s OFFSET %s
-            """
-            
-            cursor = db.cursor()
-            cursor.execute(query, (limit, offset))
-            businesses = cursor.fetchall()
-            cursor.close()
-            
-            # Ensure all businesses have the required fields
-            for business in businesses:
-                business['id'] = business.get('id', 0)
-                business['business_name'] = business.get('business_name', '')
-                business['description'] = business.get('description', '')
-                business['certification_status'] = business.get('certification_status', 'pending')
-                business['rating'] = float(business.get('rating', 0))
-            
-            return jsonify({
-                'success': True,
-                'businesses': businesses,
-                'total': total_count,
-                'page': page,
-                'total_pages': max(1, (total_count + limit - 1) // limit)
-            }), 200
-            
-        except Exception as db_error:
-            print(f"Database error: {db_error}")
-            # Fallback: return empty results instead of error
-            return jsonify({
-                'success': True,
-                'businesses': [],
-                'total': 0,
-                'page': 1,
-                'total_pages': 1,
-                'error_details': str(db_error)
-            }), 200
+    except Exception as e:
+        logger.exception('Search failed')
+        return Reply({
+            'success': False,
+            'message': f'Search failed: {str(e)}'
+        }, 500)
+
+@consumer_bp.route('/search', methods=['GET'])
+def search_catalog():
+    """
+    Ranked search over product and business names and descriptions.
+    type is products, businesses or all (default); the last word of q is
+    matched as a prefix and misspelt words are corrected where possible.
+    """
+    return run(catalog_search(request.args))
+
+def search_suggestions_reply(args):
+    """GET /search/suggest, shared with the ASGI server; needs no database."""
+    limit = max(1, min(args.get('limit', 5, type=int), 20))
+    return Reply({
+        'success': True,
+        'suggestions': suggest(args.get('q', ''), limit)
+    })
+
+@consumer_bp.route('/search/suggest', methods=['GET'])
+def search_suggestions():
+    """Autocomplete for a partly typed query, served from memory"""
+    return run(search_suggestions_reply(request.args))
+
+LEADERBOARD_TYPES = ('listing', 'product')
+
+# Display names of leaderboard entries, by subject type
+LEADER_NAME_QUERIES = {
+    'listing': "SELECT id, business_name AS name FROM businesses WHERE id IN ({placeholders})",
+    'product': "SELECT id, product_name AS name FROM products WHERE id IN ({placeholders})"
+}
+
+def leaderboard(args):
+    """GET /leaderboard, shared with the ASGI server."""
+    subject_type = args.get('type', 'listing')
+    if subject_type not in LEADERBOARD_TYPES:
+        return Reply({
+            'success': False,
+            'message': f"type must be one of: {', '.join(LEADERBOARD_TYPES)}"
+        }, 400)
+    
+    limit = max(1, min(args.get('limit', 10, type=int), 100))
+    min_ratings = max(0, args.get('min_ratings', 1, type=int))
+    
+    try:
+        # Loading the rating arrays is a blocking, cached query
+        table = yield Blocking(get_rating_table, subject_type)
+        leaders = table.top(limit, min_ratings)
+        
+        ids = [entry['subject_id'] for entry in leaders]
+        names = {}
+        if ids:
+            placeholders = ', '.join(['%s'] * len(ids))
+            rows = yield Query(LEADER_NAME_QUERIES[subject_type].format(placeholders=placeholders), ids)
+            names = {row['id']: row['name'] for row in rows}
+        
+        for entry in leaders:
+            entry['name'] = names.get(entry['subject_id'])
+        
+        return Reply({
+            'success': True,
+            'type': subject_type,
+            'leaders': leaders,
+            'summary': table.summary()
+        })
         
     except Exception as e:
-        print(f"Critical error in get_businesses: {e}")
-        return jsonify({
+        logger.exception('Failed to fetch leaderboard')
+        return Reply({
             'success': False,
-            'message': 'Failed to fetch businesses',
+            'message': 'Failed to fetch leaderboard',
             'error_details': str(e)
-        }), 500
+        }, 500)
+
+@consumer_bp.route('/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """Top rated businesses (type=listing) or products (type=product) by smoothed rating"""
+    return run(leaderboard(request.args))
@@ -0,0 +1,196 @@
+import os
+from datetime import datetime
+from .cache import TTLCache
+
+# Certification progress, rating aggregate, recent products, recent feedback
+# and the rolled-up scan total for one business, fetched as four result sets
+# in a single round trip
+SNAPSHOT_QUERY = """
+    SELECT
+        bc.id,
+        bc.business_name,
+        bc.status AS certification_status,
+        bc.cleanliness_rating,
+        -- Check completion of each section by checking if essential fields are filled
+        CASE WHEN bc.business_name IS NOT NULL AND
+                  bc.registration_number IS NOT NULL
+             THEN 1 ELSE 0 END AS business_details_complete,
+        CASE WHEN bc.owner_name IS NOT NULL AND
+                  bc.owner_mobile IS NOT NULL AND
+                  bc.owner_email IS NOT NULL
+             THEN 1 ELSE 0 END AS owner_details_complete,
+        CASE WHEN bc.vendor_count > 0 OR
+                  bc.vendor_certification IS NOT NULL
+             THEN 1 ELSE 0 END AS vendor_compliance_complete,
+        CASE WHEN bc.cleanliness_rating > 0 OR
+                  bc.sanitation_practices = TRUE OR
+                  bc.waste_management = TRUE
+             THEN 1 ELSE 0 END AS cleanliness_complete,
+        CASE WHEN bc.cruelty_free = TRUE
+             THEN 1 ELSE 0 END AS cruelty_free_complete,
+        CASE WHEN bc.sustainability IS NOT NULL AND bc.sustainability <> ''
+             THEN 1 ELSE 0 END AS sustainability_complete,
+        COALESCE(JSON_LENGTH(bc.photos), 0) AS document_count,
+        bc.audit_required,
+        bc.updated_at,
+        COALESCE(ra.rating_count, 0) AS total_feedback,
+        COALESCE(ra.rating_sum / NULLIF(ra.rating_count, 0), 0) AS average_rating
+    FROM business_certification bc
+    LEFT JOIN rating_aggregates ra
+        ON ra.subject_type = 'business' AND ra.subject_id = bc.user_id
+    WHERE bc.user_id = %s;
+
+    SELECT
+        p.id,
+        p.product_name,
+        p.created_at,
+        p.certification_status
+    FROM products p
+    WHERE p.business_id = %s
+    ORDER BY p.created_at DESC
+    LIMIT 5;
+
+    SELECT
+        f.id,
+        f.rating,
+        f.feedback_text as comment,
+        f.created_at,
+        u.full_name as consumer_name,
+        p.product_name
+    FROM feedback f
+    JOIN users u ON f.consumer_id = u.id
+    JOIN products p ON f.product_id = p.id
+    WHERE p.business_id = %s
+    ORDER BY f.created_at DESC
+    LIMIT 5;
+
+    SELECT COALESCE(SUM(scan_count), 0) AS total_scans
+    FROM scan_rollups_daily
+    WHERE business_id = %s
+"""
+
+EMPTY_SNAPSHOT = {
+    'stats': {
+        'total_scans': 0,
+        'total_feedback': 0,
+        'average_rating': 0,
+        'certification_status': 'not_submitted',
+        'cleanliness_rating': 0,
+        'business_name': 'Your Business'
+    },
+    'progress': {
+        'business_details': False,
+        'owner_details': False,
+        'vendor_compliance': False,
+        'cleanliness': False,
+        'cruelty_free': False
+    },
+    'completion_percentage': 0,
+    'recent_activity': [],
+    'certification_complete': False,
+    'certification': None
+}
+
+snapshot_cache = TTLCache(
+    maxsize=int(os.getenv('DASHBOARD_CACHE_SIZE', 5000)),
+    ttl=float(os.getenv('DASHBOARD_CACHE_TTL', 60))
+)
+
+
+def build_snapshot(cursor, user_id):
+    """Compute the dashboard for a business with one multi-statement round trip."""
+    cursor.execute(SNAPSHOT_QUERY, (user_id, user_id, user_id, user_id))
+    business_data = cursor.fetchone()
+    cursor.nextset()
+    recent_products = cursor.fetchall()
+    cursor.nextset()
+    recent_feedback = cursor.fetchall()
+    cursor.nextset()
+    total_scans = int(cursor.fetchone()['total_scans'])
+
+    if not business_data:
+        return EMPTY_SNAPSHOT
+
+    # Progress data from the certification fields - convert to boolean for frontend consistency
+    progress = {
+        'business_details': bool(business_data['business_details_complete']),
+        'owner_details': bool(business_data['owner_details_complete']),
+        'vendor_compliance': bool(business_data['vendor_compliance_complete']),
+        'cleanliness': bool(business_data['cleanliness_complete']),
+        'cruelty_free': bool(business_data['cruelty_free_complete'])
+    }
+
+    # Calculate completion percentage
+    completed_steps = sum(1 for step in progress.values() if step)
+    completion_percentage = int((completed_steps / 5) * 100)
+
+    # Combine recent activity
+    recent_activity = []
+
+    # Add product activity
+    for product in recent_products:
+        recent_activity.append({
+            'id': str(product['id']),
+            'type': 'product',
+            'product_name': product['product_name'],
+            'certification_status': product['certification_status'],
+            'timestamp': product['created_at']
+        })
+
+    # Add feedback activity
+    for feedback in recent_feedback:
+        recent_activity.append({
+            'id': str(feedback['id']),
+            'type': 'feedback',
+            'rating': feedback['rating'],
+            'comment': feedback['comment'],
+            'product_name': feedback['product_name'],
+            'consumer_name': feedback['consumer_name'],
+            'timestamp': feedback['created_at']
+        })
+
+    # Sort by timestamp descending
+    recent_activity.sort(key=lambda x: x['timestamp'] or datetime.min, reverse=True)
+
+    return {
+        'stats': {
+            'total_scans': total_scans,
+            'total_feedback': int(business_data['total_feedback']),
+            'average_rating': round(float(business_data['average_rating']), 2),
+            'certification_status': business_data['certification_status'] or 'not_submitted',
+            'cleanliness_rating': float(business_data['cleanliness_rating'] or 0),
+            'business_name': business_data['business_name'] or 'Your Business'
+        },
+        'progress': progress,
+        'completion_percentage': completion_percentage,
+        'recent_activity': recent_activity[:5],  # Limit to 5 most recent activities
+        'certification_complete': business_data['certification_status'] == 'approved',
+        'certification': {
+            'application_status': business_data['certification_status'],
+            'sections': {
+                'business_details': progress['business_details'],
+                'owner_details': progress['owner_details'],
+                'vendor_compliance': progress['vendor_compliance'],
+                'cleanliness_hygiene': progress['cleanliness'],
+                'cruelty_free': progress['cruelty_free'],
+                'sustainability': bool(business_data['sustainability_complete'])
+            },
+            'document_uploads': int(business_data['document_count']),
+            'audit_required': bool(business_data['audit_required']),
+            'last_updated': business_data['updated_at']
+        }
+    }
+
+
+def get_snapshot(cursor, user_id):
+    """Return the cached dashboard for a business, building it on a miss."""
+    snapshot = snapshot_cache.get(user_id)
+    if snapshot is None:
+        snapshot = build_snapshot(cursor, user_id)
+        snapshot_cache.set(user_id, snapshot)
+    return snapshot
+
+
+def invalidate_snapshot(user_id):
+    """Drop a business's cached dashboard after a feedback, product or certification write."""
+    snapshot_cache.pop(user_id)
@@ -1,15 +1,28 @@
 import os
+import time
+import logging
+import threading
+from collections import deque
 import pymysql
+from pymysql.constants import SERVER_STATUS
+from flask import g, has_app_context
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Configure PyMySQL to be used as a drop-in replacement for MySQLdb
 pymysql.install_as_MySQLdb()
 
-def get_db_connection():
-    """Create and return a connection to the MySQL database."""
+
+class PoolTimeout(pymysql.err.OperationalError):
+    """Raised when no pooled connection becomes available in time."""
+
+
+def _connect():
+    """Open a new raw connection to the MySQL database."""
     try:
         connection = pymysql.connect(
             host=os.getenv('DB_HOST', 'localhost'),
@@ -23,5 +36,346 @@ def get_db_connection():
         )
         return connection
     except pymysql.Error as e:
-        print(f"Database connection error: {e}")
-        raise 
\ No newline at end of file
+        logger.error('Database connection error', extra={'error': str(e)})
+        raise
+
+
+def _statement_key(query):
+    """Collapse whitespace and trim a query template for reporting."""
+    key = _statement_keys.get(query)
+    if key is None:
+        key = ' '.join(query.split())[:200]
+        if len(_statement_keys) < 2000:
+            _statement_keys[query] = key
+    return key
+
+
+_statement_keys = {}
+
+
+class QueryStats:
+    """Query count, total time and per-statement breakdown for one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = None
+        self.slowest_seconds = 0.0
+        self.statements = {}
+
+    def record(self, query, seconds):
+        self.count += 1
+        self.seconds += seconds
+        key = _statement_key(query)
+        entry = self.statements.get(key)
+        if entry is None:
+            entry = self.statements[key] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest = key
+
+    def breakdown(self, limit=10):
+        """Statements by total time, most expensive first."""
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [
+            {'statement': key, 'count': count, 'ms': round(seconds * 1000, 2)}
+            for key, (count, seconds) in ranked[:limit]
+        ]
+
+
+# Process-wide totals, including queries run outside requests
+query_totals = {'queries': 0, 'seconds': 0.0}
+_totals_lock = threading.Lock()
+
+
+def _record_query(query, seconds):
+    with _totals_lock:
+        query_totals['queries'] += 1
+        query_totals['seconds'] += seconds
+    if has_app_context():
+        stats = g.get('db_stats')
+        if stats is not None:
+            stats.record(query, seconds)
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute() and executemany()."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+    def detach(self):
+        """Forget the connection, so closing the cursor no longer reads a pending unbuffered result."""
+        self._cursor.connection = None
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            _record_query(query, time.perf_counter() - started)
+
+    def executemany(self, query, args):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            _record_query(query, time.perf_counter() - started)
+
+
+class PooledConnection:
+    """
+    Thin proxy around a pooled PyMySQL connection.
+    Calling close() hands the connection back to the pool instead of
+    closing the socket, so existing handlers can keep their cleanup code.
+    Cursors are wrapped so every statement is timed.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._request_bound = False
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._raw.cursor(*args, **kwargs))
+
+    def close(self):
+        # Request-bound connections are released on teardown
+        if not self._request_bound:
+            self.release()
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._raw)
+
+    def discard(self, kill_query=False):
+        """
+        Close the connection instead of returning it to the pool, for one
+        left with an unread unbuffered result. kill_query first stops the
+        statement on the server, so it does not keep producing rows.
+        """
+        if self._released:
+            return
+        self._released = True
+        if kill_query:
+            self._pool.kill_query(self._raw.thread_id())
+        self._pool.discard(self._raw)
+
+
+class ConnectionPool:
+    """
+    Bounded pool of PyMySQL connections.
+    Connections are pinged on checkout and recycled once they exceed
+    max_lifetime seconds.
+    """
+
+    def __init__(self, min_size=1, max_size=10, max_lifetime=1800, timeout=5, connect=_connect):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self._connect = connect
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def _open(self):
+        raw = self._connect()
+        raw._pool_created_at = time.monotonic()
+        return raw
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _expired(self, raw):
+        return time.monotonic() - raw._pool_created_at > self.max_lifetime
+
+    def _healthy(self, raw):
+        if not raw.open or self._expired(raw):
+            return False
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except pymysql.Error:
+            return False
+
+    def fill(self):
+        """Open connections until the pool holds min_size of them."""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                raw = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append(raw)
+                self._cond.notify()
+
+    def acquire(self):
+        """Check out a healthy connection, waiting up to timeout seconds."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            raw = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f'No database connection available after {self.timeout}s')
+                    self._cond.wait(remaining)
+                if self._idle:
+                    raw = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if raw is None:
+                try:
+                    return self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._healthy(raw):
+                return raw
+
+            # Stale or expired connection, replace it with a fresh one
+            self._discard(raw)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+
+    def release(self, raw):
+        """Return a connection to the pool, rolling back any open transaction."""
+        try:
+            if raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                raw.rollback()
+        except Exception:
+            self._discard(raw)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            if self._expired(raw):
+                self._size -= 1
+                discard = True
+            else:
+                self._idle.append(raw)
+                discard = False
+            self._cond.notify()
+        if discard:
+            self._discard(raw)
+
+    def discard(self, raw):
+        """Close a checked-out connection instead of returning it to the pool."""
+        self._discard(raw)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def kill_query(self, thread_id):
+        """Stop the statement running on another connection, from a connection of this pool."""
+        try:
+            conn = self.connection()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute('KILL QUERY %s', (thread_id,))
+            finally:
+                conn.close()
+        except pymysql.Error as e:
+            # Includes PoolTimeout; the discarded connection still ends the stream
+            logger.warning('Could not stop query', extra={'thread_id': thread_id, 'error': str(e)})
+
+    def connection(self):
+        """Check out a connection wrapped so that close() returns it to the pool."""
+        return PooledConnection(self, self.acquire())
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size
+            }
+
+    def close_all(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for raw in idle:
+            self._discard(raw)
+
+
+pool = ConnectionPool(
+    min_size=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+    max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+    max_lifetime=int(os.getenv('DB_POOL_MAX_LIFETIME', 1800)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 5))
+)
+
+
+def get_db_connection():
+    """
+    Return a pooled connection to the MySQL database.
+    Inside an app context the connection is bound to `g` and shared by the
+    whole request; it is returned to the pool automatically on teardown.
+    """
+    if not has_app_context():
+        return pool.connection()
+
+    conn = g.get('db_conn')
+    if conn is None:
+        conn = pool.connection()
+        conn._request_bound = True
+        g.db_conn = conn
+    return conn
+
+
+def release_db_connection(exception=None):
+    """Return the request-bound connection (if any) to the pool."""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.release()
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db_connection)
+
+    try:
+        pool.fill()
+    except pymysql.Error as e:
+        # The pool opens connections lazily if the database is not up yet
+        logger.warning('Could not pre-fill database pool', extra={'error': str(e)})
@@ -0,0 +1,66 @@
+import hashlib
+from flask import request, current_app
+
+# Suffixes app/compression.py appends to the ETag of an encoded representation
+ENCODING_SUFFIXES = ('-br', '-gzip')
+
+
+def make_etag(*parts):
+    """
+    Strong ETag from the data versions a response is built from, e.g. an
+    aggregate's version counter or a row's updated_at, plus whatever else
+    selects the representation (the user, query parameters).
+    """
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=12)
+    return digest.hexdigest()
+
+
+def _client_etags(header):
+    """ETags from If-None-Match, keyed by the base tag with any W/ or encoding suffix removed."""
+    if not header:
+        return {}
+    tags = {}
+    for raw in header.split(','):
+        raw = raw.strip()
+        tag = raw[2:] if raw.startswith('W/') else raw
+        tag = tag.strip('"')
+        for suffix in ENCODING_SUFFIXES:
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)]
+                break
+        tags[tag] = raw
+    return tags
+
+
+def held_etag(etag, header):
+    """The tag from an If-None-Match header that matches etag, as the client sent it, or None."""
+    tags = _client_etags(header)
+    held = tags.get(etag)
+    if held is None and '*' in tags:
+        held = f'"{etag}"'
+    return held
+
+
+def not_modified(etag, cache_control='private, no-cache'):
+    """
+    A 304 response if the client already holds the representation for
+    etag, otherwise None. Called before the response body is queried or
+    serialized, so a match costs only the version lookup.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    held = held_etag(etag, request.headers.get('If-None-Match'))
+    if held is None:
+        return None
+    response = current_app.response_class(status=304)
+    response.headers['Cache-Control'] = cache_control
+    # Echo the tag the client sent, which names the encoding it holds
+    response.headers['ETag'] = held
+    return response
+
+
+def with_etag(response, etag, cache_control='private, no-cache'):
+    """Attach the ETag and ask clients to revalidate before reusing the body."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
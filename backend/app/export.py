@@ -0,0 +1,306 @@
+import io
+import os
+import csv
+import json
+import logging
+import threading
+from datetime import date, datetime
+import click
+import pymysql
+from .database import pool
+from .json_provider import _default
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', 5000))
+EXPORT_CHUNK_BYTES = int(os.getenv('EXPORT_CHUNK_BYTES', 64 * 1024))
+EXPORT_MAX_CONCURRENT = int(os.getenv('EXPORT_MAX_CONCURRENT', 4))
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# Each dataset is read in id order; `scope` narrows it to one business's products
+DATASETS = {
+    'feedback': {
+        'query': """
+            SELECT f.id, f.product_id, p.product_code, p.product_name, f.business_id,
+                   f.consumer_id, f.rating, f.feedback_text, f.upvotes, f.created_at, f.updated_at
+            FROM feedback f
+            LEFT JOIN products p ON f.product_id = p.id
+            WHERE 1 = 1 {filters}
+            ORDER BY f.id
+        """,
+        'scope': 'p.business_id = %s',
+        'created': 'f.created_at',
+        'columns': {
+            'id': 'int64', 'product_id': 'int64', 'product_code': 'string', 'product_name': 'string',
+            'business_id': 'int64', 'consumer_id': 'int64', 'rating': 'int8', 'feedback_text': 'string',
+            'upvotes': 'int32', 'created_at': 'timestamp', 'updated_at': 'timestamp'
+        }
+    },
+    'verifications': {
+        'query': """
+            SELECT v.id, v.product_id, p.product_code, p.business_id, v.user_id,
+                   v.verification_method, v.verification_date
+            FROM product_verifications v
+            JOIN products p ON v.product_id = p.id
+            WHERE 1 = 1 {filters}
+            ORDER BY v.id
+        """,
+        'scope': 'p.business_id = %s',
+        'created': 'v.verification_date',
+        'columns': {
+            'id': 'int64', 'product_id': 'int64', 'product_code': 'string', 'business_id': 'int64',
+            'user_id': 'int64', 'verification_method': 'string', 'verification_date': 'timestamp'
+        }
+    }
+}
+
+
+class InvalidExport(ValueError):
+    """Raised for an unknown dataset or format, or an unreadable date range."""
+
+
+class ExportBusy(Exception):
+    """Raised when EXPORT_MAX_CONCURRENT exports are already streaming."""
+
+
+# Every streaming export pins a pool connection until the last row is sent
+_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+
+def parse_range(since, until):
+    """Turn ISO date/datetime strings into datetimes; `until` is exclusive."""
+    bounds = []
+    for name, value in (('since', since), ('until', until)):
+        if not value:
+            bounds.append(None)
+            continue
+        try:
+            bounds.append(datetime.fromisoformat(value))
+        except ValueError:
+            raise InvalidExport(f'{name} must be an ISO 8601 date or datetime')
+    return tuple(bounds)
+
+
+def iter_rows(dataset, business_id=None, since=None, until=None, conn=None, fetch_size=EXPORT_FETCH_SIZE):
+    """
+    Yield dict rows of a dataset through an unbuffered cursor, so only
+    fetch_size rows are held at a time however large the table is. The
+    connection is dedicated to the stream and returned when it ends.
+    """
+    spec = DATASETS.get(dataset)
+    if spec is None:
+        raise InvalidExport(f"Unknown dataset '{dataset}', expected one of {', '.join(DATASETS)}")
+
+    filters, params = [], []
+    if business_id is not None:
+        filters.append(spec['scope'])
+        params.append(business_id)
+    if since is not None:
+        filters.append(f"{spec['created']} >= %s")
+        params.append(since)
+    if until is not None:
+        filters.append(f"{spec['created']} < %s")
+        params.append(until)
+    query = spec['query'].format(filters=''.join(f' AND {clause}' for clause in filters))
+
+    own_conn = conn is None
+    if own_conn:
+        conn = pool.connection()
+    cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+    completed = False
+    try:
+        cursor.execute(query, tuple(params))
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+        completed = True
+    finally:
+        if completed or not own_conn:
+            # Closing an unbuffered cursor drains whatever the server has left to send
+            cursor.close()
+            if own_conn:
+                conn.close()
+        else:
+            # Stopped early, e.g. the client went away: draining would read every
+            # remaining row, so stop the query and drop the connection instead
+            cursor.detach()
+            conn.discard(kill_query=True)
+
+
+def _csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return '' if value is None else value
+
+
+def encode_csv(rows, columns, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """Encode rows as CSV with a header, yielding chunks of about chunk_bytes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_csv_value(row[column]) for column in columns])
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _ndjson_line(row):
+    if orjson is not None:
+        return orjson.dumps(row, default=_default) + b'\n'
+    return json.dumps(row, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def encode_ndjson(rows, columns, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """Encode rows as newline-delimited JSON, yielding chunks of about chunk_bytes."""
+    chunk, size = [], 0
+    for row in rows:
+        line = _ndjson_line(row)
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield b''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+ENCODERS = {'csv': encode_csv, 'ndjson': encode_ndjson}
+
+
+class ExportStream:
+    """
+    Iterable of encoded chunks for an HTTP response. It holds an export slot,
+    and the streaming connection once iteration starts, until the server
+    closes it after the last chunk or a client disconnect.
+    """
+
+    def __init__(self, dataset, fmt, business_id=None, since=None, until=None):
+        if fmt not in ENCODERS:
+            raise InvalidExport(f"Unsupported format '{fmt}', expected csv or ndjson")
+        if dataset not in DATASETS:
+            raise InvalidExport(f"Unknown dataset '{dataset}', expected one of {', '.join(DATASETS)}")
+        if not _slots.acquire(blocking=False):
+            raise ExportBusy('Too many exports in progress')
+        self.dataset = dataset
+        self.business_id = business_id
+        self._rows = iter_rows(dataset, business_id, since, until)
+        self._chunks = ENCODERS[fmt](self._rows, list(DATASETS[dataset]['columns']))
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            yield from self._chunks
+        except Exception:
+            # Headers are already sent; the client sees a truncated body
+            logger.exception('Export failed', extra={'dataset': self.dataset, 'business_id': self.business_id})
+            raise
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._chunks.close()
+            # Returns the streaming connection to the pool, or drops it if rows were left unread
+            self._rows.close()
+        finally:
+            _slots.release()
+
+
+def _arrow_type(kind):
+    return {
+        'int8': pa.int8(), 'int32': pa.int32(), 'int64': pa.int64(),
+        'string': pa.string(), 'timestamp': pa.timestamp('s')
+    }[kind]
+
+
+def write_parquet(rows, columns, path, row_group_size=EXPORT_FETCH_SIZE * 10):
+    """
+    Write rows to a Parquet file one row group at a time, so memory stays at
+    one row group regardless of the row count. Returns the number of rows.
+    """
+    if pq is None:
+        raise InvalidExport('Parquet export needs the pyarrow package')
+    schema = pa.schema([(name, _arrow_type(kind)) for name, kind in columns.items()])
+    names = list(columns)
+    count = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        batch = {name: [] for name in names}
+        for row in rows:
+            for name in names:
+                batch[name].append(row[name])
+            count += 1
+            if count % row_group_size == 0:
+                writer.write_table(pa.table(batch, schema=schema))
+                batch = {name: [] for name in names}
+        if count % row_group_size or count == 0:
+            writer.write_table(pa.table(batch, schema=schema))
+    return count
+
+
+def export_to_file(dataset, fmt, path, business_id=None, since=None, until=None):
+    """Write a full export to a file (or '-' for stdout); returns the number of rows."""
+    columns = DATASETS[dataset]['columns']
+    counted = {'rows': 0}
+
+    def counting(rows):
+        for row in rows:
+            counted['rows'] += 1
+            yield row
+
+    rows = iter_rows(dataset, business_id, since, until)
+    if fmt == 'parquet':
+        if path == '-':
+            raise InvalidExport('Parquet exports need an --output file')
+        return write_parquet(rows, columns, path)
+    if fmt not in ENCODERS:
+        raise InvalidExport(f"Unsupported format '{fmt}', expected csv, ndjson or parquet")
+
+    out = click.get_binary_stream('stdout') if path == '-' else open(path, 'wb')
+    try:
+        for chunk in ENCODERS[fmt](counting(rows), list(columns)):
+            out.write(chunk)
+    finally:
+        if path != '-':
+            out.close()
+        else:
+            out.flush()
+    return counted['rows']
+
+
+def init_app(app):
+    @app.cli.command('export')
+    @click.argument('dataset', type=click.Choice(list(DATASETS)))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson', 'parquet']), default='ndjson',
+                  help='Output format (default ndjson).')
+    @click.option('--output', '-o', default='-', help='File to write; defaults to stdout.')
+    @click.option('--business-id', type=int, default=None, help="Only this business user's products.")
+    @click.option('--since', default=None, help='Rows created at or after this ISO date/datetime.')
+    @click.option('--until', default=None, help='Rows created before this ISO date/datetime.')
+    def export_command(dataset, fmt, output, business_id, since, until):
+        """Stream feedback or product verifications to CSV, NDJSON or Parquet."""
+        try:
+            since, until = parse_range(since, until)
+            rows = export_to_file(dataset, fmt, output, business_id, since, until)
+        except InvalidExport as e:
+            raise click.UsageError(str(e))
+        click.echo(f'Exported {rows} {dataset} rows', err=True)
@@ -1,8 +1,14 @@
 import os
-import json
 from flask import Blueprint, request, jsonify
 from .database import get_db_connection
 from .auth_middleware import token_required
+from .product_cache import get_product_by_code
+from .ratings import AGGREGATE_QUERY, normalize_rating, record_rating, touch, summarize
+from .dashboard import invalidate_snapshot
+from .pagination import InvalidCursor, page_params, keyset_clause, keyset_params, paginate
+from .etags import make_etag
+from .photo_store import InvalidPhoto, normalize_photos, photo_refs
+from .steps import Query, Reply, not_modified_reply, run
 
 feedback_bp = Blueprint('feedback', __name__)
 
@@ -20,32 +26,36 @@ def submit_feedback(user_id, role):
     feedback_text = data.get('feedback_text')
     rating = data.get('rating')
     
-    # Optional fields
-    photos = data.get('photos')
-    
     if not product_code or not feedback_text or not rating:
         return jsonify({'message': 'Missing required fields'}), 400
     
+    # The whole-star value is written to the row and the aggregates alike
+    rating = normalize_rating(rating)
+    if rating is None:
+        return jsonify({'message': 'Rating must be between 1 and 5'}), 400
+    
+    # Optional fields; rows keep photo ids only, inline images are moved into photo storage
+    try:
+        photos = normalize_photos(data['photos']) if data.get('photos') else None
+    except InvalidPhoto as e:
+        return jsonify({'message': str(e)}), 400
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
         # Find product by code
-        cursor.execute(
-            "SELECT id FROM products WHERE product_code = %s", 
-            (product_code,)
-        )
-        
-        product = cursor.fetchone()
+        product = get_product_by_code(cursor, product_code)
         
         if not product:
             return jsonify({'message': 'Product not found'}), 404
         
         product_id = product['id']
         
-        # Check if user already submitted feedback for this product
+        # Check if user already submitted feedback for this product. The row is
+        # locked so a concurrent edit can't apply a rating delta from a stale value
         cursor.execute(
-            "SELECT id FROM feedback WHERE product_id = %s AND consumer_id = %s", 
+            "SELECT id, rating FROM feedback WHERE product_id = %s AND consumer_id = %s FOR UPDATE", 
             (product_id, user_id)
         )
         
@@ -65,6 +75,7 @@ def submit_feedback(user_id, role):
             ))
             
             feedback_id = existing_feedback['id']
+            previous_rating = existing_feedback['rating']
             message = 'Feedback updated successfully'
         else:
             # Insert new feedback
@@ -80,9 +91,19 @@ def submit_feedback(user_id, role):
             ))
             
             feedback_id = cursor.lastrowid
+            previous_rating = None
             message = 'Feedback submitted successfully'
         
+        # Keep the rating aggregates in step, in the same transaction
+        record_rating(
+            cursor,
+            [('product', product_id), ('business', product['business_id'])],
+            rating,
+            previous_rating
+        )
+        
         conn.commit()
+        invalidate_snapshot(product['business_id'])
         
         return jsonify({
             'message': message,
@@ -121,6 +142,9 @@ def upvote_feedback(user_id, role, feedback_id):
             (feedback_id,)
         )
         
+        # New version for the listing the feedback appears in
+        touch(cursor, [('product', feedback['product_id']), ('listing', feedback['business_id'])])
+        
         conn.commit()
         
         return jsonify({
@@ -135,54 +159,76 @@ def upvote_feedback(user_id, role, feedback_id):
         if 'conn' in locals() and conn:
             conn.close()
 
-@feedback_bp.route('/get/<int:product_id>', methods=['GET'])
-@token_required(roles=['consumer', 'business'])
-def get_product_feedback(user_id, role, product_id):
+def feedback_etag(product_id, aggregate, limit, after):
+    """
+    The product's aggregate changes with every feedback write, so its
+    version identifies a page without reading it.
+    """
+    return make_etag(
+        'product-feedback', product_id, aggregate['version'] if aggregate else None,
+        limit, after
+    )
+
+def feedback_page_query(product_id, limit, after):
+    """One page of feedback for a product, newest first; returns the SQL and its parameters."""
+    keyset = f"AND {keyset_clause('f.created_at', 'f.id')}" if after else ''
+    return f"""
+        SELECT f.id, u.full_name AS user_name, f.feedback_text, f.rating, 
+            f.upvotes, f.created_at, f.photos
+        FROM feedback f
+        JOIN users u ON f.consumer_id = u.id
+        WHERE f.product_id = %s {keyset}
+        ORDER BY f.created_at DESC, f.id DESC
+        LIMIT %s
+    """, (product_id, *(keyset_params(after) if after else ()), limit + 1)
+
+def feedback_page(rows, limit, aggregate):
+    """Response body for a feedback page query result; the average rating comes from the running aggregate."""
+    feedback, next_cursor = paginate(rows, limit, lambda row: (row['created_at'], row['id']))
+    rating = summarize(aggregate)
+    
+    feedback_list = []
+    for item in feedback:
+        feedback_item = {
+            'id': item['id'],
+            'user_name': item['user_name'],
+            'feedback_text': item['feedback_text'],
+            'rating': item['rating'],
+            'upvotes': item['upvotes'],
+            'created_at': item['created_at'],
+            'photos': photo_refs(item['photos'])
+        }
+        feedback_list.append(feedback_item)
+    
+    return {
+        'feedback': feedback_list,
+        'average_rating': rating['average_rating'],
+        'count': rating['count'],
+        'next_cursor': next_cursor
+    }
+
+def product_feedback(product_id, args, if_none_match):
+    """GET /get/<product_id>, shared with the ASGI server."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        limit, after = page_params(args)
+    except InvalidCursor as e:
+        return Reply({'message': str(e)}, 400)
+    
+    try:
+        aggregate = yield Query(AGGREGATE_QUERY, ('product', product_id), fetch='one')
+        etag = feedback_etag(product_id, aggregate, limit, after)
+        cached = not_modified_reply(etag, if_none_match)
+        if cached:
+            return cached
         
-        # Get feedback for product
-        cursor.execute("""
-            SELECT f.id, u.full_name AS user_name, f.feedback_text, f.rating, 
-                f.upvotes, f.created_at, f.photos
-            FROM feedback f
-            JOIN users u ON f.consumer_id = u.id
-            WHERE f.product_id = %s
-            ORDER BY f.created_at DESC
-        """, (product_id,))
-        
-        feedback = cursor.fetchall()
-        
-        # Calculate average rating
-        average_rating = 0
-        if feedback:
-            total_rating = sum(item['rating'] for item in feedback)
-            average_rating = total_rating / len(feedback)
-        
-        feedback_list = []
-        for item in feedback:
-            feedback_item = {
-                'id': item['id'],
-                'user_name': item['user_name'],
-                'feedback_text': item['feedback_text'],
-                'rating': item['rating'],
-                'upvotes': item['upvotes'],
-                'created_at': item['created_at'].isoformat() if item['created_at'] else None,
-                'photos': [] if not item['photos'] else json.loads(item['photos'])
-            }
-            feedback_list.append(feedback_item)
+        rows = yield Query(*feedback_page_query(product_id, limit, after))
         
-        return jsonify({
-            'feedback': feedback_list,
-            'average_rating': round(average_rating, 1),
-            'count': len(feedback)
-        }), 200
+        return Reply(feedback_page(rows, limit, aggregate), etag=etag, cache_control='private, no-cache')
         
     except Exception as e:
-        return jsonify({'message': f'Error: {str(e)}'}), 500
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'conn' in locals() and conn:
-            conn.close() 
\ No newline at end of file
+        return Reply({'message': f'Error: {str(e)}'}, 500)
+
+@feedback_bp.route('/get/<int:product_id>', methods=['GET'])
+@token_required(roles=['consumer', 'business'])
+def get_product_feedback(user_id, role, product_id):
+    return run(product_feedback(product_id, request.args, request.headers.get('If-None-Match')))
\ No newline at end of file
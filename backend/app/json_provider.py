@@ -0,0 +1,116 @@
+import os
+import json
+import uuid
+import base64
+import decimal
+import dataclasses
+from datetime import date, time, datetime, timedelta
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def _default(value):
+    """Encode the types PyMySQL and the analytics code hand back that JSON has no literal for."""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if np is not None:
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _use_orjson():
+    return orjson is not None and os.getenv('JSON_BACKEND', 'orjson') == 'orjson'
+
+
+def dumps_bytes(obj):
+    """Compact JSON bytes encoded as the provider encodes response bodies, for code outside Flask."""
+    if _use_orjson():
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    JSON provider that serializes datetimes, dates, Decimals, bytes and
+    NumPy scalars directly, so handlers can return database rows as they
+    come. Uses orjson when it is installed and the standard library otherwise.
+    """
+
+    mimetype = 'application/json'
+
+    # Flask's default provider sorts keys; handlers already build dicts in response order
+    sort_keys = os.getenv('JSON_SORT_KEYS', 'false').lower() == 'true'
+
+    # None means compact output except in debug mode, as with Flask's provider
+    compact = None
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.use_orjson = _use_orjson()
+
+    def _orjson_options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def _indent(self):
+        return self.compact is False or (self.compact is None and self._app.debug)
+
+    def dumps_bytes(self, obj, indent=False):
+        if self.use_orjson:
+            return orjson.dumps(obj, default=_default, option=self._orjson_options(indent))
+        return self.dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.dumps(obj, default=_default, option=self._orjson_options()).decode('utf-8')
+        kwargs.setdefault('default', _default)
+        kwargs.setdefault('ensure_ascii', False)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        if kwargs.get('indent') is None:
+            kwargs.setdefault('separators', (',', ':'))
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            self.dumps_bytes(obj, indent=self._indent()) + b'\n', mimetype=self.mimetype
+        )
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
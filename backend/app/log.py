@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_handler = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the message, level, logger and any extra fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Let through only `rate` of DEBUG records; other levels always pass."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without ever waiting on it.
+    When the queue is full the record is dropped and counted instead.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._formatter = logging.Formatter()
+
+    def prepare(self, record):
+        # Merge args and render the traceback here, but keep extra fields
+        # on the record for the JSON formatter on the other side
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(spec):
+    """Parse LOG_LEVELS, e.g. 'app.database=DEBUG,app.bloom=WARNING'."""
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def log_stats():
+    return {
+        'queued': _handler.queue.qsize() if _handler else 0,
+        'dropped': _handler.dropped if _handler else 0
+    }
+
+
+def init_app(app):
+    """
+    Send the package's log records through a bounded queue to a background
+    thread that writes them to stdout, so request threads never block on the pipe.
+    """
+    global _listener, _handler
+    logger = logging.getLogger(__name__.rsplit('.', 1)[0])
+
+    if _listener is None:
+        stream = logging.StreamHandler(sys.stdout)
+        if os.getenv('LOG_FORMAT', 'json') == 'json':
+            stream.setFormatter(JSONFormatter())
+        else:
+            stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+        _handler = NonBlockingQueueHandler(queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', 10000))))
+        _handler.addFilter(SamplingFilter(float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1.0))))
+        _listener = QueueListener(_handler.queue, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+    # Installing a handler first also stops Flask adding its own to app.logger
+    if _handler not in logger.handlers:
+        logger.addHandler(_handler)
+    logger.propagate = False
+    logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    for name, level in parse_levels(os.getenv('LOG_LEVELS', '')).items():
+        logging.getLogger(name).setLevel(level)
@@ -0,0 +1,261 @@
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from flask import g, request, Response
+from .database import QueryStats, query_totals, pool
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 500))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label tuple."""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{base}}} {total}')
+            lines.append(f'{self.name}_count{{{base}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{{{_labels(self.label_names, labels)}}} {value}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _gauges(name, help_text, values, label_name=None, metric_type='gauge'):
+    """Render a sampled value; values is a number or, with label_name, a dict of label -> number."""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+    if label_name is None:
+        lines.append(f'{name} {values}')
+    else:
+        for label, value in sorted(values.items()):
+            lines.append(f'{name}{{{label_name}="{_escape(label)}"}} {value}')
+    return lines
+
+
+request_latency = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.',
+    ('endpoint', 'method', 'status'), LATENCY_BUCKETS
+)
+request_queries = Histogram(
+    'http_request_db_queries', 'Database statements executed per request.',
+    ('endpoint',), QUERY_COUNT_BUCKETS
+)
+request_db_seconds = Counter(
+    'http_request_db_seconds_total', 'Time spent in database statements by endpoint.',
+    ('endpoint',)
+)
+
+
+def _endpoint():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.db_stats = QueryStats()
+
+
+def _finish_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    stats = g.get('db_stats')
+    endpoint = _endpoint()
+
+    request_latency.observe((endpoint, request.method, str(response.status_code)), elapsed)
+    if stats is not None:
+        request_queries.observe((endpoint,), stats.count)
+        request_db_seconds.inc((endpoint,), stats.seconds)
+
+    if elapsed * 1000 >= SLOW_REQUEST_MS:
+        logger.warning('Slow request', extra={
+            'endpoint': endpoint,
+            'method': request.method,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 2),
+            'db_queries': stats.count if stats else 0,
+            'db_ms': round(stats.seconds * 1000, 2) if stats else 0,
+            'slowest_statement': stats.slowest if stats else None,
+            'slowest_ms': round(stats.slowest_seconds * 1000, 2) if stats else 0,
+            'statements': stats.breakdown() if stats else []
+        })
+    return response
+
+
+def _async_db():
+    """The ASGI connection pool, or None when the async extras are not installed."""
+    try:
+        from .aio_database import async_db
+    except ImportError:
+        return None
+    return async_db
+
+
+def _component_gauges():
+    # Imported here so the metrics module does not pull in every subsystem on import
+    from .auth_middleware import token_stats
+    from .product_cache import product_cache
+    from .dashboard import snapshot_cache
+    from .consumer import directory_cache
+    from .bloom import product_filter
+    from .verification_log import verification_writer
+    from .scan_rollups import scan_rollup
+    from .log import log_stats
+    from .compression import compression_stats
+    from .search import search_cache, vocabulary
+
+    lines = []
+    pool_stats = pool.stats()
+    lines += _gauges('db_pool_connections', 'Pooled database connections by state.', {
+        'idle': pool_stats['idle'], 'in_use': pool_stats['in_use']
+    }, 'state')
+    lines += _gauges('db_pool_max_connections', 'Upper bound on pooled connections.', pool_stats['max_size'])
+    async_db = _async_db()
+    if async_db is not None and async_db.running:
+        async_stats = async_db.stats()
+        lines += _gauges('async_db_pool_connections', 'Async (ASGI) pool connections by state.', {
+            'idle': async_stats['idle'], 'in_use': async_stats['in_use']
+        }, 'state')
+        lines += _gauges('async_db_pool_max_connections', 'Upper bound on async pool connections.',
+                         async_stats['max_size'])
+
+    caches = {
+        'token': token_stats(),
+        'product': product_cache.stats(),
+        'dashboard': snapshot_cache.stats(),
+        'directory': directory_cache.stats(),
+        'search': search_cache.stats()
+    }
+    lines += _gauges('cache_entries', 'Entries held by each in-process cache.',
+                     {name: stats['size'] for name, stats in caches.items()}, 'cache')
+    for stat, help_text in (('hits', 'Cache hits.'), ('misses', 'Cache misses.'), ('evictions', 'Cache evictions.')):
+        lines += _gauges(f'cache_{stat}_total', help_text,
+                         {name: stats[stat] for name, stats in caches.items()}, 'cache', 'counter')
+    lines += _gauges('token_rejects_total', 'Tokens that failed verification.', caches['token']['rejects'],
+                     metric_type='counter')
+
+    filter_stats = product_filter.stats()
+    lines += _gauges('product_filter_ready', 'Whether the product code filter has been built.', int(filter_stats['ready']))
+    lines += _gauges('product_filter_rejects_total', 'Unknown codes rejected without a query.', filter_stats['rejects'],
+                     metric_type='counter')
+    if filter_stats['ready']:
+        lines += _gauges('product_filter_items', 'Codes held by the product code filter.', filter_stats['items'])
+
+    vocabulary_stats = vocabulary.stats()
+    lines += _gauges('search_vocabulary_ready', 'Whether the search vocabulary has been built.', int(vocabulary_stats['ready']))
+    if vocabulary_stats['ready']:
+        lines += _gauges('search_vocabulary_terms', 'Distinct terms known to search autocomplete.', vocabulary_stats['terms'])
+
+    writer_stats = verification_writer.stats()
+    lines += _gauges('verification_queue_pending', 'Verification events waiting to be written.', writer_stats['pending'])
+    lines += _gauges('verification_rows_total', 'Verification rows by write outcome.', {
+        'written': writer_stats['written'], 'dropped': writer_stats['dropped']
+    }, 'outcome', 'counter')
+    lines += _gauges('verification_write_retries_total', 'Verification batch writes retried after an error.',
+                     writer_stats['retries'], metric_type='counter')
+
+    rollup_stats = scan_rollup.stats()
+    if rollup_stats['lag'] is not None:
+        lines += _gauges('scan_rollup_lag', 'Verifications not yet counted in the scan rollups.', rollup_stats['lag'])
+    lines += _gauges('scan_rollup_late_rows_total', 'Verifications counted after the rollup watermark had passed their id.',
+                     rollup_stats['late_rows'], metric_type='counter')
+
+    compressed = compression_stats()
+    lines += _gauges('http_responses_compressed_total', 'Responses sent compressed.', compressed['responses'],
+                     metric_type='counter')
+    lines += _gauges('http_compression_bytes_total', 'Body bytes of compressed responses, before and after compression.', {
+        'in': compressed['bytes_in'], 'out': compressed['bytes_out']
+    }, 'stage', 'counter')
+
+    logging_stats = log_stats()
+    lines += _gauges('log_queue_pending', 'Log records waiting for the writer thread.', logging_stats['queued'])
+    lines += _gauges('log_records_dropped_total', 'Log records dropped because the queue was full.', logging_stats['dropped'],
+                     metric_type='counter')
+    return lines
+
+
+def render_metrics():
+    lines = []
+    lines += request_latency.render()
+    lines += request_queries.render()
+    lines += request_db_seconds.render()
+    lines += ['# HELP db_queries_total Database statements executed by this process.',
+              '# TYPE db_queries_total counter',
+              f"db_queries_total {query_totals['queries']}",
+              '# HELP db_query_seconds_total Time spent in database statements by this process.',
+              '# TYPE db_query_seconds_total counter',
+              f"db_query_seconds_total {query_totals['seconds']}"]
+    lines += _component_gauges()
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+    @app.route('/api/metrics')
+    def metrics():
+        if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,75 @@
+import os
+import json
+import base64
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = int(os.getenv('PAGE_SIZE_DEFAULT', 20))
+MAX_PAGE_SIZE = int(os.getenv('PAGE_SIZE_MAX', 100))
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(values):
+    """Pack the sort-key values of the last row into an opaque token."""
+    packed = [{'dt': value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(packed, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Unpack a token produced by encode_cursor, expecting `size` values."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        packed = json.loads(raw)
+        values = [
+            datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+            for value in packed
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor('Invalid pagination cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Invalid pagination cursor')
+    return values
+
+
+def page_params(args, size=2, default_limit=DEFAULT_PAGE_SIZE):
+    """
+    Read `limit` and `cursor` from the query string.
+    Returns (limit, cursor values or None); limit is capped at MAX_PAGE_SIZE.
+    """
+    try:
+        limit = int(args.get('limit', default_limit))
+    except (TypeError, ValueError):
+        limit = default_limit
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    token = args.get('cursor')
+    return limit, decode_cursor(token, size) if token else None
+
+
+def keyset_clause(first_column, second_column, descending=True):
+    """
+    SQL condition selecting rows after the cursor for ORDER BY
+    (first_column, second_column), written so the composite index is used.
+    Bind it with keyset_params().
+    """
+    op = '<' if descending else '>'
+    return f"({first_column} {op} %s OR ({first_column} = %s AND {second_column} {op} %s))"
+
+
+def keyset_params(cursor_values):
+    first, second = cursor_values
+    return (first, first, second)
+
+
+def paginate(rows, limit, key):
+    """
+    Trim a LIMIT limit + 1 result to one page.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if len(rows) <= limit:
+        return list(rows), None
+    rows = list(rows[:limit])
+    return rows, encode_cursor(key(rows[-1]))
@@ -0,0 +1,76 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the hashing pool is saturated and the request should be shed."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated thread pool.
+    bcrypt releases the GIL while hashing, so the pool bounds how many cores
+    login and registration can occupy. At most max_workers + max_queue jobs
+    are admitted; anything beyond that fails fast with PasswordPoolBusy.
+    """
+
+    def __init__(self, rounds=12, max_workers=2, max_queue=8, timeout=10):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy('Password hashing pool is saturated')
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, fn, *args):
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Queued too long behind other hashes: shed like a full pool
+            raise PasswordPoolBusy(f'Password hashing took longer than {self.timeout}s')
+
+    def _hashpw(self, password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def hash(self, password):
+        """Hash a password with the configured cost factor."""
+        return self._run(self._hashpw, password)
+
+    def hash_later(self, password, callback):
+        """
+        Hash a password in the background and call callback(password_hash)
+        on the pool thread, without waiting. Raises PasswordPoolBusy.
+        """
+        future = self._submit(self._hashpw, password)
+        future.add_done_callback(lambda done: callback(done.result()) if done.exception() is None else None)
+        return future
+
+    def check(self, password, password_hash):
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with a different cost factor."""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+
+hasher = PasswordHasher(
+    rounds=int(os.getenv('BCRYPT_ROUNDS', 12)),
+    max_workers=int(os.getenv('BCRYPT_POOL_SIZE', 2)),
+    max_queue=int(os.getenv('BCRYPT_QUEUE_LIMIT', 8)),
+    timeout=float(os.getenv('BCRYPT_TIMEOUT', 10))
+)
@@ -0,0 +1,307 @@
+import io
+import os
+import re
+import json
+import base64
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import click
+from PIL import Image, UnidentifiedImageError
+from .database import get_db_connection
+from .thumbnail_worker import render_thumbnails, write_atomic
+
+logger = logging.getLogger(__name__)
+
+PHOTO_STORAGE_DIR = os.getenv(
+    'PHOTO_STORAGE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads', 'photos')
+)
+PHOTO_BASE_URL = os.getenv('PHOTO_BASE_URL', '/api/photos').rstrip('/')
+PHOTO_MAX_BYTES = int(os.getenv('PHOTO_MAX_BYTES', 10 * 1024 * 1024))
+PHOTO_MAX_PER_ITEM = int(os.getenv('PHOTO_MAX_PER_ITEM', 10))
+PHOTO_THUMBNAIL_QUALITY = int(os.getenv('PHOTO_THUMBNAIL_QUALITY', 80))
+
+# Longest edge in pixels of each generated size
+THUMBNAIL_SIZES = {'thumb': 160, 'medium': 640}
+
+# Formats accepted for upload, with the extension the original is kept under
+PHOTO_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+PHOTO_MIMETYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+
+_PHOTO_ID = re.compile(r'^[0-9a-f]{64}$')
+_DATA_URI = re.compile(r'^data:image/[\w.+-]+;base64,', re.IGNORECASE)
+
+
+class InvalidPhoto(ValueError):
+    """Raised for uploads that are not a supported image, are too large or reference unknown photos."""
+
+
+class PhotoPoolBusy(Exception):
+    """Raised when the thumbnail pool is saturated and the request should be shed."""
+
+
+class PhotoRenderError(Exception):
+    """Raised when a stored original cannot be decoded or its thumbnail rendered."""
+
+
+def is_photo_id(value):
+    return isinstance(value, str) and bool(_PHOTO_ID.match(value))
+
+
+def photo_dir(photo_id):
+    # Two-character fan-out keeps directories small
+    return os.path.join(PHOTO_STORAGE_DIR, photo_id[:2], photo_id)
+
+
+def original_path(photo_id):
+    """Path of the stored original, or None if the photo is unknown."""
+    directory = photo_dir(photo_id)
+    for ext in PHOTO_FORMATS.values():
+        path = os.path.join(directory, f'original.{ext}')
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def thumbnail_path(photo_id, size):
+    return os.path.join(photo_dir(photo_id), f'{size}.jpg')
+
+
+class ThumbnailPool:
+    """
+    Generates thumbnails on a small process pool, so image decoding and
+    resizing never hold the GIL of a request thread. At most max_workers +
+    max_queue jobs are admitted; anything beyond that fails fast with
+    PhotoPoolBusy. The pool is started on first use.
+    """
+
+    def __init__(self, max_workers=2, max_queue=16, timeout=10):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the parent holds pool connections, locks and threads.
+                # Workers import only app.thumbnail_worker; entry scripts keep app
+                # construction under __main__ so the re-imported main module is inert
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def submit(self, photo_id, source):
+        if not self._slots.acquire(blocking=False):
+            raise PhotoPoolBusy('Thumbnail pool is saturated')
+        try:
+            targets = {name: (edge, thumbnail_path(photo_id, name)) for name, edge in THUMBNAIL_SIZES.items()}
+            future = self._pool().submit(render_thumbnails, source, targets, PHOTO_THUMBNAIL_QUALITY)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        self._slots.release()
+        if future.exception() is not None:
+            logger.warning('Thumbnail generation failed', extra={'error': str(future.exception())})
+
+    def render(self, photo_id, source):
+        """Generate thumbnails and wait for them."""
+        try:
+            return self.submit(photo_id, source).result(timeout=self.timeout)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool on the next request
+            with self._lock:
+                self._executor = None
+            raise
+
+
+thumbnail_pool = ThumbnailPool(
+    max_workers=int(os.getenv('PHOTO_POOL_SIZE', 2)),
+    max_queue=int(os.getenv('PHOTO_QUEUE_LIMIT', 16)),
+    timeout=float(os.getenv('PHOTO_TIMEOUT', 10))
+)
+
+
+def store_photo(data):
+    """
+    Store image bytes under their SHA-256 and queue thumbnail generation.
+    Identical uploads map to the same id and are written only once.
+    Returns (photo_id, created).
+    """
+    if not data:
+        raise InvalidPhoto('Empty photo')
+    if len(data) > PHOTO_MAX_BYTES:
+        raise InvalidPhoto(f'Photo is larger than the {PHOTO_MAX_BYTES} byte limit')
+
+    photo_id = hashlib.sha256(data).hexdigest()
+    if original_path(photo_id):
+        return photo_id, False
+
+    # Only the header is read here; pixels are decoded in the worker process
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            fmt = image.format
+    except (UnidentifiedImageError, OSError):
+        raise InvalidPhoto('File is not a supported image')
+    if fmt not in PHOTO_FORMATS:
+        raise InvalidPhoto(f"Unsupported image format, expected one of {', '.join(PHOTO_FORMATS)}")
+
+    os.makedirs(photo_dir(photo_id), exist_ok=True)
+    path = os.path.join(photo_dir(photo_id), f'original.{PHOTO_FORMATS[fmt]}')
+    write_atomic(path, data)
+
+    try:
+        thumbnail_pool.submit(photo_id, path)
+    except PhotoPoolBusy:
+        # Missing sizes are rendered on first request instead
+        logger.info('Thumbnail pool busy, deferring thumbnails', extra={'photo_id': photo_id})
+    return photo_id, True
+
+
+def ensure_thumbnail(photo_id, size):
+    """
+    Path of a thumbnail, rendering it first if it is missing; None for
+    unknown photos. Raises PhotoRenderError if the original cannot be
+    rendered; pool timeouts and crashed workers propagate as they are.
+    """
+    path = thumbnail_path(photo_id, size)
+    if os.path.exists(path):
+        return path
+    source = original_path(photo_id)
+    if source is None:
+        return None
+    try:
+        thumbnail_pool.render(photo_id, source)
+    except (FutureTimeout, BrokenProcessPool):
+        # Faults of the pool, not the image; TimeoutError is also an OSError
+        raise
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # UnidentifiedImageError is an OSError: a corrupt or truncated original
+        raise PhotoRenderError(str(e)) from e
+    return path
+
+
+def _load(value):
+    if not value:
+        return []
+    if isinstance(value, (bytes, str)):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return [value] if isinstance(value, str) else []
+    return value if isinstance(value, list) else [value]
+
+
+def normalize_photos(value):
+    """
+    Turn a photos field from a request into the compact JSON stored in the
+    row: a list of photo ids. Inline base64 images are stored and replaced
+    by their id, and plain URLs are kept as external references. Every
+    entry is checked before any image is decoded or written, so a rejected
+    request leaves nothing behind in storage.
+    """
+    items = _load(value)
+    if len(items) > PHOTO_MAX_PER_ITEM:
+        raise InvalidPhoto(f'At most {PHOTO_MAX_PER_ITEM} photos are allowed')
+
+    references = []
+    for item in items:
+        if isinstance(item, dict):
+            item = item.get('id') or item.get('url')
+        if not isinstance(item, str) or not item:
+            raise InvalidPhoto('Photos must be photo ids, URLs or base64 data URIs')
+        if is_photo_id(item) and original_path(item) is None:
+            raise InvalidPhoto(f'Unknown photo {item}')
+        references.append(item)
+
+    for i, item in enumerate(references):
+        if _DATA_URI.match(item):
+            try:
+                data = base64.b64decode(item[item.index(',') + 1:], validate=True)
+            except ValueError:
+                raise InvalidPhoto('Photo data URI is not valid base64')
+            references[i], _ = store_photo(data)
+    return json.dumps(list(dict.fromkeys(references)))
+
+
+def photo_urls(photo_id):
+    base = f'{PHOTO_BASE_URL}/{photo_id}'
+    return {
+        'id': photo_id,
+        'thumbnails': {name: f'{base}/{name}' for name in THUMBNAIL_SIZES},
+        'url': f'{base}/original'
+    }
+
+
+def photo_refs(value):
+    """
+    Photos of a row as the API returns them: thumbnail and original URLs for
+    stored photos, the URL itself for external ones. Inline images left in
+    rows from before photo storage are skipped; `flask migrate-photos`
+    moves them into storage.
+    """
+    refs = []
+    for item in _load(value):
+        if is_photo_id(item):
+            refs.append(photo_urls(item))
+        elif isinstance(item, str) and not _DATA_URI.match(item):
+            refs.append({'id': None, 'thumbnails': {}, 'url': item})
+    return refs
+
+
+# Tables whose photos column may still hold inline images
+PHOTO_COLUMNS = ('feedback', 'business_certification')
+
+
+def migrate_photos(conn, batch_size=200):
+    """
+    Move inline base64 images still held in photos columns into photo
+    storage, leaving photo ids in the rows. Returns the number of rows changed.
+    """
+    changed = 0
+    for table in PHOTO_COLUMNS:
+        last_id = 0
+        while True:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"""
+                    SELECT id, photos FROM {table}
+                    WHERE id > %s AND photos LIKE '%%data:image%%'
+                    ORDER BY id
+                    LIMIT %s
+                """, (last_id, batch_size))
+                rows = cursor.fetchall()
+                for row in rows:
+                    last_id = row['id']
+                    try:
+                        photos = normalize_photos(row['photos'])
+                    except InvalidPhoto as e:
+                        logger.warning('Skipping unreadable photos', extra={
+                            'table': table, 'id': row['id'], 'error': str(e)
+                        })
+                        continue
+                    cursor.execute(f"UPDATE {table} SET photos = %s WHERE id = %s", (photos, row['id']))
+                    changed += 1
+                conn.commit()
+            finally:
+                cursor.close()
+            if len(rows) < batch_size:
+                break
+    return changed
+
+
+def init_app(app):
+    @app.cli.command('migrate-photos')
+    def migrate_photos_command():
+        """Move inline base64 photos out of feedback and certification rows into photo storage."""
+        rows = migrate_photos(get_db_connection())
+        click.echo(f'Moved photos of {rows} rows into photo storage')
@@ -0,0 +1,91 @@
+import os
+import logging
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from flask import Blueprint, request, jsonify, send_file
+from .auth_middleware import token_required
+from .photo_store import (
+    PHOTO_MAX_BYTES, PHOTO_MAX_PER_ITEM, PHOTO_MIMETYPES, THUMBNAIL_SIZES,
+    InvalidPhoto, PhotoPoolBusy, PhotoRenderError, ensure_thumbnail, is_photo_id, original_path, photo_urls, store_photo
+)
+
+logger = logging.getLogger(__name__)
+
+photos_bp = Blueprint('photos', __name__)
+
+# Content-addressed files never change, so clients and proxies may keep them indefinitely
+PHOTO_MAX_AGE = 365 * 24 * 3600
+
+def _busy_response():
+    """Shed load quickly while the thumbnail pool is saturated."""
+    response = jsonify({'message': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@photos_bp.route('', methods=['POST'])
+@token_required(roles=['consumer', 'business'])
+def upload_photos(user_id, role):
+    """
+    Store uploaded images (multipart field `photos`, repeated, or `photo`).
+    Returns an id per photo to put in a feedback or certification `photos`
+    list, with its thumbnail URLs. Uploading the same image twice returns
+    the same id.
+    """
+    uploads = request.files.getlist('photos') or request.files.getlist('photo')
+
+    if not uploads:
+        return jsonify({'success': False, 'message': 'No photos provided'}), 400
+    if len(uploads) > PHOTO_MAX_PER_ITEM:
+        return jsonify({
+            'success': False,
+            'message': f'At most {PHOTO_MAX_PER_ITEM} photos can be uploaded at once'
+        }), 400
+
+    try:
+        stored = []
+        for upload in uploads:
+            # Read one byte past the limit so oversized files are caught without reading them whole
+            photo_id, created = store_photo(upload.read(PHOTO_MAX_BYTES + 1))
+            stored.append(dict(photo_urls(photo_id), created=created))
+
+        return jsonify({
+            'success': True,
+            'photos': stored
+        }), 201
+
+    except InvalidPhoto as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error storing photos: {str(e)}'}), 500
+
+@photos_bp.route('/<photo_id>/<size>', methods=['GET'])
+def get_photo(photo_id, size):
+    """Serve a stored photo at one of the thumbnail sizes or as the original upload"""
+    if not is_photo_id(photo_id) or (size != 'original' and size not in THUMBNAIL_SIZES):
+        return jsonify({'message': 'Photo not found'}), 404
+
+    try:
+        if size == 'original':
+            path = original_path(photo_id)
+        else:
+            path = ensure_thumbnail(photo_id, size)
+    except (PhotoPoolBusy, FutureTimeout):
+        return _busy_response()
+    except BrokenProcessPool as e:
+        logger.error('Thumbnail worker crashed', extra={'photo_id': photo_id, 'size': size, 'error': str(e)})
+        return _busy_response()
+    except PhotoRenderError as e:
+        logger.warning('Photo could not be rendered', extra={'photo_id': photo_id, 'size': size, 'error': str(e)})
+        return jsonify({'message': 'Photo could not be rendered'}), 422
+
+    if path is None:
+        return jsonify({'message': 'Photo not found'}), 404
+
+    ext = os.path.splitext(path)[1].lstrip('.')
+    response = send_file(
+        path, mimetype=PHOTO_MIMETYPES[ext], max_age=PHOTO_MAX_AGE,
+        etag=f'{photo_id}-{size}', conditional=True
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,89 @@
+import os
+from .cache import TTLCache
+from .bloom import normalize_code, product_filter
+from .steps import Query, drive
+
+# Product row joined with its business listing, shared by every scan path
+PRODUCT_SELECT = """
+    SELECT p.id, p.business_id, p.product_name, p.product_code, p.category,
+           p.description, p.certification_status, p.certification_details,
+           p.created_at, p.updated_at,
+           b.id AS listing_id, b.business_name,
+           b.certification_status AS business_certification_status,
+           DATE_FORMAT(b.certified_date, '%%Y-%%m-%%d') AS certified_date
+    FROM products p
+    LEFT JOIN businesses b ON p.business_id = b.id
+"""
+
+PRODUCT_BY_CODE_QUERY = PRODUCT_SELECT + "WHERE p.product_code = %s"
+
+product_cache = TTLCache(
+    maxsize=int(os.getenv('PRODUCT_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('PRODUCT_CACHE_TTL', 300))
+)
+
+
+def find_product(product_code):
+    """
+    Look up a product by its code, serving repeat scans from the cache.
+    Returns a copy of the row so callers are free to modify it. A step
+    generator (app/steps.py), for handlers shared with the ASGI server.
+    """
+    product = product_cache.get(product_code)
+
+    if product is None:
+        # Codes the filter has never seen are definitely not in the table
+        if not product_filter.might_contain(product_code):
+            return None
+        product = yield Query(PRODUCT_BY_CODE_QUERY, (product_code,), fetch='one')
+        if not product:
+            return None
+        product_cache.set(product_code, product)
+
+    return dict(product)
+
+
+def get_product_by_code(cursor, product_code):
+    """find_product() on a synchronous cursor."""
+    return drive(find_product(product_code), cursor)
+
+
+def get_products_by_codes(cursor, product_codes):
+    """
+    Resolve many product codes at once.
+    Cached codes are served from memory and the rest are fetched with a
+    single IN (...) query. Returns a dict of requested code -> product row
+    copy, keyed by the codes as given: the column's collation also matches
+    case and trailing-space variants, which come back under the stored code.
+    """
+    products = {}
+    missing = {}
+    for code in dict.fromkeys(product_codes):
+        product = product_cache.get(code)
+        if product is None:
+            if product_filter.might_contain(code):
+                missing.setdefault(normalize_code(code), []).append(code)
+        else:
+            products[code] = dict(product)
+
+    if missing:
+        requested = [code for codes in missing.values() for code in codes]
+        placeholders = ', '.join(['%s'] * len(requested))
+        cursor.execute(PRODUCT_SELECT + f"WHERE p.product_code IN ({placeholders})", tuple(requested))
+        for product in cursor.fetchall():
+            for code in missing.get(normalize_code(product['product_code']), ()):
+                product_cache.set(code, product)
+                products[code] = dict(product)
+
+    return products
+
+
+def invalidate_product(product_code):
+    """Forget a single product code, e.g. after it is registered."""
+    product_cache.pop(product_code)
+    product_filter.add(product_code)
+
+
+def invalidate_business(business_id):
+    """Forget every cached product owned by a business."""
+    return product_cache.discard_where(lambda product: product['business_id'] == business_id)
@@ -0,0 +1,442 @@
+import io
+import os
+import csv
+import json
+import logging
+import threading
+from datetime import datetime
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.sansio.multipart import NEED_DATA, Data, Epilogue, Field, File, MultipartDecoder
+from .bloom import normalize_code
+from .product_cache import invalidate_product
+from .dashboard import invalidate_snapshot
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+FIELD_LIMITS = {'product_code': 255, 'product_name': 255, 'category': 100, 'description': None}
+
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', 50 * 1024 * 1024))
+IMPORT_JOB_MIN_BYTES = int(os.getenv('IMPORT_JOB_MIN_BYTES', 256 * 1024))
+IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', 1000))
+IMPORT_MAX_CONCURRENT = int(os.getenv('IMPORT_MAX_CONCURRENT', 4))
+
+# Bytes read from the request body at a time
+READ_SIZE = 64 * 1024
+# Largest plain form field (e.g. `format`) accepted alongside a multipart upload
+FORM_FIELD_MAX_BYTES = 64 * 1024
+
+# Existing rows are only touched when they belong to the importing business;
+# blank optional fields keep the stored value
+UPSERT_QUERY = """
+    INSERT INTO products (business_id, product_name, product_code, category, description)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        product_name = IF(business_id = VALUES(business_id), VALUES(product_name), product_name),
+        category = IF(business_id = VALUES(business_id), COALESCE(VALUES(category), category), category),
+        description = IF(business_id = VALUES(business_id), COALESCE(VALUES(description), description), description)
+"""
+
+
+class InvalidImport(ValueError):
+    """Raised when an upload cannot be imported at all (unknown format, too large)."""
+
+
+class ImportBusy(Exception):
+    """Raised when IMPORT_MAX_CONCURRENT imports are already running."""
+
+
+# Every running import holds a request thread and a database connection
+_slots = threading.BoundedSemaphore(IMPORT_MAX_CONCURRENT)
+
+
+def detect_format(requested, filename, content_type):
+    """Pick csv or jsonl from the `format` parameter, the file extension or the content type."""
+    if requested:
+        fmt = requested.lower()
+        if fmt == 'ndjson':
+            fmt = 'jsonl'
+        if fmt not in IMPORT_FORMATS:
+            raise InvalidImport(f"Unsupported format '{requested}', expected csv or jsonl")
+        return fmt
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines'):
+        return 'jsonl'
+    raise InvalidImport('Could not tell the file format; pass format=csv or format=jsonl')
+
+
+class UploadReader(io.RawIOBase):
+    """
+    Binary stream over the uploaded file of a request, read from the
+    request body as it arrives so rows can be parsed before the upload has
+    finished. With a multipart boundary the body is decoded incrementally
+    and the stream covers the `file` part; fields sent before it (e.g.
+    `format`) are collected in `fields`. bytes_read counts raw body bytes,
+    for progress, and reading past max_bytes raises InvalidImport.
+    """
+
+    def __init__(self, stream, boundary=None, max_bytes=IMPORT_MAX_BYTES, field='file'):
+        self._stream = stream
+        self._pending = memoryview(b'')
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.filename = None
+        self.content_type = None
+        self.fields = {}
+        if boundary:
+            self._chunks = self._open_part(boundary, field)
+        else:
+            self._chunks = iter(self._read_body, b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def _read_body(self):
+        data = self._stream.read(READ_SIZE)
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_bytes:
+            raise InvalidImport(f'File is larger than the {self.max_bytes} byte import limit')
+        return data
+
+    def _events(self, boundary):
+        # Events are drained after every read, so the decoder never buffers much more than one read
+        decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=4 * READ_SIZE)
+        complete = False
+        try:
+            while True:
+                event = decoder.next_event()
+                if event is NEED_DATA:
+                    if complete:
+                        raise InvalidImport('Upload ended before the multipart body was complete')
+                    data = self._read_body()
+                    complete = not data
+                    decoder.receive_data(data or None)
+                    continue
+                yield event
+                if isinstance(event, Epilogue):
+                    return
+        except RequestEntityTooLarge:
+            raise InvalidImport('Malformed multipart upload: part headers are too long')
+        except ValueError as e:
+            if isinstance(e, InvalidImport):
+                raise
+            raise InvalidImport(f'Malformed multipart upload: {e}')
+
+    def _open_part(self, boundary, field):
+        """Advance to the file part, collecting the fields before it; returns its data chunks."""
+        events = self._events(boundary)
+        name, value = None, []
+        for event in events:
+            if isinstance(event, File) and event.name == field:
+                self.filename = event.filename
+                self.content_type = event.headers.get('Content-Type')
+                return self._part_data(events)
+            if isinstance(event, (Field, File)):
+                name, value = (event.name if isinstance(event, Field) else None), []
+            elif isinstance(event, Data) and name is not None:
+                value.append(event.data)
+                if sum(map(len, value)) > FORM_FIELD_MAX_BYTES:
+                    raise InvalidImport(f'Form fields are limited to {FORM_FIELD_MAX_BYTES} bytes')
+                if not event.more_data:
+                    self.fields[name] = b''.join(value).decode('utf-8', 'replace')
+        raise InvalidImport(f"No '{field}' file in the upload")
+
+    @staticmethod
+    def _part_data(events):
+        for event in events:
+            if not isinstance(event, Data):
+                return
+            if event.data:
+                yield event.data
+            if not event.more_data:
+                return
+
+
+def iter_records(stream, fmt):
+    """
+    Yield (row_number, record) from a binary stream, one row at a time.
+    record is a dict, or an error string for a line that could not be parsed.
+    """
+    if isinstance(stream, io.RawIOBase):
+        stream = io.BufferedReader(stream, READ_SIZE)
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            reader = csv.reader(text)
+            header = next(reader, None)
+            if header is None:
+                return
+            header = [name.strip().lower() for name in header]
+            for row_number, values in enumerate(reader, start=1):
+                if not any(value.strip() for value in values):
+                    continue
+                yield row_number, dict(zip(header, values))
+        else:
+            for row_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield row_number, 'Invalid JSON'
+                    continue
+                if not isinstance(record, dict):
+                    yield row_number, 'Each line must be a JSON object'
+                    continue
+                yield row_number, {str(key).lower(): value for key, value in record.items()}
+    finally:
+        # Leave the underlying file open for the caller
+        text.detach()
+
+
+def clean_record(record):
+    """Validate one record; returns (product fields, None) or (None, error message)."""
+    product = {}
+    for field, limit in FIELD_LIMITS.items():
+        value = record.get(field)
+        if value is not None and not isinstance(value, str):
+            value = str(value)
+        value = value.strip() if value else None
+        if limit and value and len(value) > limit:
+            return None, f'{field} is longer than {limit} characters'
+        product[field] = value or None
+    if not product['product_code']:
+        return None, 'product_code is required'
+    if not product['product_name']:
+        return None, 'product_name is required'
+    return product, None
+
+
+class ProductImporter:
+    """
+    Streams records into products for one business in chunks: each chunk
+    is checked against existing codes with one IN (...) query and written
+    with one multi-row INSERT ... ON DUPLICATE KEY UPDATE, then committed.
+    """
+
+    def __init__(self, conn, business_id, chunk_size=IMPORT_CHUNK_SIZE, max_errors=IMPORT_MAX_ERRORS,
+                 progress=None):
+        self.conn = conn
+        self.business_id = business_id
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.progress = progress
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+        self._seen = {}
+
+    def _error(self, row_number, product_code, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'product_code': product_code, 'error': message})
+
+    def run(self, records):
+        chunk = []
+        for row_number, record in records:
+            self.rows += 1
+            if isinstance(record, str):
+                self._error(row_number, None, record)
+                continue
+            product, error = clean_record(record)
+            if error:
+                self._error(row_number, record.get('product_code'), error)
+                continue
+
+            # Codes compare the way MySQL's collation does, so 'ab ' and 'AB' collide
+            key = normalize_code(product['product_code'])
+            first_row = self._seen.get(key)
+            if first_row is not None:
+                self._error(row_number, product['product_code'], f'Duplicate product code in file (row {first_row})')
+                continue
+            self._seen[key] = row_number
+
+            chunk.append((row_number, product))
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = []
+        if chunk:
+            self._flush(chunk)
+        invalidate_snapshot(self.business_id)
+        return self.report()
+
+    def _flush(self, chunk):
+        cursor = self.conn.cursor()
+        try:
+            codes = [product['product_code'] for _, product in chunk]
+            placeholders = ', '.join(['%s'] * len(codes))
+            cursor.execute(
+                f"SELECT product_code, business_id FROM products WHERE product_code IN ({placeholders})",
+                tuple(codes)
+            )
+            owners = {normalize_code(row['product_code']): row['business_id'] for row in cursor.fetchall()}
+
+            rows = []
+            for row_number, product in chunk:
+                owner = owners.get(normalize_code(product['product_code']), self.business_id)
+                if owner != self.business_id:
+                    self._error(row_number, product['product_code'], 'Product code is registered to another business')
+                    continue
+                if normalize_code(product['product_code']) in owners:
+                    self.updated += 1
+                else:
+                    self.inserted += 1
+                rows.append((self.business_id, product['product_name'], product['product_code'],
+                             product['category'], product['description']))
+
+            if rows:
+                # PyMySQL folds executemany() on INSERT ... VALUES into one statement
+                cursor.executemany(UPSERT_QUERY, rows)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        for _, _, code, _, _ in rows:
+            invalidate_product(code)
+        if self.progress:
+            self.progress(self)
+
+    def report(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed - len(self.errors)
+        }
+
+
+def create_job(cursor, business_id, fmt, filename, size):
+    cursor.execute("""
+        INSERT INTO product_imports (business_id, filename, format, status, bytes_total)
+        VALUES (%s, %s, %s, 'running', %s)
+    """, (business_id, filename, fmt, size))
+    return cursor.lastrowid
+
+
+JOB_COLUMNS = """
+    id, filename, format, status, bytes_total, bytes_processed, rows_processed,
+    inserted, updated, failed, errors, message, created_at, finished_at
+"""
+
+
+def _job_view(job):
+    job['errors'] = json.loads(job['errors']) if job['errors'] else []
+    job['progress'] = (
+        round(100.0 * job['bytes_processed'] / job['bytes_total'], 1) if job['bytes_total'] else 0.0
+    )
+    return job
+
+
+def get_job(cursor, job_id, business_id):
+    cursor.execute(f"""
+        SELECT {JOB_COLUMNS}
+        FROM product_imports
+        WHERE id = %s AND business_id = %s
+    """, (job_id, business_id))
+    job = cursor.fetchone()
+    return _job_view(job) if job else None
+
+
+def list_jobs(cursor, business_id, limit=20):
+    """A business's most recent imports, newest first, including any still running."""
+    cursor.execute(f"""
+        SELECT {JOB_COLUMNS}
+        FROM product_imports
+        WHERE business_id = %s
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, (business_id, limit))
+    return [_job_view(job) for job in cursor.fetchall()]
+
+
+def _update_job(conn, job_id, **fields):
+    assignments = ', '.join(f'{name} = %s' for name in fields)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"UPDATE product_imports SET {assignments} WHERE id = %s", (*fields.values(), job_id))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def _run_job(conn, business_id, upload, fmt, filename, size):
+    """Import while recording progress in product_imports after every chunk."""
+    cursor = conn.cursor()
+    try:
+        job_id = create_job(cursor, business_id, fmt, filename, size or 0)
+        conn.commit()
+    finally:
+        cursor.close()
+
+    def progress(importer):
+        _update_job(conn, job_id, bytes_processed=upload.bytes_read, rows_processed=importer.rows,
+                    inserted=importer.inserted, updated=importer.updated, failed=importer.failed)
+
+    importer = ProductImporter(conn, business_id, progress=progress)
+    try:
+        report = importer.run(iter_records(upload, fmt))
+    except Exception as e:
+        logger.exception('Product import failed', extra={'job_id': job_id, 'business_id': business_id})
+        try:
+            # Chunks committed before the failure stay imported; the counts say how many
+            _update_job(conn, job_id, status='failed', message=str(e), bytes_processed=upload.bytes_read,
+                        rows_processed=importer.rows, inserted=importer.inserted, updated=importer.updated,
+                        failed=importer.failed, errors=json.dumps(importer.errors), finished_at=datetime.now())
+        except Exception:
+            logger.exception('Could not record import failure', extra={'job_id': job_id})
+        raise
+
+    # Chunked uploads have no Content-Length; the total is known now
+    _update_job(conn, job_id, status='completed', bytes_total=max(size or 0, upload.bytes_read),
+                bytes_processed=max(size or 0, upload.bytes_read), rows_processed=report['rows'],
+                inserted=report['inserted'], updated=report['updated'], failed=report['failed'],
+                errors=json.dumps(report['errors']), finished_at=datetime.now())
+    logger.info('Product import finished', extra={
+        'job_id': job_id, 'business_id': business_id, 'rows': report['rows'],
+        'inserted': report['inserted'], 'updated': report['updated'], 'failed': report['failed']
+    })
+    return report, job_id
+
+
+def import_products(conn, business_id, upload, fmt, filename=None, size=None):
+    """
+    Import an upload for a business, parsing rows as they are read from
+    upload (an UploadReader) and writing them chunk by chunk. Uploads of
+    unknown size or over IMPORT_JOB_MIN_BYTES are recorded as a job in
+    product_imports, whose progress can be polled while the upload is
+    still running. Returns (report, job id or None).
+    """
+    if not _slots.acquire(blocking=False):
+        raise ImportBusy('Too many imports in progress')
+    try:
+        if size is not None and size <= IMPORT_JOB_MIN_BYTES:
+            return ProductImporter(conn, business_id).run(iter_records(upload, fmt)), None
+        return _run_job(conn, business_id, upload, fmt, filename, size)
+    finally:
+        _slots.release()
@@ -1,108 +1,227 @@
 import os
-from flask import Blueprint, request, jsonify
 from datetime import datetime
+from flask import Blueprint, request, jsonify
 from .database import get_db_connection
 from .auth_middleware import token_required
+from .product_cache import find_product, get_product_by_code, get_products_by_codes, invalidate_product
+from .verification_log import insert_verifications
+from .bloom import product_filter
+from .ratings import get_aggregate, summarize
+from .dashboard import invalidate_snapshot
+from .etags import make_etag, not_modified, with_etag
+from .photo_store import photo_refs
+from .steps import RecordVerification, Reply, run
+from .product_import import (
+    IMPORT_MAX_BYTES, UploadReader, import_products, detect_format, get_job, list_jobs, InvalidImport, ImportBusy
+)
 
 products_bp = Blueprint('products', __name__)
 
-@products_bp.route('/verify', methods=['POST'])
-@token_required(roles=['consumer'])
-def verify_product(user_id, role):
-    data = request.get_json()
-    
-    if not data or 'barcode' not in data:
-        return jsonify({'message': 'No barcode provided'}), 400
+# Largest offline scan queue accepted by /verify/batch
+MAX_VERIFY_BATCH = int(os.getenv('VERIFY_BATCH_MAX', 500))
+VERIFICATION_METHODS = ('barcode_scan', 'manual_code', 'qr_code')
+
+def barcode_verification(data):
+    """POST /verify, shared with the ASGI server: the business a scanned barcode belongs to."""
+    if not isinstance(data, dict) or 'barcode' not in data:
+        return Reply({'message': 'No barcode provided'}, 400)
     
     barcode = data['barcode']
     
+    # Reject unknown codes before borrowing a database connection
+    if not product_filter.might_contain(barcode):
+        return Reply({
+            'message': 'Product not found',
+            'status': 'unverified'
+        }, 404)
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Find the product by barcode (product_code)
-        cursor.execute(
-            "SELECT * FROM products WHERE product_code = %s", 
-            (barcode,)
-        )
-        
-        product = cursor.fetchone()
+        product = yield from find_product(barcode)
         
         if not product:
-            return jsonify({
+            return Reply({
                 'message': 'Product not found',
                 'status': 'unverified'
-            }), 404
+            }, 404)
         
         # Return the business ID that owns this product
-        return jsonify({
+        return Reply({
             'message': 'Product verified',
             'status': 'success',
             'product_id': product['id'],
             'business_id': product['business_id']
-        }), 200
+        })
         
     except Exception as e:
-        return jsonify({'message': f'Error: {str(e)}'}), 500
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'conn' in locals() and conn:
-            conn.close()
+        return Reply({'message': f'Error: {str(e)}'}, 500)
+
+@products_bp.route('/verify', methods=['POST'])
+@token_required(roles=['consumer'])
+def verify_product(user_id, role):
+    return run(barcode_verification(request.get_json(silent=True)))
+
+def code_lookup_result(product):
+    """
+    Fields GET /verify returns for a cached product row. As before caching,
+    certification_status is the business's status; the product's own is
+    product_certification_status.
+    """
+    return {
+        'id': product['id'],
+        'business_id': product['business_id'],
+        'product_name': product['product_name'],
+        'product_code': product['product_code'],
+        'category': product['category'],
+        'description': product['description'],
+        'certification_details': product['certification_details'],
+        'created_at': product['created_at'],
+        'updated_at': product['updated_at'],
+        'business_name': product['business_name'],
+        'certification_status': product['business_certification_status'],
+        'certified_date': product['certified_date'],
+        'product_certification_status': product['certification_status']
+    }
+
+def code_verification(product_code):
+    """GET /verify, shared with the ASGI server."""
+    if not product_code:
+        return Reply({
+            'success': False,
+            'message': 'No product code provided'
+        }, 400)
+    
+    # Reject unknown codes before borrowing a database connection
+    if not product_filter.might_contain(product_code):
+        return Reply({
+            'success': False,
+            'message': 'Product not found'
+        }, 404)
+    
+    try:
+        # Get product details including business information
+        product = yield from find_product(product_code)
+        
+        if not product or product['listing_id'] is None:
+            return Reply({
+                'success': False,
+                'message': 'Product not found'
+            }, 404)
+        
+        # Save verification record (written in the background)
+        yield RecordVerification(product['id'], None, 'manual_code')
+        
+        return Reply({
+            'success': True,
+            'product': code_lookup_result(product)
+        })
+        
+    except Exception as e:
+        return Reply({
+            'success': False, 
+            'message': f'Error verifying product: {str(e)}'
+        }, 500)
 
 @products_bp.route('/verify', methods=['GET'])
 def verify_product_by_code():
     """Verify a product using its code (used by the new consumer interface)"""
-    product_code = request.args.get('code')
+    return run(code_verification(request.args.get('code')))
+
+@products_bp.route('/verify/batch', methods=['POST'])
+@token_required(roles=['consumer', 'business'])
+def verify_products_batch(user_id, role):
+    """
+    Verify a queue of offline scans in one request.
+    Accepts either {"codes": [...]} or {"scans": [{"product_code", "method", "scanned_at"}]}
+    and returns one result per scan, in the order they were sent.
+    """
+    data = request.get_json()
+    items = (data.get('scans') or data.get('codes')) if isinstance(data, dict) else None
     
-    if not product_code:
+    if not items or not isinstance(items, list):
         return jsonify({
             'success': False,
-            'message': 'No product code provided'
+            'message': 'No product codes provided'
+        }), 400
+    
+    # Normalise both payload shapes into (code, method, scanned_at) tuples
+    scans = []
+    for item in items:
+        if isinstance(item, dict):
+            code = item.get('product_code') or item.get('barcode')
+            method = item.get('method') or ('barcode_scan' if item.get('barcode') else 'manual_code')
+            scanned_at = item.get('scanned_at')
+        else:
+            code, method, scanned_at = item, 'manual_code', None
+        scans.append((str(code).strip() if code else '', method, scanned_at))
+    
+    if len(scans) > MAX_VERIFY_BATCH:
+        return jsonify({
+            'success': False,
+            'message': f'At most {MAX_VERIFY_BATCH} product codes can be verified per request'
         }), 400
     
     try:
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get product details including business information
-        query = """
-        SELECT p.*, b.business_name, b.certification_status, 
-               DATE_FORMAT(b.certified_date, '%Y-%m-%d') as certified_date
-        FROM products p
-        JOIN businesses b ON p.business_id = b.id
-        WHERE p.product_code = %s
-        """
-        
-        cursor.execute(query, (product_code,))
-        product = cursor.fetchone()
+        cursor = conn.cursor()
         
-        if not product:
-            return jsonify({
-                'success': False,
-                'message': 'Product not found'
-            }), 404
+        # Resolve every distinct code with a single IN (...) lookup
+        products = get_products_by_codes(cursor, [code for code, _, _ in scans if code])
         
-        # Save verification record
+        results = []
+        verifications = []
         now = datetime.now()
-        verification_query = """
-        INSERT INTO product_verifications 
-        (product_id, verification_date, verification_method)
-        VALUES (%s, %s, 'manual_code')
-        """
-        
-        cursor.execute(verification_query, (product['id'], now))
-        conn.commit()
+        for code, method, scanned_at in scans:
+            product = products.get(code)
+            
+            if not product or product['listing_id'] is None:
+                results.append({
+                    'product_code': code,
+                    'success': False,
+                    'message': 'Product not found'
+                })
+                continue
+            
+            if method not in VERIFICATION_METHODS:
+                method = 'manual_code'
+            try:
+                verified_at = datetime.fromisoformat(scanned_at) if scanned_at else now
+            except (TypeError, ValueError):
+                verified_at = now
+            verifications.append((product['id'], user_id, verified_at, method))
+            
+            results.append({
+                'product_code': code,
+                'success': True,
+                'product': {
+                    'id': product['id'],
+                    'product_name': product['product_name'],
+                    'product_code': product['product_code'],
+                    'category': product['category'],
+                    'description': product['description'],
+                    'certification_status': product['certification_status'],
+                    'certified_date': product['certified_date'],
+                    'business_name': product['business_name'],
+                    'business_id': product['listing_id']
+                }
+            })
+        
+        # Log all verifications with one multi-row insert
+        if verifications:
+            insert_verifications(cursor, verifications)
+            conn.commit()
         
         return jsonify({
             'success': True,
-            'product': product
+            'results': results,
+            'verified': len(verifications),
+            'not_found': len(results) - len(verifications)
         }), 200
         
     except Exception as e:
         return jsonify({
-            'success': False, 
-            'message': f'Error verifying product: {str(e)}'
+            'success': False,
+            'message': f'Error verifying products: {str(e)}'
         }), 500
     finally:
         if 'cursor' in locals() and cursor:
@@ -123,12 +242,7 @@ def get_product_details(user_id, role):
         cursor = conn.cursor()
         
         # Get product details
-        cursor.execute(
-            "SELECT * FROM products WHERE product_code = %s", 
-            (product_code,)
-        )
-        
-        product = cursor.fetchone()
+        product = get_product_by_code(cursor, product_code)
         
         if not product:
             return jsonify({'message': 'Product not found'}), 404
@@ -139,7 +253,7 @@ def get_product_details(user_id, role):
         cursor.execute("""
             SELECT u.id, u.full_name, bc.business_name, bc.status AS certification_status,
                 bc.cleanliness_rating, bc.is_vegetarian, bc.is_vegan, bc.cruelty_free,
-                bc.photos
+                bc.photos, bc.version, bc.updated_at
             FROM users u
             JOIN business_certification bc ON u.id = bc.user_id
             WHERE u.id = %s
@@ -150,6 +264,18 @@ def get_product_details(user_id, role):
         if not business:
             return jsonify({'message': 'Business not found'}), 404
         
+        # Certification and rating versions cover everything below, so a
+        # client holding the current ETag skips the feedback query
+        aggregate = get_aggregate(cursor, 'product', product['id'])
+        etag = make_etag(
+            'product-details', product['id'], product['certification_status'],
+            business['version'], business['updated_at'],
+            aggregate['version'] if aggregate else None
+        )
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
         # Get feedback for the product
         cursor.execute("""
             SELECT f.id, u.full_name AS user_name, f.feedback_text, f.rating, 
@@ -162,11 +288,8 @@ def get_product_details(user_id, role):
         
         feedback = cursor.fetchall()
         
-        # Calculate average rating
-        average_rating = 0
-        if feedback:
-            total_rating = sum(item['rating'] for item in feedback)
-            average_rating = total_rating / len(feedback)
+        # Average rating comes from the running aggregate
+        rating = summarize(aggregate)
         
         # Prepare response data
         business_data = {
@@ -177,9 +300,9 @@ def get_product_details(user_id, role):
             'is_vegetarian': bool(business['is_vegetarian']),
             'is_vegan': bool(business['is_vegan']),
             'cruelty_free': bool(business['cruelty_free']),
-            'photos': [] if not business['photos'] else business['photos'],
+            'photos': photo_refs(business['photos']),
             'feedback': [],
-            'average_rating': round(average_rating, 1)
+            'average_rating': rating['average_rating']
         }
         
         # Format feedback data
@@ -190,19 +313,19 @@ def get_product_details(user_id, role):
                 'feedback_text': item['feedback_text'],
                 'rating': item['rating'],
                 'upvotes': item['upvotes'],
-                'created_at': item['created_at'].isoformat() if item['created_at'] else None,
-                'photos': [] if not item['photos'] else item['photos']
+                'created_at': item['created_at'],
+                'photos': photo_refs(item['photos'])
             }
             business_data['feedback'].append(feedback_item)
         
-        return jsonify({
+        return with_etag(jsonify({
             'business': business_data,
             'product': {
                 'id': product['id'],
                 'product_code': product['product_code'],
                 'certification_status': product['certification_status']
             }
-        }), 200
+        }), etag), 200
         
     except Exception as e:
         return jsonify({'message': f'Error: {str(e)}'}), 500
@@ -246,6 +369,8 @@ def register_product(user_id, role):
         """, (user_id, product_name, product_code))
         
         conn.commit()
+        invalidate_product(product_code)
+        invalidate_snapshot(user_id)
         
         return jsonify({
             'message': 'Product registered successfully',
@@ -259,4 +384,89 @@ def register_product(user_id, role):
         if 'cursor' in locals() and cursor:
             cursor.close()
         if 'conn' in locals() and conn:
-            conn.close() 
\ No newline at end of file
+            conn.close()
+
+@products_bp.route('/import', methods=['POST'])
+@token_required(roles=['business'])
+def import_products_file(user_id, role):
+    """
+    Register a catalog from an uploaded CSV or JSONL file (multipart field `file`,
+    or the raw request body). Rows are parsed and written as the body is read,
+    and the response carries the per-row report. Large uploads are also recorded
+    as a job whose progress GET /import shows while they run.
+    """
+    # request.files and request.form would read the whole body first
+    if request.content_length is not None and request.content_length > IMPORT_MAX_BYTES:
+        return jsonify({
+            'success': False,
+            'message': f'File is larger than the {IMPORT_MAX_BYTES} byte import limit'
+        }), 400
+    boundary = request.mimetype_params.get('boundary') if request.mimetype == 'multipart/form-data' else None
+    
+    try:
+        upload = UploadReader(request.stream, boundary)
+        filename = upload.filename or request.args.get('filename')
+        content_type = upload.content_type if boundary else request.mimetype
+        fmt = detect_format(request.args.get('format') or upload.fields.get('format'), filename, content_type)
+        conn = get_db_connection()
+        report, job_id = import_products(conn, user_id, upload, fmt, filename, request.content_length)
+        
+        return jsonify({
+            'success': True,
+            'status': 'completed',
+            'job_id': job_id,
+            'report': report
+        }), 200
+        
+    except InvalidImport as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except ImportBusy:
+        response = jsonify({'success': False, 'message': 'Too many imports in progress, please try again shortly'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error importing products: {str(e)}'}), 500
+    finally:
+        if 'conn' in locals() and conn:
+            conn.close()
+
+@products_bp.route('/import', methods=['GET'])
+@token_required(roles=['business'])
+def list_import_jobs(user_id, role):
+    """The business's recent imports with their progress, newest first"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        return jsonify({'success': True, 'jobs': list_jobs(cursor, user_id)}), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+    finally:
+        if 'cursor' in locals() and cursor:
+            cursor.close()
+        if 'conn' in locals() and conn:
+            conn.close()
+
+@products_bp.route('/import/<int:job_id>', methods=['GET'])
+@token_required(roles=['business'])
+def get_import_job(user_id, role, job_id):
+    """Progress and, once finished, the per-row error report of an import"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        job = get_job(cursor, job_id, user_id)
+        
+        if not job:
+            return jsonify({'success': False, 'message': 'Import not found'}), 404
+        
+        return jsonify({'success': True, 'job': job}), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+    finally:
+        if 'cursor' in locals() and cursor:
+            cursor.close()
+        if 'conn' in locals() and conn:
+            conn.close()
@@ -0,0 +1,272 @@
+import math
+import click
+from .database import get_db_connection
+
+# Aggregates are kept per subject:
+#   product  - products.id, for product feedback
+#   business - business user id (products.business_id), rolled up from product feedback
+#   listing  - businesses.id, for business-level feedback from the directory
+SUBJECT_TYPES = ('product', 'business', 'listing')
+
+
+def _round_half_up(value):
+    # round() rounds halves to even; MySQL rounds them away from zero
+    return int(math.floor(float(value) + 0.5))
+
+
+def normalize_rating(rating):
+    """
+    The whole-star rating stored for a submitted value, or None if it is not
+    a number from 1 to 5. Handlers write this value to the feedback row and
+    pass the same value to record_rating, so the row and the aggregates agree.
+    """
+    if isinstance(rating, bool):
+        return None
+    try:
+        value = float(rating)
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= value <= 5:
+        return None
+    return _round_half_up(value)
+
+
+def _normalize_rating(rating):
+    if rating is None:
+        return None
+    return min(5, max(1, _round_half_up(rating)))
+
+
+def _apply(cursor, subject_type, subject_id, rating, delta):
+    column = f'rating_{rating}'
+    cursor.execute(f"""
+        INSERT INTO rating_aggregates
+            (subject_type, subject_id, rating_count, rating_sum, {column})
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            rating_count = rating_count + VALUES(rating_count),
+            rating_sum = rating_sum + VALUES(rating_sum),
+            {column} = {column} + VALUES({column}),
+            version = version + 1
+    """, (subject_type, subject_id, delta, delta * rating, delta))
+
+
+def _retract(cursor, subject_type, subject_id, rating):
+    """
+    Take one rating back out of an aggregate. Returns False, changing
+    nothing, if the row is missing or holds no such rating to remove.
+    """
+    column = f'rating_{rating}'
+    cursor.execute(f"""
+        UPDATE rating_aggregates
+        SET rating_count = rating_count - 1,
+            rating_sum = rating_sum - %s,
+            {column} = {column} - 1,
+            version = version + 1
+        WHERE subject_type = %s AND subject_id = %s
+            AND rating_count > 0 AND {column} > 0 AND rating_sum >= %s
+    """, (rating, subject_type, subject_id, rating))
+    return cursor.rowcount > 0
+
+
+def touch(cursor, subjects):
+    """
+    Bump the version of each (subject_type, subject_id) without changing its
+    ratings, for feedback writes that leave the rating alone (text edits,
+    upvotes). Versions feed the ETags of feedback listings.
+    """
+    for subject_type, subject_id in subjects:
+        if subject_id is None:
+            continue
+        cursor.execute("""
+            INSERT INTO rating_aggregates (subject_type, subject_id, version)
+            VALUES (%s, %s, 1)
+            ON DUPLICATE KEY UPDATE version = version + 1
+        """, (subject_type, subject_id))
+
+
+def record_rating(cursor, subjects, new_rating, old_rating=None):
+    """
+    Update the aggregates of every (subject_type, subject_id) in subjects
+    for a feedback insert (old_rating=None) or a rating change, bumping
+    their versions even when the rating is unchanged.
+    Runs on the caller's cursor, after the feedback write, so it commits
+    with it. Callers changing a rating read old_rating with SELECT ... FOR
+    UPDATE, so concurrent edits of one feedback row apply their deltas in turn.
+    """
+    new_rating = _normalize_rating(new_rating)
+    old_rating = _normalize_rating(old_rating)
+    if new_rating == old_rating:
+        touch(cursor, subjects)
+        return
+
+    for subject_type, subject_id in subjects:
+        if subject_id is None:
+            continue
+        if old_rating is not None and not _retract(cursor, subject_type, subject_id, old_rating):
+            # The aggregate is missing or has drifted below this rating: recount it
+            # from feedback, which already includes this write, instead of going negative
+            rebuild_subject(cursor, subject_type, subject_id)
+            continue
+        if new_rating is not None:
+            _apply(cursor, subject_type, subject_id, new_rating, 1)
+
+
+def summarize(row):
+    """Turn an aggregate row into count, average and 1-5 distribution."""
+    if not row or not row['rating_count']:
+        return {
+            'count': 0,
+            'average_rating': 0,
+            'distribution': {'5': 0, '4': 0, '3': 0, '2': 0, '1': 0}
+        }
+    return {
+        'count': int(row['rating_count']),
+        'average_rating': round(row['rating_sum'] / row['rating_count'], 1),
+        'distribution': {str(star): int(row[f'rating_{star}']) for star in range(5, 0, -1)}
+    }
+
+
+AGGREGATE_QUERY = """
+    SELECT rating_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5, version
+    FROM rating_aggregates
+    WHERE subject_type = %s AND subject_id = %s
+"""
+
+
+def get_aggregate(cursor, subject_type, subject_id):
+    """The raw aggregate row of a single subject, including its version, or None."""
+    cursor.execute(AGGREGATE_QUERY, (subject_type, subject_id))
+    return cursor.fetchone()
+
+
+def get_rating(cursor, subject_type, subject_id):
+    """Read the rating summary of a single subject in O(1)."""
+    return summarize(get_aggregate(cursor, subject_type, subject_id))
+
+
+def get_ratings(cursor, subject_type, subject_ids):
+    """Read rating summaries for many subjects; returns a dict keyed by id."""
+    subject_ids = list(dict.fromkeys(subject_ids))
+    summaries = {subject_id: summarize(None) for subject_id in subject_ids}
+    if not subject_ids:
+        return summaries
+
+    placeholders = ', '.join(['%s'] * len(subject_ids))
+    cursor.execute(f"""
+        SELECT subject_id, rating_count, rating_sum,
+               rating_1, rating_2, rating_3, rating_4, rating_5
+        FROM rating_aggregates
+        WHERE subject_type = %s AND subject_id IN ({placeholders})
+    """, (subject_type, *subject_ids))
+    for row in cursor.fetchall():
+        summaries[row['subject_id']] = summarize(row)
+    return summaries
+
+
+_HISTOGRAM_SELECT = """
+    COUNT(*), SUM(f.rating),
+    SUM(f.rating = 1), SUM(f.rating = 2), SUM(f.rating = 3),
+    SUM(f.rating = 4), SUM(f.rating = 5)
+"""
+
+# Rows are overwritten rather than deleted so their versions keep increasing
+# and ETags handed out before a rebuild can't match afterwards
+_REBUILD_UPSERT = """
+    ON DUPLICATE KEY UPDATE
+        rating_count = VALUES(rating_count), rating_sum = VALUES(rating_sum),
+        rating_1 = VALUES(rating_1), rating_2 = VALUES(rating_2), rating_3 = VALUES(rating_3),
+        rating_4 = VALUES(rating_4), rating_5 = VALUES(rating_5)
+"""
+
+_REBUILD_QUERIES = (
+    f"""
+    INSERT INTO rating_aggregates
+        (subject_type, subject_id, rating_count, rating_sum,
+         rating_1, rating_2, rating_3, rating_4, rating_5)
+    SELECT 'product', f.product_id, {_HISTOGRAM_SELECT}
+    FROM feedback f
+    WHERE f.product_id IS NOT NULL AND f.rating IS NOT NULL
+    GROUP BY f.product_id
+    {_REBUILD_UPSERT}
+    """,
+    f"""
+    INSERT INTO rating_aggregates
+        (subject_type, subject_id, rating_count, rating_sum,
+         rating_1, rating_2, rating_3, rating_4, rating_5)
+    SELECT 'business', p.business_id, {_HISTOGRAM_SELECT}
+    FROM feedback f
+    JOIN products p ON f.product_id = p.id
+    WHERE p.business_id IS NOT NULL AND f.rating IS NOT NULL
+    GROUP BY p.business_id
+    {_REBUILD_UPSERT}
+    """,
+    f"""
+    INSERT INTO rating_aggregates
+        (subject_type, subject_id, rating_count, rating_sum,
+         rating_1, rating_2, rating_3, rating_4, rating_5)
+    SELECT 'listing', f.business_id, {_HISTOGRAM_SELECT}
+    FROM feedback f
+    WHERE f.business_id IS NOT NULL AND f.rating IS NOT NULL
+    GROUP BY f.business_id
+    {_REBUILD_UPSERT}
+    """
+)
+
+
+# Feedback rows counted towards one subject's aggregate, by subject type
+_SUBJECT_SOURCES = {
+    'product': ("FROM feedback f", "f.product_id = %s"),
+    'business': ("FROM feedback f JOIN products p ON f.product_id = p.id", "p.business_id = %s"),
+    'listing': ("FROM feedback f", "f.business_id = %s")
+}
+
+
+def rebuild_subject(cursor, subject_type, subject_id):
+    """Recount one subject's aggregate from the feedback table, bumping its version."""
+    source, condition = _SUBJECT_SOURCES[subject_type]
+    cursor.execute(f"""
+        INSERT INTO rating_aggregates
+            (subject_type, subject_id, rating_count, rating_sum,
+             rating_1, rating_2, rating_3, rating_4, rating_5)
+        SELECT %s, %s, COUNT(*), COALESCE(SUM(f.rating), 0),
+            COALESCE(SUM(f.rating = 1), 0), COALESCE(SUM(f.rating = 2), 0), COALESCE(SUM(f.rating = 3), 0),
+            COALESCE(SUM(f.rating = 4), 0), COALESCE(SUM(f.rating = 5), 0)
+        {source}
+        WHERE {condition} AND f.rating IS NOT NULL
+        {_REBUILD_UPSERT.rstrip()}, version = version + 1
+    """, (subject_type, subject_id, subject_id))
+
+
+def rebuild_aggregates(conn):
+    """
+    Recompute every aggregate from the feedback table in one transaction.
+    Used to backfill the table and to repair drift.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE rating_aggregates
+            SET rating_count = 0, rating_sum = 0,
+                rating_1 = 0, rating_2 = 0, rating_3 = 0, rating_4 = 0, rating_5 = 0,
+                version = version + 1
+        """)
+        for query in _REBUILD_QUERIES:
+            cursor.execute(query)
+        cursor.execute("SELECT COUNT(*) AS subjects FROM rating_aggregates WHERE rating_count > 0")
+        rows = cursor.fetchone()['subjects']
+        conn.commit()
+        return rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def init_app(app):
+    @app.cli.command('rebuild-ratings')
+    def rebuild_ratings_command():
+        """Rebuild rating_aggregates from the feedback table."""
+        rows = rebuild_aggregates(get_db_connection())
+        click.echo(f'Rebuilt {rows} rating aggregates')
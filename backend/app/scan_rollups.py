@@ -0,0 +1,358 @@
+import os
+import time
+import logging
+import threading
+from datetime import date, datetime, timedelta
+import click
+from .database import pool, get_db_connection
+
+logger = logging.getLogger(__name__)
+
+VERIFICATION_METHODS = ('barcode_scan', 'manual_code', 'qr_code')
+GRANULARITIES = ('day', 'hour')
+
+# Longest range a single time-series request may cover, per granularity
+MAX_SERIES_DAYS = {'day': 366, 'hour': 14}
+
+WATERMARK_NAME = 'scan_rollups'
+
+# Both rollups are filled from the same set of product_verifications rows,
+# either a slice of ids or the late-committed ids of rollup_gaps, so a
+# verification written late (e.g. from the write-behind buffer or an
+# offline batch) still lands in the bucket of its verification_date.
+_ROLLUP_QUERIES = (
+    """
+    INSERT INTO scan_rollups_hourly
+        (bucket_start, product_id, verification_method, business_id, scan_count)
+    SELECT
+        DATE_FORMAT(pv.verification_date, '%%Y-%%m-%%d %%H:00:00'),
+        pv.product_id,
+        COALESCE(pv.verification_method, 'manual_code'),
+        p.business_id,
+        COUNT(*)
+    FROM product_verifications pv
+    JOIN products p ON pv.product_id = p.id
+    WHERE {where}
+    GROUP BY 1, 2, 3, 4
+    ON DUPLICATE KEY UPDATE scan_count = scan_count + VALUES(scan_count)
+    """,
+    """
+    INSERT INTO scan_rollups_daily
+        (bucket_date, product_id, verification_method, business_id, scan_count)
+    SELECT
+        DATE(pv.verification_date),
+        pv.product_id,
+        COALESCE(pv.verification_method, 'manual_code'),
+        p.business_id,
+        COUNT(*)
+    FROM product_verifications pv
+    JOIN products p ON pv.product_id = p.id
+    WHERE {where}
+    GROUP BY 1, 2, 3, 4
+    ON DUPLICATE KEY UPDATE scan_count = scan_count + VALUES(scan_count)
+    """
+)
+
+_ID_SLICE = 'pv.id > %s AND pv.id <= %s'
+
+
+class ScanRollup:
+    """
+    Rolls product_verifications into hourly and daily scan counts per
+    product, business and verification method.
+    A watermark row holds the highest verification id already counted. Each
+    batch is applied in one transaction together with the watermark update,
+    and the watermark row is locked while it runs, so several worker
+    processes can run the job without double counting.
+
+    Auto-increment ids can become visible out of order: a long transaction,
+    a retried write-behind batch or a multi-row insert commits after rows
+    with higher ids. Each run only counts ids up to the maximum it observed
+    settle_seconds earlier, and every id the watermark passes without
+    seeing is kept in rollup_gaps. Later batches count gap ids whose rows
+    have since committed and remove them, so each verification is counted
+    once. Gaps still open after gap_ttl seconds are dropped: most are ids
+    of rolled-back inserts, and a verification committing later than that
+    is only counted by a rebuild.
+    """
+
+    def __init__(self, interval=60, batch_size=50000, hourly_retention_days=90, settle_seconds=2,
+                 gap_ttl=3600, max_gaps=10000):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+        self.hourly_retention_days = hourly_retention_days
+        self.gap_ttl = gap_ttl
+        self.max_gaps = max_gaps
+        self._thread = None
+        self.last_id = None
+        self.max_id = None
+        self.last_run_at = None
+        self.last_run_rows = 0
+        self.last_run_seconds = None
+        self.late_rows = 0
+
+    def _max_id(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM product_verifications")
+        max_id = cursor.fetchone()['max_id']
+        cursor.close()
+        # End the read so the next batch sees rows committed since
+        conn.commit()
+        return max_id
+
+    def _count_late(self, cursor):
+        """Roll up verifications that committed after the watermark passed their id."""
+        cursor.execute("""
+            SELECT pv.id FROM rollup_gaps g
+            JOIN product_verifications pv ON pv.id = g.verification_id
+            WHERE g.name = %s
+            LIMIT %s
+        """, (WATERMARK_NAME, self.batch_size))
+        ids = [row['id'] for row in cursor.fetchall()]
+        if not ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(ids))
+        for query in _ROLLUP_QUERIES:
+            cursor.execute(query.format(where=f'pv.id IN ({placeholders})'), ids)
+        cursor.execute(
+            f"DELETE FROM rollup_gaps WHERE name = %s AND verification_id IN ({placeholders})",
+            (WATERMARK_NAME, *ids)
+        )
+        self.late_rows += len(ids)
+        return len(ids)
+
+    def _record_gaps(self, cursor, last_id, upper, present):
+        """Remember the ids in (last_id, upper] with no visible row, to count them if they commit."""
+        missing = [i for i in range(last_id + 1, upper + 1) if i not in present]
+        if len(missing) > self.max_gaps:
+            # Long runs of missing ids come from rollbacks or deletes; in-flight rows are the newest
+            logger.warning('Too many verification id gaps to track', extra={
+                'from_id': last_id, 'to_id': upper, 'gaps': len(missing), 'kept': self.max_gaps
+            })
+            missing = missing[-self.max_gaps:]
+        if missing:
+            cursor.executemany(
+                "INSERT IGNORE INTO rollup_gaps (name, verification_id) VALUES (%s, %s)",
+                [(WATERMARK_NAME, i) for i in missing]
+            )
+
+    def _apply_batch(self, conn, horizon):
+        """
+        Roll up late-committed gap ids and the next slice of ids up to
+        horizon. Returns the number of verifications counted.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT IGNORE INTO rollup_watermarks (name, last_id) VALUES (%s, 0)",
+                (WATERMARK_NAME,)
+            )
+            cursor.execute(
+                "SELECT last_id FROM rollup_watermarks WHERE name = %s FOR UPDATE",
+                (WATERMARK_NAME,)
+            )
+            last_id = cursor.fetchone()['last_id']
+            upper = max(last_id, min(horizon, last_id + self.batch_size))
+
+            rows = self._count_late(cursor)
+            if upper > last_id:
+                cursor.execute(
+                    "SELECT id FROM product_verifications WHERE id > %s AND id <= %s",
+                    (last_id, upper)
+                )
+                present = {row['id'] for row in cursor.fetchall()}
+                rows += len(present)
+                for query in _ROLLUP_QUERIES:
+                    cursor.execute(query.format(where=_ID_SLICE), (last_id, upper))
+                self._record_gaps(cursor, last_id, upper, present)
+                cursor.execute(
+                    "UPDATE rollup_watermarks SET last_id = %s WHERE name = %s",
+                    (upper, WATERMARK_NAME)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        self.last_id = upper
+        return rows
+
+    def run_once(self, conn=None):
+        """Roll up every verification written since the watermark."""
+        started = time.monotonic()
+        conn = conn or pool.connection()
+        try:
+            self._expire_gaps(conn)
+            horizon = self._max_id(conn)
+            time.sleep(self.settle_seconds)
+            total = 0
+            while True:
+                total += self._apply_batch(conn, horizon)
+                if self.last_id >= horizon:
+                    break
+            self.max_id = self._max_id(conn)
+        finally:
+            conn.close()
+
+        self.last_run_at = time.time()
+        self.last_run_rows = total
+        self.last_run_seconds = round(time.monotonic() - started, 3)
+        return total
+
+    def _expire_gaps(self, conn):
+        """Stop waiting for ids that have stayed missing for gap_ttl seconds."""
+        cursor = conn.cursor()
+        try:
+            expired = cursor.execute(
+                "DELETE FROM rollup_gaps WHERE name = %s AND created_at < NOW() - INTERVAL %s SECOND",
+                (WATERMARK_NAME, self.gap_ttl)
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+        if expired:
+            logger.info('Expired verification id gaps', extra={'gaps': expired})
+        return expired
+
+    def prune(self, conn=None):
+        """Drop hourly buckets older than the retention window; daily buckets are kept."""
+        conn = conn or pool.connection()
+        try:
+            cursor = conn.cursor()
+            deleted = cursor.execute(
+                "DELETE FROM scan_rollups_hourly WHERE bucket_start < %s",
+                (datetime.now() - timedelta(days=self.hourly_retention_days),)
+            )
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+        return deleted
+
+    def rebuild(self, conn):
+        """Clear both rollups and recount every verification from the start."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM scan_rollups_hourly")
+            cursor.execute("DELETE FROM scan_rollups_daily")
+            cursor.execute("DELETE FROM rollup_watermarks WHERE name = %s", (WATERMARK_NAME,))
+            cursor.execute("DELETE FROM rollup_gaps WHERE name = %s", (WATERMARK_NAME,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return self.run_once(conn)
+
+    def _run(self):
+        next_prune = 0
+        while True:
+            try:
+                self.run_once()
+                if time.monotonic() >= next_prune:
+                    self.prune()
+                    next_prune = time.monotonic() + 86400
+            except Exception:
+                logger.exception('Scan rollup failed')
+            time.sleep(self.interval)
+
+    def start(self):
+        """Keep the rollups up to date from a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='scan-rollup', daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        return {
+            'last_id': self.last_id,
+            'lag': (self.max_id - self.last_id) if self.last_id is not None else None,
+            'last_run_at': self.last_run_at,
+            'last_run_rows': self.last_run_rows,
+            'last_run_seconds': self.last_run_seconds,
+            'late_rows': self.late_rows
+        }
+
+
+scan_rollup = ScanRollup(
+    interval=int(os.getenv('SCAN_ROLLUP_INTERVAL', 60)),
+    batch_size=int(os.getenv('SCAN_ROLLUP_BATCH_SIZE', 50000)),
+    hourly_retention_days=int(os.getenv('SCAN_ROLLUP_HOURLY_RETENTION_DAYS', 90)),
+    settle_seconds=float(os.getenv('SCAN_ROLLUP_SETTLE_SECONDS', 2)),
+    gap_ttl=int(os.getenv('SCAN_ROLLUP_GAP_TTL', 3600))
+)
+
+
+def _buckets(start, end, granularity):
+    step = timedelta(days=1) if granularity == 'day' else timedelta(hours=1)
+    bucket = start
+    while bucket <= end:
+        yield bucket
+        bucket += step
+
+
+def scan_series(cursor, business_id, days=30, granularity='day', product_id=None, today=None):
+    """
+    Scans per day (or hour) for a business over the last `days` days,
+    split by verification method. Buckets without scans are filled with zeros.
+    """
+    today = today or date.today()
+    start_day = today - timedelta(days=days - 1)
+    if granularity == 'day':
+        table, column = 'scan_rollups_daily', 'bucket_date'
+        start, end = start_day, today
+    else:
+        table, column = 'scan_rollups_hourly', 'bucket_start'
+        start = datetime.combine(start_day, datetime.min.time())
+        end = datetime.now().replace(minute=0, second=0, microsecond=0)
+
+    product_filter = 'AND product_id = %s' if product_id is not None else ''
+    cursor.execute(f"""
+        SELECT {column} AS bucket, verification_method, SUM(scan_count) AS scans
+        FROM {table}
+        WHERE business_id = %s AND {column} >= %s AND {column} <= %s {product_filter}
+        GROUP BY {column}, verification_method
+    """, (business_id, start, end, *((product_id,) if product_id is not None else ())))
+
+    counts = {}
+    for row in cursor.fetchall():
+        counts.setdefault(row['bucket'], {})[row['verification_method']] = int(row['scans'])
+
+    series = []
+    by_method = dict.fromkeys(VERIFICATION_METHODS, 0)
+    for bucket in _buckets(start, end, granularity):
+        methods = counts.get(bucket, {})
+        point = {method: methods.get(method, 0) for method in VERIFICATION_METHODS}
+        for method, scans in point.items():
+            by_method[method] += scans
+        series.append({
+            'bucket': bucket,
+            'total': sum(point.values()),
+            'by_method': point
+        })
+
+    return {
+        'granularity': granularity,
+        'start': start,
+        'end': end,
+        'total': sum(by_method.values()),
+        'by_method': by_method,
+        'series': series
+    }
+
+
+def init_app(app):
+    if os.getenv('SCAN_ROLLUP_ENABLED', '1') == '1':
+        scan_rollup.start()
+
+    @app.cli.command('rollup-scans')
+    @click.option('--rebuild', is_flag=True, help='Discard the rollups and recount every verification.')
+    def rollup_scans_command(rebuild):
+        """Roll new product verifications into the hourly and daily scan counts."""
+        conn = get_db_connection()
+        rows = scan_rollup.rebuild(conn) if rebuild else scan_rollup.run_once(conn)
+        click.echo(f'Rolled up {rows} verifications')
@@ -0,0 +1,105 @@
+import os
+import logging
+import threading
+import click
+import pymysql
+from .database import pool
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaError(RuntimeError):
+    """Raised when the database is missing columns the API depends on."""
+
+
+# Columns each handler relies on. A tuple lists interchangeable alternatives,
+# e.g. older databases store feedback authors in user_id and text in comment.
+EXPECTED_COLUMNS = {
+    'feedback': [('consumer_id', 'user_id'), ('feedback_text', 'comment'), 'rating', 'created_at'],
+    'products': ['product_code', 'business_id', 'product_name'],
+    'businesses': ['business_name'],
+    'business_certification': ['version', 'updated_at'],
+    'rating_aggregates': ['version'],
+    'product_imports': ['status', 'bytes_processed', 'errors'],
+    'users': ['email', 'password_hash', 'role']
+}
+
+_columns = None
+_compiled = {}
+_lock = threading.Lock()
+
+
+def refresh_schema():
+    """Read every table's columns from information_schema into the cached map."""
+    global _columns
+    conn = pool.connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+        """)
+        columns = {}
+        for row in cursor.fetchall():
+            columns.setdefault(row['table_name'], set()).add(row['column_name'])
+        cursor.close()
+    finally:
+        conn.close()
+
+    with _lock:
+        _columns = columns
+        # Queries built from the old column map are no longer valid
+        _compiled.clear()
+    return columns
+
+
+def columns(table):
+    """Cached column names of a table, loading the schema on first use."""
+    if _columns is None:
+        refresh_schema()
+    return _columns.get(table, set())
+
+
+def compiled(key, build):
+    """
+    Return the query cached under key, calling build() once to create it.
+    The cache is cleared whenever the schema is refreshed.
+    """
+    query = _compiled.get(key)
+    if query is None:
+        query = build()
+        with _lock:
+            _compiled[key] = query
+    return query
+
+
+def check_schema():
+    """Raise SchemaError listing every expected column that is missing."""
+    missing = []
+    for table, expected in EXPECTED_COLUMNS.items():
+        present = columns(table)
+        for column in expected:
+            alternatives = column if isinstance(column, tuple) else (column,)
+            if not present.intersection(alternatives):
+                missing.append(f"{table}.{' or '.join(alternatives)}")
+    if missing:
+        raise SchemaError(f"Database schema is missing columns: {', '.join(missing)}")
+
+
+def init_app(app):
+    if os.getenv('SCHEMA_CHECK_ON_STARTUP', '1') == '1':
+        try:
+            refresh_schema()
+        except pymysql.Error as e:
+            # Without a database the schema is loaded on first use instead
+            logger.warning('Could not inspect database schema', extra={'error': str(e)})
+        else:
+            check_schema()
+
+    @app.cli.command('check-schema')
+    def check_schema_command():
+        """Verify the database has every column the API expects."""
+        refresh_schema()
+        check_schema()
+        click.echo('Database schema OK')
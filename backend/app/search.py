@@ -0,0 +1,314 @@
+import os
+import re
+import time
+import heapq
+import bisect
+import logging
+import threading
+import pymysql
+from .database import pool
+from .cache import TTLCache
+from .steps import Query
+
+logger = logging.getLogger(__name__)
+
+# Matches InnoDB's default innodb_ft_min_token_size, so every term we
+# suggest or correct to is one the FULLTEXT index actually holds
+MIN_TOKEN_LENGTH = 3
+SEARCH_MAX_TERMS = 8
+SEARCH_PREFIX_SCAN = int(os.getenv('SEARCH_PREFIX_SCAN', 2000))
+SEARCH_MAX_LIMIT = 50
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_EDIT_ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'
+
+# Text the vocabulary is built from, streamed in id order
+VOCABULARY_SOURCES = {
+    'products': "SELECT id, product_name, category, description FROM products WHERE id > %s ORDER BY id",
+    'businesses': "SELECT id, business_name, description FROM businesses WHERE id > %s ORDER BY id"
+}
+
+# Matches weigh a hit in the name three times as much as one elsewhere in the text.
+# Products are only searchable once their business has a directory listing,
+# as with GET /api/products/verify.
+SEARCH_QUERIES = {
+    'products': """
+        SELECT p.id, p.product_name, p.product_code, p.category, p.certification_status,
+               b.id AS business_id, b.business_name,
+               3 * MATCH(p.product_name) AGAINST (%s IN BOOLEAN MODE)
+                 + MATCH(p.product_name, p.category, p.description) AGAINST (%s IN BOOLEAN MODE) AS score
+        FROM products p
+        JOIN businesses b ON p.business_id = b.id
+        WHERE MATCH(p.product_name, p.category, p.description) AGAINST (%s IN BOOLEAN MODE)
+        ORDER BY score DESC, p.id
+        LIMIT %s
+    """,
+    'businesses': """
+        SELECT b.id, b.business_name,
+               COALESCE(b.description, '') AS description,
+               COALESCE(b.certification_status, 'pending') AS certification_status,
+               3 * MATCH(b.business_name) AGAINST (%s IN BOOLEAN MODE)
+                 + MATCH(b.business_name, b.description) AGAINST (%s IN BOOLEAN MODE) AS score
+        FROM businesses b
+        WHERE MATCH(b.business_name, b.description) AGAINST (%s IN BOOLEAN MODE)
+        ORDER BY score DESC, b.id
+        LIMIT %s
+    """
+}
+SEARCH_TARGETS = tuple(SEARCH_QUERIES)
+
+search_cache = TTLCache(
+    maxsize=int(os.getenv('SEARCH_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('SEARCH_CACHE_TTL', 30))
+)
+
+
+def tokenize(text):
+    """Lowercased word tokens long enough for the FULLTEXT index."""
+    if not text:
+        return []
+    return [token for token in _TOKEN_RE.findall(text.lower()) if len(token) >= MIN_TOKEN_LENGTH]
+
+
+def _edits(token):
+    """Every string one deletion, transposition, substitution or insertion away."""
+    splits = [(token[:i], token[i:]) for i in range(len(token) + 1)]
+    for left, right in splits:
+        if right:
+            yield left + right[1:]
+            for char in _EDIT_ALPHABET:
+                yield left + char + right[1:]
+        if len(right) > 1:
+            yield left + right[1] + right[0] + right[2:]
+        for char in _EDIT_ALPHABET:
+            yield left + char + right
+
+
+class Vocabulary:
+    """
+    Document frequency of every term in product and business text.
+    Backs prefix autocomplete and one-edit typo correction without a
+    database round trip. Built from a streamed scan of both tables, topped
+    up with newly inserted rows every refresh_interval seconds and rebuilt
+    from scratch every rebuild_interval seconds, which also picks up edits.
+    """
+
+    def __init__(self, refresh_interval=30, rebuild_interval=3600):
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self._counts = None
+        self._terms = []
+        self._last_ids = dict.fromkeys(VOCABULARY_SOURCES, 0)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.built_at = None
+        self.build_seconds = None
+
+    @property
+    def ready(self):
+        return self._counts is not None
+
+    def _scan(self, conn, counts, last_ids):
+        """Count terms of rows past last_ids into counts; returns the new last ids."""
+        last_ids = dict(last_ids)
+        for source, query in VOCABULARY_SOURCES.items():
+            # Unbuffered cursor so the text is streamed, not materialised
+            cursor = conn.cursor(pymysql.cursors.SSCursor)
+            try:
+                cursor.execute(query, (last_ids[source],))
+                while True:
+                    rows = cursor.fetchmany(10000)
+                    if not rows:
+                        break
+                    for row in rows:
+                        for term in set(tokenize(' '.join(text for text in row[1:] if text))):
+                            counts[term] = counts.get(term, 0) + 1
+                        last_ids[source] = max(last_ids[source], row[0])
+            finally:
+                cursor.close()
+        return last_ids
+
+    def build(self):
+        """Rebuild the vocabulary from both tables."""
+        started = time.monotonic()
+        counts = {}
+        conn = pool.connection()
+        try:
+            last_ids = self._scan(conn, counts, dict.fromkeys(VOCABULARY_SOURCES, 0))
+        finally:
+            conn.close()
+
+        terms = sorted(counts)
+        with self._lock:
+            self._counts = counts
+            self._terms = terms
+            self._last_ids = last_ids
+
+        self.built_at = time.time()
+        self.build_seconds = round(time.monotonic() - started, 3)
+
+    def refresh(self):
+        """Add the terms of rows inserted since the last build or refresh."""
+        if self._counts is None:
+            return self.build()
+
+        added = {}
+        conn = pool.connection()
+        try:
+            last_ids = self._scan(conn, added, self._last_ids)
+        finally:
+            conn.close()
+
+        with self._lock:
+            for term, count in added.items():
+                if term not in self._counts:
+                    bisect.insort(self._terms, term)
+                self._counts[term] = self._counts.get(term, 0) + count
+            self._last_ids = last_ids
+
+    def has_prefix(self, prefix):
+        terms = self._terms
+        i = bisect.bisect_left(terms, prefix)
+        return i < len(terms) and terms[i].startswith(prefix)
+
+    def complete(self, prefix, limit=5):
+        """The most frequent terms starting with prefix, most frequent first."""
+        counts, terms = self._counts, self._terms
+        if counts is None or len(prefix) < 2:
+            return []
+        start = bisect.bisect_left(terms, prefix)
+        # Short prefixes can cover much of the vocabulary; only rank the first slice
+        end = min(bisect.bisect_left(terms, prefix + '\uffff'), start + SEARCH_PREFIX_SCAN)
+        return heapq.nlargest(limit, terms[start:end], key=lambda term: counts.get(term, 0))
+
+    def correct(self, token):
+        """
+        The most frequent known term within one edit of token, or None.
+        Short tokens are left alone, since one edit changes them too much.
+        """
+        counts = self._counts
+        if counts is None or len(token) < 4 or token in counts:
+            return None
+        best, best_count = None, 0
+        for candidate in _edits(token):
+            count = counts.get(candidate, 0)
+            if count > best_count and len(candidate) >= MIN_TOKEN_LENGTH:
+                best, best_count = candidate, count
+        return best
+
+    def _run(self):
+        next_rebuild = 0
+        while True:
+            try:
+                if time.monotonic() >= next_rebuild:
+                    self.build()
+                    next_rebuild = time.monotonic() + self.rebuild_interval
+                else:
+                    self.refresh()
+            except Exception as e:
+                logger.warning('Search vocabulary update failed', extra={'error': str(e)})
+            time.sleep(self.refresh_interval)
+
+    def start(self):
+        """Build the vocabulary in the background and keep it up to date."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='search-vocabulary', daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        if self._counts is None:
+            return {'ready': False}
+        return {
+            'ready': True,
+            'terms': len(self._terms),
+            'built_at': self.built_at,
+            'build_seconds': self.build_seconds
+        }
+
+
+vocabulary = Vocabulary(
+    refresh_interval=int(os.getenv('SEARCH_REFRESH_INTERVAL', 30)),
+    rebuild_interval=int(os.getenv('SEARCH_REBUILD_INTERVAL', 3600))
+)
+
+
+def parse_query(text, prefix=True):
+    """
+    Split a query into terms, correcting typos against the vocabulary.
+    With prefix set the last term may be unfinished, so it is matched as a
+    prefix and only corrected when no known term starts with it.
+    Returns (terms, corrected), where terms are (term, is_prefix) pairs and
+    corrected says whether any term was replaced.
+    """
+    words = _TOKEN_RE.findall((text or '').lower())
+    tokens = [word for word in words[:-1] if len(word) >= MIN_TOKEN_LENGTH]
+    # A two-letter last word is still worth completing while it is being typed
+    if words and len(words[-1]) >= (2 if prefix else MIN_TOKEN_LENGTH):
+        tokens.append(words[-1])
+    tokens = tokens[-SEARCH_MAX_TERMS:]
+    terms, corrected = [], False
+    for i, token in enumerate(tokens):
+        is_prefix = prefix and i == len(tokens) - 1
+        if is_prefix and vocabulary.has_prefix(token):
+            terms.append((token, True))
+            continue
+        fix = vocabulary.correct(token)
+        if fix:
+            terms.append((fix, False))
+            corrected = True
+        else:
+            terms.append((token, is_prefix))
+    return terms, corrected
+
+
+def boolean_query(terms):
+    """MySQL BOOLEAN MODE expression requiring every term; tokens are plain \\w+ so need no escaping."""
+    return ' '.join(f"+{term}{'*' if is_prefix else ''}" for term, is_prefix in terms)
+
+
+def search_statement(target, terms, limit):
+    """Cache key, SQL and parameters of a search."""
+    expression = boolean_query(terms)
+    return (target, expression, limit), SEARCH_QUERIES[target], (expression, expression, expression, limit)
+
+
+def cache_results(key, rows):
+    for row in rows:
+        row['score'] = round(float(row['score']), 4)
+    search_cache.set(key, rows)
+    return [dict(row) for row in rows]
+
+
+def find_matches(target, terms, limit=10):
+    """
+    Ranked FULLTEXT matches for parsed terms, cached for SEARCH_CACHE_TTL
+    seconds. A step generator (app/steps.py), for handlers shared with the
+    ASGI server.
+    """
+    if not terms:
+        return []
+    key, query, params = search_statement(target, terms, limit)
+    results = search_cache.get(key)
+    if results is None:
+        return cache_results(key, (yield Query(query, params)))
+    return [dict(row) for row in results]
+
+
+def suggest(text, limit=5):
+    """
+    Completions of a partly typed query: the earlier terms, typo-corrected,
+    followed by the most frequent terms starting with the last one.
+    """
+    terms, _ = parse_query(text, prefix=True)
+    if not terms:
+        return []
+    head = ' '.join(term for term, _ in terms[:-1])
+    last, is_prefix = terms[-1]
+    completions = vocabulary.complete(last, limit) if is_prefix else [last]
+    return [f'{head} {term}' if head else term for term in completions]
+
+
+def init_app(app):
+    if os.getenv('SEARCH_VOCABULARY_ENABLED', '1') == '1':
+        vocabulary.start()
@@ -0,0 +1,141 @@
+"""
+Endpoint logic shared by the Flask routes and the ASGI server (app/asgi.py).
+
+A shared handler is a generator: it yields the I/O it needs as steps,
+receives each step's result, and returns a Reply. An exception raised by
+a step is thrown back into the handler, so the handler's own try/except
+shapes the error response in both serving modes. Only the drivers differ:
+drive() and run() below work on the request thread, and app/asgi.py runs
+the same steps on the event loop.
+"""
+from flask import current_app, jsonify
+from .database import PoolTimeout, get_db_connection
+from .etags import held_etag, with_etag
+from .verification_log import record_verification
+
+
+class Query:
+    """Run one statement; the handler receives fetchall(), fetchone() or None, per fetch."""
+
+    def __init__(self, sql, params=None, fetch='all'):
+        self.sql = sql
+        self.params = params
+        self.fetch = fetch
+
+
+class RecordVerification:
+    """Log a product verification through the write-behind writer."""
+
+    def __init__(self, product_id, user_id, method):
+        self.product_id = product_id
+        self.user_id = user_id
+        self.method = method
+
+
+class Blocking:
+    """Call a blocking function; the ASGI server runs it on a worker thread."""
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+
+class Reply:
+    """Status, JSON body and caching headers of a shared handler's response."""
+
+    def __init__(self, body=None, status=200, etag=None, cache_control=None, headers=None):
+        self.body = body
+        self.status = status
+        self.etag = etag
+        self.cache_control = cache_control
+        self.headers = headers or {}
+
+
+def not_modified_reply(etag, if_none_match, cache_control='private, no-cache'):
+    """
+    A 304 Reply if the client already holds etag, otherwise None. Its etag
+    is the tag as the client sent it, which names the encoding it holds.
+    """
+    held = held_etag(etag, if_none_match)
+    if held is None:
+        return None
+    return Reply(status=304, etag=held, cache_control=cache_control)
+
+
+def busy_reply():
+    """Shed load quickly while the connection pool is exhausted."""
+    return Reply({'message': 'Server is busy, please try again shortly'}, 503, headers={'Retry-After': '1'})
+
+
+def fetch(cursor, step):
+    """Execute a Query step on a synchronous cursor and return its result."""
+    cursor.execute(step.sql, step.params)
+    if step.fetch == 'all':
+        return cursor.fetchall()
+    if step.fetch == 'one':
+        return cursor.fetchone()
+    return None
+
+
+def drive(handler, cursor=None):
+    """
+    Run a step generator on the calling thread and return its result.
+    Without a cursor, one is opened on the request's connection at the
+    first query and closed at the end. PoolTimeout is raised to the caller
+    rather than thrown into the handler.
+    """
+    own_cursor = cursor is None
+    try:
+        step = next(handler)
+        while True:
+            try:
+                if isinstance(step, Query):
+                    if cursor is None:
+                        cursor = get_db_connection().cursor()
+                    result = fetch(cursor, step)
+                elif isinstance(step, RecordVerification):
+                    result = record_verification(step.product_id, step.user_id, step.method)
+                elif isinstance(step, Blocking):
+                    result = step.func(*step.args)
+                else:
+                    raise TypeError(f'Unknown step {step!r}')
+            except PoolTimeout:
+                raise
+            except Exception as e:
+                step = handler.throw(e)
+            else:
+                step = handler.send(result)
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        handler.close()
+        if own_cursor and cursor is not None:
+            cursor.close()
+
+
+def flask_response(reply):
+    if reply.status == 304:
+        response = current_app.response_class(status=304)
+        response.headers['Cache-Control'] = reply.cache_control
+        response.headers['ETag'] = reply.etag
+        return response
+
+    response = jsonify(reply.body)
+    response.status_code = reply.status
+    if reply.etag:
+        with_etag(response, reply.etag, reply.cache_control or 'private, no-cache')
+    elif reply.cache_control:
+        response.headers['Cache-Control'] = reply.cache_control
+    response.headers.update(reply.headers)
+    return response
+
+
+def run(handler):
+    """Response of a Flask route served by a shared handler, or by a Reply it built without I/O."""
+    if isinstance(handler, Reply):
+        return flask_response(handler)
+    try:
+        reply = drive(handler)
+    except PoolTimeout:
+        reply = busy_reply()
+    return flask_response(reply)
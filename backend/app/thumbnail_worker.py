@@ -0,0 +1,45 @@
+"""
+Code run inside the thumbnail worker processes. Kept apart from
+photo_store so a spawned worker imports only Pillow and the standard
+library: no database pool, Flask or background threads.
+"""
+import io
+import os
+import tempfile
+from PIL import Image, ImageOps
+
+
+def write_atomic(path, data):
+    """Write through a temporary file so readers never see a partial image."""
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def render_thumbnails(source, targets, quality):
+    """
+    Generate the missing JPEG thumbnails of one photo. targets maps each
+    size name to (longest edge, output path). The original is decoded once
+    and scaled down size by size, largest first. Returns the sizes written.
+    """
+    written = []
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for name, (edge, path) in sorted(targets.items(), key=lambda item: item[1][0], reverse=True):
+            if os.path.exists(path):
+                continue
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+            write_atomic(path, buffer.getvalue())
+            written.append(name)
+    return written
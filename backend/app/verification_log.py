@@ -0,0 +1,186 @@
+import os
+import time
+import logging
+import queue
+import atexit
+import threading
+from datetime import datetime
+from .database import pool
+
+logger = logging.getLogger(__name__)
+
+INSERT_VERIFICATIONS_QUERY = """
+    INSERT INTO product_verifications
+    (product_id, user_id, verification_date, verification_method)
+    VALUES (%s, %s, %s, %s)
+"""
+
+
+def insert_verifications(cursor, rows):
+    """Write verification rows with a single multi-row INSERT."""
+    # PyMySQL folds executemany() on INSERT ... VALUES into one statement
+    cursor.executemany(INSERT_VERIFICATIONS_QUERY, rows)
+
+
+class VerificationWriter:
+    """
+    Write-behind buffer for product_verifications.
+    Scan handlers append events to a bounded queue and a background thread
+    flushes them in batches, either every batch_size events or every
+    flush_interval seconds, whichever comes first. A failed batch is
+    retried up to max_retries times with doubling backoff before it is
+    dropped; drops are counted for /api/metrics.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=100, flush_interval=0.2, put_timeout=0.05,
+                 max_retries=3, retry_backoff=0.2):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._stats = {'written': 0, 'retries': 0, 'dropped': 0}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+
+    def record(self, product_id, user_id, method, verified_at=None):
+        """Queue a verification event for the background flusher."""
+        row = (product_id, user_id, verified_at or datetime.now(), method)
+        self._ensure_started()
+
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            # Backpressure: the flusher is behind, so write this one inline,
+            # without retries so the request is not held up further
+            self._write([row], retries=0)
+
+    def offer(self, product_id, user_id, method, verified_at=None):
+        """
+        Queue a verification event without waiting for space.
+        Returns the row if the queue is full, for the caller to write itself
+        (the async server does so without blocking its event loop), else None.
+        """
+        row = (product_id, user_id, verified_at or datetime.now(), method)
+        self._ensure_started()
+
+        try:
+            self._queue.put_nowait(row)
+            return None
+        except queue.Full:
+            return row
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='verification-writer', daemon=True
+            )
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, rows):
+        conn = pool.connection()
+        try:
+            cursor = conn.cursor()
+            insert_verifications(cursor, rows)
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+    def _write(self, rows, retries=None):
+        """Insert a batch, retrying transient failures; returns whether it was written."""
+        retries = self.max_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                self._insert(rows)
+            except Exception as e:
+                if attempt < retries:
+                    self._count('retries')
+                    logger.warning('Retrying product verification write', extra={
+                        'rows': len(rows), 'attempt': attempt + 1, 'error': str(e)
+                    })
+                    time.sleep(self.retry_backoff * 2 ** attempt)
+                    continue
+                self._count('dropped', len(rows))
+                logger.exception('Dropped product verifications after failed writes', extra={'rows': len(rows)})
+                return False
+            self._count('written', len(rows))
+            return True
+
+    def _count(self, stat, n=1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def flush(self):
+        """Synchronously write everything still waiting in the queue."""
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                return
+            self._write(batch)
+
+    def stop(self, timeout=5):
+        """Stop the flusher thread, then write whatever it left in the queue."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        # The only final flush; the thread returns without one
+        self.flush()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=self._queue.qsize())
+
+
+verification_writer = VerificationWriter(
+    max_queue=int(os.getenv('VERIFICATION_QUEUE_SIZE', 10000)),
+    batch_size=int(os.getenv('VERIFICATION_FLUSH_SIZE', 100)),
+    flush_interval=int(os.getenv('VERIFICATION_FLUSH_INTERVAL_MS', 200)) / 1000,
+    put_timeout=int(os.getenv('VERIFICATION_ENQUEUE_TIMEOUT_MS', 50)) / 1000,
+    max_retries=int(os.getenv('VERIFICATION_WRITE_RETRIES', 3)),
+    retry_backoff=int(os.getenv('VERIFICATION_RETRY_BACKOFF_MS', 200)) / 1000
+)
+
+
+def record_verification(product_id, user_id, method, verified_at=None):
+    """Log a product verification without blocking the scan request."""
+    verification_writer.record(product_id, user_id, method, verified_at)
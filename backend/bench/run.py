@@ -0,0 +1,297 @@
+"""
+Drive the API at a fixed concurrency and report throughput and latency as JSON.
+
+Start the server against the seeded database first, e.g.
+
+    DB_NAME=swach_village_bench python run.py
+    python -m bench.run --concurrency 16 --duration 30 --output results/$(git rev-parse --short HEAD).json
+    python -m bench.run --baseline results/before.json
+
+Each scenario runs for --duration seconds after a --warmup period. Only
+standard-library HTTP clients are used, so the numbers are comparable
+between commits as long as the machine and seed stay the same.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = ('verify', 'businesses', 'dashboard', 'login')
+
+# Directory pages whose cursors are collected up front; deeper pages are rare
+DIRECTORY_PAGES = 200
+DIRECTORY_PAGE_SIZE = 10
+
+
+class Client:
+    """One keep-alive HTTP connection per worker thread."""
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Accept': 'application/json'}
+        if body is not None:
+            # bytes, so http.client sends headers and body in one packet
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request(method, path, body=body, headers=headers)
+                response = self._conn.getresponse()
+                data = response.read()
+                if response.will_close:
+                    self._conn.close()
+                    self._conn = None
+                return response.status, data
+            except (http.client.HTTPException, OSError):
+                self._conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+
+
+def login(client, email, password, role):
+    status, data = client.request('POST', '/api/auth/login', {
+        'identifier': email, 'password': password, 'role': role
+    })
+    if status != 200:
+        raise RuntimeError(f'Login failed for {email}: {status} {data[:200]!r}')
+    return json.loads(data)['token']
+
+
+def directory_paths(client, max_pages):
+    """Request paths of the first directory pages, following next_cursor as a client would."""
+    path = f'/api/consumer/businesses?limit={DIRECTORY_PAGE_SIZE}'
+    paths = [path]
+    while len(paths) < max_pages:
+        status, data = client.request('GET', path)
+        if status != 200:
+            raise RuntimeError(f'Directory listing failed: {status} {data[:200]!r}')
+        next_cursor = json.loads(data).get('next_cursor')
+        if not next_cursor:
+            break
+        path = f'/api/consumer/businesses?limit={DIRECTORY_PAGE_SIZE}&cursor={next_cursor}'
+        paths.append(path)
+    return paths
+
+
+class Workload:
+    """Builds the next request of each scenario from the seed manifest."""
+
+    def __init__(self, manifest, base_url, miss_rate, sessions):
+        self.manifest = manifest
+        self.miss_rate = miss_rate
+        client = Client(base_url)
+        password = manifest['password']
+        sessions = max(1, sessions)
+        self.consumer_tokens = [
+            login(client, manifest['consumer_email'].format(i), password, 'consumer')
+            for i in range(min(sessions, manifest['consumers']))
+        ]
+        self.business_tokens = [
+            login(client, manifest['business_email'].format(i), password, 'business')
+            for i in range(min(sessions, manifest['businesses']))
+        ]
+        self.directory_paths = directory_paths(client, DIRECTORY_PAGES)
+
+    def verify(self, rng):
+        if rng.random() < self.miss_rate:
+            code = f'MISSING{rng.randrange(10 ** 9):09d}'
+        else:
+            code = self.manifest['product_code'].format(rng.randrange(self.manifest['products']))
+        return 'POST', '/api/products/verify', {'barcode': code}, rng.choice(self.consumer_tokens)
+
+    def businesses(self, rng):
+        # Most directory traffic is on the first pages
+        page = min(len(self.directory_paths), int(rng.paretovariate(1.2)))
+        return 'GET', self.directory_paths[page - 1], None, None
+
+    def dashboard(self, rng):
+        return 'GET', '/api/business/dashboard', None, rng.choice(self.business_tokens)
+
+    def login(self, rng):
+        i = rng.randrange(self.manifest['consumers'])
+        return 'POST', '/api/auth/login', {
+            'identifier': self.manifest['consumer_email'].format(i),
+            'password': self.manifest['password'],
+            'role': 'consumer'
+        }, None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_scenario(name, workload, base_url, concurrency, duration, warmup, seed):
+    build = getattr(workload, name)
+    latencies = [[] for _ in range(concurrency)]
+    statuses = [{} for _ in range(concurrency)]
+    errors = [0] * concurrency
+    start_at = time.monotonic() + 0.1
+    measure_from = start_at + warmup
+    stop_at = measure_from + duration
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = Client(base_url)
+        while time.monotonic() < start_at:
+            time.sleep(0.001)
+        while True:
+            method, path, body, token = build(rng)
+            started = time.monotonic()
+            if started >= stop_at:
+                return
+            try:
+                status, _ = client.request(method, path, body, token)
+            except Exception:
+                status = None
+            finished = time.monotonic()
+            if started < measure_from:
+                continue
+            if status is None or status >= 500:
+                errors[index] += 1
+            statuses[index][str(status)] = statuses[index].get(str(status), 0) + 1
+            latencies[index].append(finished - started)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    samples = sorted(value for values in latencies for value in values)
+    status_counts = {}
+    for counts in statuses:
+        for status, count in counts.items():
+            status_counts[status] = status_counts.get(status, 0) + count
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        'requests': len(samples),
+        'errors': sum(errors),
+        'statuses': status_counts,
+        'duration_s': duration,
+        'throughput_rps': round(len(samples) / duration, 2),
+        'latency_ms': {
+            'mean': ms(sum(samples) / len(samples)) if samples else None,
+            'p50': ms(percentile(samples, 50)),
+            'p95': ms(percentile(samples, 95)),
+            'p99': ms(percentile(samples, 99)),
+            'max': ms(samples[-1]) if samples else None
+        }
+    }
+
+
+def compare(results, baseline):
+    """Relative change against a previous report, per scenario."""
+    changes = {}
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        change = {}
+        if before['throughput_rps']:
+            change['throughput_rps'] = round(result['throughput_rps'] / before['throughput_rps'] - 1, 4)
+        for key in ('p50', 'p95', 'p99'):
+            if before['latency_ms'][key] and result['latency_ms'][key] is not None:
+                change[f'{key}_ms'] = round(result['latency_ms'][key] / before['latency_ms'][key] - 1, 4)
+        changes[name] = change
+    return changes
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=BENCH_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--base-url', default=os.getenv('BENCH_BASE_URL', 'http://localhost:5000'))
+    parser.add_argument('--manifest', default=os.path.join(BENCH_DIR, 'seed_manifest.json'))
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=5, help='unmeasured seconds before each scenario')
+    parser.add_argument('--miss-rate', type=float, default=0.1, help='share of verify requests for unknown codes')
+    parser.add_argument('--sessions', type=int, default=20, help='users logged in up front to spread tokens over')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the report to this file')
+    parser.add_argument('--baseline', help='previous report to compare against')
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+
+    workload = Workload(manifest, args.base_url, args.miss_rate, args.sessions)
+
+    results = {}
+    for name in scenarios:
+        print(f'Running {name} for {args.duration}s at concurrency {args.concurrency}', file=sys.stderr)
+        results[name] = run_scenario(
+            name, workload, args.base_url, args.concurrency, args.duration, args.warmup, args.seed
+        )
+
+    report = {
+        'revision': git_revision(),
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'config': {
+            'base_url': args.base_url,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'miss_rate': args.miss_rate,
+            'seed': args.seed,
+            'dataset': {key: manifest[key] for key in
+                        ('businesses', 'consumers', 'products', 'verifications', 'feedback', 'seed')}
+        },
+        'results': results
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['change_vs_baseline'] = compare(results, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
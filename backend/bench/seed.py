@@ -0,0 +1,266 @@
+"""
+Seed a MySQL database with synthetic data for the benchmark runner.
+
+Applies database/schema.sql and database/schema_updates.sql to a fresh
+database, bulk-loads businesses, consumers, products, feedback and
+verifications, then rebuilds the rating aggregates and scan rollups the
+API reads from. Writes a manifest describing the data for bench/run.py.
+
+    python -m bench.seed --preset small
+    python -m bench.seed --businesses 100000 --verifications 10000000 --feedback 5000000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+import bcrypt
+import pymysql
+from dotenv import load_dotenv
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.ratings import rebuild_aggregates  # noqa: E402
+from app.scan_rollups import scan_rollup  # noqa: E402
+
+PRESETS = {
+    'small': {'businesses': 1000, 'consumers': 5000, 'products_per_business': 5,
+              'verifications': 100000, 'feedback': 50000},
+    'large': {'businesses': 100000, 'consumers': 200000, 'products_per_business': 5,
+              'verifications': 10000000, 'feedback': 5000000}
+}
+
+PASSWORD = 'benchpass'
+METHODS = ('barcode_scan', 'manual_code', 'qr_code')
+CHUNK_SIZE = 10000
+
+
+def product_code(index):
+    return f'BENCH{index:09d}'
+
+
+def split_statements(sql):
+    """Split a schema file into statements, dropping comments and its CREATE DATABASE/USE lines."""
+    lines = []
+    for line in sql.splitlines():
+        line = line.split('--', 1)[0].rstrip()
+        if line:
+            lines.append(line)
+    statements = []
+    for statement in '\n'.join(lines).split(';'):
+        statement = statement.strip()
+        if not statement:
+            continue
+        if statement.upper().startswith(('CREATE DATABASE', 'USE ')):
+            continue
+        statements.append(statement)
+    return statements
+
+
+def connect(database=None):
+    return pymysql.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        port=int(os.getenv('DB_PORT', 3306)),
+        user=os.getenv('DB_USER', 'root'),
+        password=os.getenv('DB_PASSWORD', 'password'),
+        database=database,
+        cursorclass=pymysql.cursors.DictCursor,
+        autocommit=False
+    )
+
+
+def apply_schema(database):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(f'DROP DATABASE IF EXISTS `{database}`')
+    cursor.execute(f'CREATE DATABASE `{database}`')
+    cursor.execute(f'USE `{database}`')
+    for name in ('schema.sql', 'schema_updates.sql'):
+        with open(os.path.join(BACKEND_DIR, 'database', name)) as f:
+            for statement in split_statements(f.read()):
+                cursor.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def insert_chunks(conn, query, rows, label):
+    """executemany() in CHUNK_SIZE slices; PyMySQL turns each into multi-row INSERTs."""
+    cursor = conn.cursor()
+    started = time.monotonic()
+    total = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            cursor.executemany(query, chunk)
+            conn.commit()
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        cursor.executemany(query, chunk)
+        conn.commit()
+        total += len(chunk)
+    cursor.close()
+    print(f'  {label}: {total} rows in {time.monotonic() - started:.1f}s', file=sys.stderr)
+    return total
+
+
+def fetch_ids(conn, query):
+    cursor = conn.cursor(pymysql.cursors.SSCursor)
+    cursor.execute(query)
+    ids = [row[0] for row in cursor]
+    cursor.close()
+    return ids
+
+
+def random_moment(rng, now, days=365):
+    return now - timedelta(seconds=rng.randrange(days * 86400))
+
+
+def seed(database, businesses, consumers, products_per_business, verifications, feedback, random_seed):
+    rng = random.Random(random_seed)
+    now = datetime.now().replace(microsecond=0)
+    rounds = int(os.getenv('BCRYPT_ROUNDS', 12))
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+    print(f'Applying schema to {database}', file=sys.stderr)
+    apply_schema(database)
+
+    conn = connect(database)
+    cursor = conn.cursor()
+    cursor.execute('SET SESSION foreign_key_checks = 0, unique_checks = 0')
+    cursor.close()
+
+    user_query = """
+        INSERT INTO users (full_name, email, phone, password_hash, role, is_verified)
+        VALUES (%s, %s, %s, %s, %s, TRUE)
+    """
+    insert_chunks(conn, user_query, (
+        (f'Bench Business {i}', f'bench-business-{i}@example.com', f'7{i:09d}', password_hash, 'business')
+        for i in range(businesses)
+    ), 'business users')
+    insert_chunks(conn, user_query, (
+        (f'Bench Consumer {i}', f'bench-consumer-{i}@example.com', f'8{i:09d}', password_hash, 'consumer')
+        for i in range(consumers)
+    ), 'consumer users')
+
+    business_ids = fetch_ids(conn, "SELECT id FROM users WHERE email LIKE 'bench-business-%' ORDER BY id")
+    consumer_ids = fetch_ids(conn, "SELECT id FROM users WHERE email LIKE 'bench-consumer-%' ORDER BY id")
+
+    insert_chunks(conn, """
+        INSERT INTO business_certification
+            (user_id, business_name, registration_number, owner_name, owner_mobile, owner_email,
+             vendor_count, cleanliness_rating, cruelty_free, sustainability, photos, status)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (
+        (user_id, f'Bench Business {i}', f'REG{i:08d}', f'Owner {i}', f'7{i:09d}',
+         f'bench-business-{i}@example.com', rng.randrange(5), rng.randrange(6),
+         rng.random() < 0.7, 'Solar powered' if rng.random() < 0.5 else None, '[]',
+         rng.choice(('pending', 'approved', 'approved', 'rejected')))
+        for i, user_id in enumerate(business_ids)
+    ), 'certifications')
+
+    insert_chunks(conn, """
+        INSERT INTO businesses (user_id, business_name, description, certification_status, certified_date)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (
+        (user_id, f'Bench Business {i}', 'Synthetic business for benchmarking.',
+         'certified', (now - timedelta(days=rng.randrange(700))).date())
+        for i, user_id in enumerate(business_ids)
+    ), 'business listings')
+
+    insert_chunks(conn, """
+        INSERT INTO products
+            (business_id, product_name, product_code, category, description, certification_status, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (
+        (business_ids[index // products_per_business], f'Bench Product {index}', product_code(index),
+         rng.choice(('Skincare', 'Makeup', 'Hair Care', 'Personal Care')), 'Synthetic product.',
+         'verified', random_moment(rng, now))
+        for index in range(businesses * products_per_business)
+    ), 'products')
+
+    product_ids = fetch_ids(conn, "SELECT id FROM products WHERE product_code LIKE 'BENCH%' ORDER BY id")
+    listing_ids = fetch_ids(conn, "SELECT id FROM businesses WHERE business_name LIKE 'Bench Business %' ORDER BY id")
+
+    # Ratings skew positive, like real reviews; one in ten rates a listing instead of a product
+    ratings = (1, 2, 3, 4, 5)
+    weights = (5, 5, 15, 35, 40)
+    insert_chunks(conn, """
+        INSERT INTO feedback (product_id, business_id, consumer_id, feedback_text, rating, upvotes, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (
+        (None, rng.choice(listing_ids), rng.choice(consumer_ids), 'Synthetic listing feedback.',
+         rng.choices(ratings, weights)[0], 0, random_moment(rng, now))
+        if rng.random() < 0.1 else
+        (rng.choice(product_ids), None, rng.choice(consumer_ids), 'Synthetic product feedback.',
+         rng.choices(ratings, weights)[0], rng.randrange(10), random_moment(rng, now))
+        for _ in range(feedback)
+    ), 'feedback')
+
+    insert_chunks(conn, """
+        INSERT INTO product_verifications (product_id, user_id, verification_date, verification_method)
+        VALUES (%s, %s, %s, %s)
+    """, (
+        (rng.choice(product_ids), rng.choice(consumer_ids), random_moment(rng, now), rng.choice(METHODS))
+        for _ in range(verifications)
+    ), 'verifications')
+
+    print('Rebuilding rating aggregates and scan rollups', file=sys.stderr)
+    rebuild_aggregates(conn)
+    scan_rollup.settle_seconds = 0
+    scan_rollup.rebuild(conn)
+
+    return {
+        'database': database,
+        'seed': random_seed,
+        'password': PASSWORD,
+        'businesses': businesses,
+        'consumers': consumers,
+        'products': len(product_ids),
+        'products_per_business': products_per_business,
+        'verifications': verifications,
+        'feedback': feedback,
+        'business_email': 'bench-business-{}@example.com',
+        'consumer_email': 'bench-consumer-{}@example.com',
+        'product_code': 'BENCH{:09d}',
+        'seeded_at': now.isoformat()
+    }
+
+
+def main():
+    load_dotenv(os.path.join(BACKEND_DIR, '.env'))
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=os.getenv('BENCH_DB_NAME', 'swach_village_bench'),
+                        help='database to (re)create; it is dropped first')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--businesses', type=int)
+    parser.add_argument('--consumers', type=int)
+    parser.add_argument('--products-per-business', type=int)
+    parser.add_argument('--verifications', type=int)
+    parser.add_argument('--feedback', type=int)
+    parser.add_argument('--seed', type=int, default=42, help='random seed, for reproducible data')
+    parser.add_argument('--manifest', default=os.path.join(BACKEND_DIR, 'bench', 'seed_manifest.json'))
+    args = parser.parse_args()
+
+    sizes = dict(PRESETS[args.preset])
+    for key in sizes:
+        value = getattr(args, key)
+        if value is not None:
+            sizes[key] = value
+
+    started = time.monotonic()
+    manifest = seed(args.database, random_seed=args.seed, **sizes)
+    manifest['seed_seconds'] = round(time.monotonic() - started, 1)
+
+    with open(args.manifest, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -59,3 +59,116 @@ INSERT INTO products (business_id, product_name, product_code, category, descrip
 INSERT INTO feedback (consumer_id, business_id, feedback_text, rating) VALUES
 (2, 1, 'Great products, really love their commitment to sustainability!', 5),
 (2, 1, 'Product quality is excellent, packaging could be improved.', 4);
+
+-- Running rating aggregates (count, sum and 1-5 histogram), updated in the same
+-- transaction as every feedback write so averages never need a scan of feedback.
+-- subject_type: 'product'  -> products.id
+--               'business' -> business user id (products.business_id)
+--               'listing'  -> businesses.id (business-level feedback)
+-- version is bumped by every feedback write (including text edits and upvotes)
+-- and feeds the ETags of feedback listings.
+-- Backfill or repair with: flask rebuild-ratings
+CREATE TABLE IF NOT EXISTS rating_aggregates (
+    subject_type ENUM('product', 'business', 'listing') NOT NULL,
+    subject_id INT NOT NULL,
+    rating_count INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0,
+    rating_1 INT NOT NULL DEFAULT 0,
+    rating_2 INT NOT NULL DEFAULT 0,
+    rating_3 INT NOT NULL DEFAULT 0,
+    rating_4 INT NOT NULL DEFAULT 0,
+    rating_5 INT NOT NULL DEFAULT 0,
+    version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (subject_type, subject_id)
+);
+
+-- Aggregates for the sample feedback above
+INSERT INTO rating_aggregates (subject_type, subject_id, rating_count, rating_sum, rating_4, rating_5) VALUES
+('listing', 1, 2, 9, 1, 1);
+
+-- Composite indexes backing (created_at, id) keyset pagination of feedback listings
+CREATE INDEX idx_feedback_product_created ON feedback(product_id, created_at, id);
+CREATE INDEX idx_feedback_consumer_created ON feedback(consumer_id, created_at, id);
+CREATE INDEX idx_feedback_business_created ON feedback(business_id, created_at, id);
+
+-- Recent products on the business dashboard
+CREATE INDEX idx_products_business_created ON products(business_id, created_at);
+
+-- Incremental refresh of the product code filter (app/bloom.py)
+CREATE INDEX idx_products_updated ON products(updated_at);
+
+-- Scan counts rolled up from product_verifications by a background job
+-- (app/scan_rollups.py); rollup_watermarks holds the last verification id counted.
+-- Recount from scratch with: flask rollup-scans --rebuild
+CREATE TABLE IF NOT EXISTS scan_rollups_hourly (
+    bucket_start DATETIME NOT NULL,
+    product_id INT NOT NULL,
+    verification_method ENUM('barcode_scan', 'manual_code', 'qr_code') NOT NULL,
+    business_id INT,
+    scan_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_id, bucket_start, verification_method),
+    INDEX idx_scan_rollups_hourly_business (business_id, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS scan_rollups_daily (
+    bucket_date DATE NOT NULL,
+    product_id INT NOT NULL,
+    verification_method ENUM('barcode_scan', 'manual_code', 'qr_code') NOT NULL,
+    business_id INT,
+    scan_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_id, bucket_date, verification_method),
+    INDEX idx_scan_rollups_daily_business (business_id, bucket_date)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    name VARCHAR(64) PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Ids the watermark passed before their row was visible, counted once they commit
+CREATE TABLE IF NOT EXISTS rollup_gaps (
+    name VARCHAR(64) NOT NULL,
+    verification_id BIGINT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (name, verification_id),
+    INDEX idx_rollup_gaps_created (name, created_at)
+);
+
+-- Bumped by every certification write from the API; with updated_at it forms
+-- the ETag of GET /api/business/certification and /api/products/details
+ALTER TABLE business_certification
+ADD COLUMN version INT UNSIGNED NOT NULL DEFAULT 0;
+
+-- Keyset pagination of the business directory, in name order
+CREATE INDEX idx_businesses_name ON businesses(business_name, id);
+
+-- Background catalog imports (POST /api/products/import); polled through
+-- GET /api/products/import/<id>. errors holds the per-row report as JSON.
+CREATE TABLE IF NOT EXISTS product_imports (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    business_id INT NOT NULL,
+    filename VARCHAR(255),
+    format ENUM('csv', 'jsonl') NOT NULL,
+    status ENUM('queued', 'running', 'completed', 'failed') NOT NULL DEFAULT 'queued',
+    bytes_total BIGINT NOT NULL DEFAULT 0,
+    bytes_processed BIGINT NOT NULL DEFAULT 0,
+    rows_processed INT NOT NULL DEFAULT 0,
+    inserted INT NOT NULL DEFAULT 0,
+    updated INT NOT NULL DEFAULT 0,
+    failed INT NOT NULL DEFAULT 0,
+    errors MEDIUMTEXT,
+    message TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME,
+    INDEX idx_product_imports_business (business_id, created_at),
+    FOREIGN KEY (business_id) REFERENCES users(id)
+);
+
+-- Search (GET /api/consumer/search). The name-only indexes weight name hits
+-- above description hits when ranking
+CREATE FULLTEXT INDEX ft_products_name ON products(product_name);
+CREATE FULLTEXT INDEX ft_products_text ON products(product_name, category, description);
+CREATE FULLTEXT INDEX ft_businesses_name ON businesses(business_name);
+CREATE FULLTEXT INDEX ft_businesses_text ON businesses(business_name, description);
@@ -1,6 +1,7 @@
 from app import create_app
 
-app = create_app()
-
+# Built only when run as a script: worker processes started with spawn
+# (app/photo_store.py) re-import this module and must not build an app
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    app = create_app()
+    app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+aiomysql = pytest.importorskip('aiomysql')
+
+from app import aio_database  # noqa: E402
+from app.aio_database import AsyncDatabase, AsyncPoolTimeout  # noqa: E402
+
+
+class FakeConnection:
+    def __init__(self, alive=True, hang=False):
+        self.alive = alive
+        self.hang = hang
+        self.closed = False
+        self.pings = 0
+
+    async def ping(self, reconnect=True):
+        self.pings += 1
+        if self.hang:
+            await asyncio.sleep(10)
+        if not self.alive:
+            raise aiomysql.OperationalError(2006, 'MySQL server has gone away')
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool:
+    """Hands out the queued connections in order, then fresh ones; remembers releases."""
+
+    def __init__(self, *connections):
+        self.connections = list(connections)
+        self.released = []
+
+    async def acquire(self):
+        return self.connections.pop(0) if self.connections else FakeConnection()
+
+    def release(self, conn):
+        self.released.append(conn)
+
+
+def make_db(pool, **kwargs):
+    db = AsyncDatabase(**kwargs)
+    db._pool = pool
+    return db
+
+
+def test_acquire_pings_live_connection():
+    conn = FakeConnection()
+    db = make_db(FakePool(conn))
+    assert asyncio.run(db.acquire()) is conn
+    assert conn.pings == 1
+
+
+def test_dead_connection_is_replaced():
+    dead = FakeConnection(alive=False)
+    pool = FakePool(dead)
+    fresh = asyncio.run(make_db(pool).acquire())
+    assert fresh is not dead
+    assert dead.closed and pool.released == [dead]
+
+
+def test_hung_ping_is_bounded_by_timeout():
+    pool = FakePool(FakeConnection(hang=True))
+    db = make_db(pool, timeout=0.05)
+    with pytest.raises(AsyncPoolTimeout):
+        asyncio.run(db.acquire())
+    assert pool.released[0].closed
+
+
+def test_expired_connection_is_recycled(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(aio_database.time, 'monotonic', lambda: now[0])
+    old = FakeConnection()
+    pool = FakePool(old, old)
+    db = make_db(pool, max_lifetime=60)
+
+    assert asyncio.run(db.acquire()) is old
+    now[0] += 61
+    assert asyncio.run(db.acquire()) is not old
+    assert old.closed and old.pings == 1
@@ -0,0 +1,71 @@
+import pytest
+from flask import Flask, jsonify
+
+pytest.importorskip('starlette')
+pytest.importorskip('a2wsgi')
+pytest.importorskip('httpx')
+
+from starlette.testclient import TestClient  # noqa: E402
+
+from app import search  # noqa: E402
+from app.asgi import create_asgi_app  # noqa: E402
+from app.bloom import BloomFilter, product_filter  # noqa: E402
+from app.search import Vocabulary  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    # A stand-in Flask app, so requests that fall through never touch the database
+    fallback = Flask('fallback')
+
+    @fallback.route('/api/health')
+    def health():
+        return jsonify({'status': 'ok'})
+
+    @fallback.route('/api/products/verify', methods=['OPTIONS'])
+    def preflight():
+        return jsonify({'preflight': True})
+
+    # Not used as a context manager, so the lifespan never opens the async pool
+    return TestClient(create_asgi_app(fallback))
+
+
+def test_unmatched_path_falls_back_to_flask(client):
+    response = client.get('/api/health')
+    assert response.status_code == 200
+    assert response.json() == {'status': 'ok'}
+
+
+def test_unrouted_method_falls_back_to_flask(client):
+    assert client.options('/api/products/verify').json() == {'preflight': True}
+    # Flask serves no other methods on the async paths, so Starlette's 405 matches it
+    assert client.delete('/api/consumer/search').status_code == 405
+
+
+def test_suggest_runs_on_event_loop(client, monkeypatch):
+    vocabulary = Vocabulary()
+    vocabulary._counts = {'organic': 5, 'oregano': 2}
+    vocabulary._terms = sorted(vocabulary._counts)
+    monkeypatch.setattr(search, 'vocabulary', vocabulary)
+
+    response = client.get('/api/consumer/search/suggest', params={'q': 'or'})
+    assert response.status_code == 200
+    assert response.headers['access-control-allow-origin'] == '*'
+    assert response.json()['success'] is True
+
+
+def test_verify_rejects_missing_and_filtered_codes(client, monkeypatch):
+    assert client.get('/api/products/verify').status_code == 400
+
+    monkeypatch.setattr(product_filter, '_filter', BloomFilter(10))
+    response = client.get('/api/products/verify', params={'code': 'UNKNOWN'})
+    assert response.status_code == 404
+    assert response.json() == {'success': False, 'message': 'Product not found'}
+
+
+def test_feedback_route_requires_token(client):
+    response = client.get('/api/feedback/get/7')
+    assert response.status_code == 401
+    assert response.json() == {'message': 'Authorization token is missing'}
+    # The int converter rejects other ids, which then reach the Flask app
+    assert client.get('/api/feedback/get/abc').status_code == 404
@@ -0,0 +1,40 @@
+from app.bloom import BloomFilter, ProductCodeFilter, normalize_code
+
+
+def test_bloom_has_no_false_negatives():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    codes = [f'CODE-{i}' for i in range(1000)]
+    for code in codes:
+        bloom.add(code)
+    assert all(code in bloom for code in codes)
+    assert bloom.count == 1000
+
+
+def test_bloom_false_positive_rate_is_near_target():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f'CODE-{i}')
+    false_positives = sum(f'OTHER-{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+    assert 0 < bloom.false_positive_rate() < 0.02
+
+
+def test_normalize_code_matches_collation():
+    assert normalize_code('Abc-123') == normalize_code('aBC-123')
+    assert normalize_code('café') == normalize_code('CAFE')
+    assert normalize_code('abc  ') == 'abc'
+    assert normalize_code('  abc') != 'abc'
+
+
+def test_product_filter_allows_everything_until_built():
+    product_filter = ProductCodeFilter()
+    assert product_filter.might_contain('anything')
+
+
+def test_product_filter_rejects_unknown_codes():
+    product_filter = ProductCodeFilter()
+    product_filter._filter = BloomFilter(100)
+    product_filter.add('Crème-01')
+    assert product_filter.might_contain('CREME-01 ')
+    assert not product_filter.might_contain('missing-code')
+    assert product_filter.rejects == 1
@@ -0,0 +1,30 @@
+import os
+import gzip
+import json
+
+from app.compression import COMPRESS_MIN_SIZE, ENCODINGS, compress_body, negotiate
+
+
+def test_negotiate_prefers_server_order():
+    assert negotiate('gzip, br') == ENCODINGS[0]
+    assert negotiate('gzip') == 'gzip'
+    assert negotiate('identity') is None
+    assert negotiate('') is None
+    assert negotiate('gzip;q=0') is None
+
+
+def test_compress_body_skips_small_bodies():
+    assert compress_body(b'x' * (COMPRESS_MIN_SIZE - 1), 'gzip') is None
+
+
+def test_compress_body_skips_incompressible_bodies():
+    assert compress_body(os.urandom(COMPRESS_MIN_SIZE * 4), 'gzip') is None
+
+
+def test_compress_body_gzip_round_trip():
+    data = json.dumps([{'product_code': f'CODE-{i}'} for i in range(200)]).encode()
+    compressed = compress_body(data, 'gzip')
+    assert compressed is not None and len(compressed) < len(data)
+    assert gzip.decompress(compressed) == data
+    # mtime is pinned, so equal bodies compress to equal bytes
+    assert compress_body(data, 'gzip') == compressed
@@ -0,0 +1,166 @@
+import threading
+
+import pymysql
+import pytest
+from flask import Flask
+from pymysql.constants import SERVER_STATUS
+
+from app import database
+from app.database import ConnectionPool, PoolTimeout, get_db_connection, release_db_connection
+
+
+class FakeConnection:
+    """Stands in for a PyMySQL connection; records what the pool does with it."""
+
+    def __init__(self):
+        self.open = True
+        self.alive = True
+        self.server_status = 0
+        self.rollbacks = 0
+
+    def ping(self, reconnect=True):
+        if not self.alive:
+            raise pymysql.err.OperationalError(2006, 'MySQL server has gone away')
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.server_status &= ~SERVER_STATUS.SERVER_STATUS_IN_TRANS
+
+    def close(self):
+        self.open = False
+
+
+class FakeConnector:
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self):
+        raw = FakeConnection()
+        self.opened.append(raw)
+        return raw
+
+
+@pytest.fixture
+def connector():
+    return FakeConnector()
+
+
+def make_pool(connector, **kwargs):
+    kwargs.setdefault('timeout', 0.05)
+    return ConnectionPool(connect=connector, **kwargs)
+
+
+def test_fill_opens_min_size(connector):
+    pool = make_pool(connector, min_size=2, max_size=4)
+    pool.fill()
+    assert len(connector.opened) == 2
+    assert pool.stats() == {'size': 2, 'idle': 2, 'in_use': 0, 'max_size': 4}
+
+
+def test_checkout_and_release_reuse_connection(connector):
+    pool = make_pool(connector, max_size=2)
+    conn = pool.connection()
+    raw = conn._raw
+    assert pool.stats()['in_use'] == 1
+
+    conn.close()
+    conn.close()  # a second close must not return it twice
+    assert pool.stats() == {'size': 1, 'idle': 1, 'in_use': 0, 'max_size': 2}
+    assert raw.open
+
+    assert pool.connection()._raw is raw
+    assert len(connector.opened) == 1
+
+
+def test_checkout_times_out_when_exhausted(connector):
+    pool = make_pool(connector, max_size=1)
+    held = pool.connection()
+    with pytest.raises(PoolTimeout):
+        pool.connection()
+
+    # A release wakes a waiting checkout
+    timer = threading.Timer(0.01, held.close)
+    pool.timeout = 1
+    timer.start()
+    assert pool.connection()._raw is held._raw
+    timer.join()
+
+
+def test_dead_connection_is_replaced_on_checkout(connector):
+    pool = make_pool(connector, max_size=1)
+    conn = pool.connection()
+    conn._raw.alive = False
+    conn.close()
+
+    fresh = pool.connection()
+    assert fresh._raw is connector.opened[1]
+    assert not connector.opened[0].open
+    assert pool.stats()['size'] == 1
+
+
+def test_expired_connections_are_recycled(connector, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(database.time, 'monotonic', lambda: now[0])
+    pool = make_pool(connector, max_size=2, max_lifetime=60)
+
+    conn = pool.connection()
+    now[0] += 61
+    # Expired while checked out: closed on release instead of pooled
+    conn.close()
+    assert not connector.opened[0].open
+    assert pool.stats()['size'] == 0
+
+    conn = pool.connection()
+    conn.close()
+    now[0] += 61
+    # Expired while idle: replaced on checkout
+    assert pool.connection()._raw is connector.opened[2]
+    assert not connector.opened[1].open
+
+
+def test_release_rolls_back_open_transaction(connector):
+    pool = make_pool(connector)
+    conn = pool.connection()
+    conn._raw.server_status |= SERVER_STATUS.SERVER_STATUS_IN_TRANS
+    conn.close()
+    assert connector.opened[0].rollbacks == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_failed_rollback_discards_connection(connector):
+    pool = make_pool(connector)
+    conn = pool.connection()
+    raw = conn._raw
+    raw.server_status |= SERVER_STATUS.SERVER_STATUS_IN_TRANS
+
+    def broken_rollback():
+        raise pymysql.err.OperationalError(2013, 'Lost connection')
+    raw.rollback = broken_rollback
+
+    conn.close()
+    assert not raw.open
+    assert pool.stats()['size'] == 0
+
+
+def test_request_bound_connection_released_at_teardown(connector, monkeypatch):
+    pool = make_pool(connector)
+    monkeypatch.setattr(database, 'pool', pool)
+    app = Flask(__name__)
+    app.teardown_appcontext(release_db_connection)
+
+    with app.app_context():
+        conn = get_db_connection()
+        assert get_db_connection() is conn
+        # Handlers close their connection; the request keeps it until teardown
+        conn.close()
+        assert pool.stats()['in_use'] == 1
+    assert pool.stats() == {'size': 1, 'idle': 1, 'in_use': 0, 'max_size': 10}
+
+
+def test_connection_outside_app_context_is_not_bound(connector, monkeypatch):
+    pool = make_pool(connector)
+    monkeypatch.setattr(database, 'pool', pool)
+    conn = get_db_connection()
+    assert get_db_connection() is not conn
+    conn.close()
+    assert pool.stats()['in_use'] == 1
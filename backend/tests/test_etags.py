@@ -0,0 +1,22 @@
+from app.etags import held_etag, make_etag
+
+
+def test_make_etag_depends_on_every_part():
+    assert make_etag('product', 1, 5) == make_etag('product', 1, 5)
+    assert make_etag('product', 1, 5) != make_etag('product', 1, 6)
+
+
+def test_held_etag_matches_plain_and_weak_tags():
+    assert held_etag('abc', '"abc"') == '"abc"'
+    assert held_etag('abc', 'W/"abc"') == 'W/"abc"'
+    assert held_etag('abc', '"other"') is None
+    assert held_etag('abc', None) is None
+
+
+def test_held_etag_strips_encoding_suffix_and_echoes_it():
+    assert held_etag('abc', '"xyz", "abc-gzip"') == '"abc-gzip"'
+    assert held_etag('abc', '"abc-br"') == '"abc-br"'
+
+
+def test_held_etag_wildcard():
+    assert held_etag('abc', '*') == '"abc"'
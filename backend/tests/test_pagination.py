@@ -0,0 +1,36 @@
+from datetime import datetime
+
+import pytest
+
+from app.pagination import InvalidCursor, decode_cursor, encode_cursor, page_params, paginate
+
+
+def test_cursor_round_trip_keeps_datetimes():
+    values = [datetime(2024, 5, 1, 12, 30, 15), 42]
+    token = encode_cursor(values)
+    assert '=' not in token
+    assert decode_cursor(token, 2) == values
+
+
+@pytest.mark.parametrize('token', ['not a cursor', 'e30', encode_cursor([1])])
+def test_decode_rejects_bad_tokens(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, 2)
+
+
+def test_page_params_caps_limit():
+    limit, cursor = page_params({'limit': '100000'})
+    assert limit == 100
+    assert cursor is None
+    assert page_params({'limit': 'abc'}, default_limit=7) == (7, None)
+    assert page_params({'limit': '0'})[0] == 1
+
+
+def test_paginate_returns_cursor_only_when_more_rows():
+    rows = [{'id': i} for i in range(3)]
+    page, token = paginate(rows, 3, key=lambda row: (row['id'], row['id']))
+    assert page == rows and token is None
+
+    page, token = paginate(rows, 2, key=lambda row: (row['id'], row['id']))
+    assert page == rows[:2]
+    assert decode_cursor(token, 2) == [1, 1]
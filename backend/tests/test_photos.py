@@ -0,0 +1,93 @@
+import os
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from flask import Flask
+from PIL import UnidentifiedImageError
+
+from app import photo_store
+from app.photo_store import ThumbnailPool, original_path
+from app.photos import photos_bp
+
+PHOTO_ID = 'ab' * 32
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(photo_store, 'PHOTO_STORAGE_DIR', str(tmp_path))
+    os.makedirs(photo_store.photo_dir(PHOTO_ID))
+    with open(os.path.join(photo_store.photo_dir(PHOTO_ID), 'original.jpg'), 'wb') as f:
+        f.write(b'not really a jpeg')
+    return tmp_path
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(photos_bp, url_prefix='/api/photos')
+    return app.test_client()
+
+
+def use_pool(monkeypatch, submit):
+    pool = ThumbnailPool(timeout=0.01)
+    monkeypatch.setattr(pool, 'submit', submit)
+    monkeypatch.setattr(photo_store, 'thumbnail_pool', pool)
+    return pool
+
+
+def test_render_timeout_is_retryable(storage, client, monkeypatch):
+    # The render never finishes, so the request gives up after the pool timeout
+    use_pool(monkeypatch, lambda photo_id, source: Future())
+    response = client.get(f'/api/photos/{PHOTO_ID}/thumb')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_crashed_worker_is_retryable(storage, client, monkeypatch):
+    def submit(photo_id, source):
+        future = Future()
+        future.set_exception(BrokenProcessPool('worker died'))
+        return future
+
+    pool = use_pool(monkeypatch, submit)
+    pool._executor = object()
+    assert client.get(f'/api/photos/{PHOTO_ID}/thumb').status_code == 503
+    # The next request starts a fresh pool
+    assert pool._executor is None
+
+
+def test_unreadable_original_is_422(storage, client, monkeypatch):
+    def submit(photo_id, source):
+        future = Future()
+        future.set_exception(UnidentifiedImageError('cannot identify image file'))
+        return future
+
+    use_pool(monkeypatch, submit)
+    response = client.get(f'/api/photos/{PHOTO_ID}/medium')
+    assert response.status_code == 422
+    assert response.get_json() == {'message': 'Photo could not be rendered'}
+
+
+def test_unknown_photo_is_404(storage, client):
+    assert client.get(f'/api/photos/{"cd" * 32}/thumb').status_code == 404
+    assert client.get(f'/api/photos/{PHOTO_ID}/huge').status_code == 404
+    assert original_path(PHOTO_ID) is not None
+
+
+def test_normalize_photos_rejects_too_many_before_storing(tmp_path, monkeypatch):
+    monkeypatch.setattr(photo_store, 'PHOTO_STORAGE_DIR', str(tmp_path))
+    stored = []
+    monkeypatch.setattr(photo_store, 'store_photo', lambda data: stored.append(data) or ('ef' * 32, True))
+    inline = 'data:image/png;base64,aGVsbG8='
+
+    with pytest.raises(photo_store.InvalidPhoto, match='At most'):
+        photo_store.normalize_photos([inline] * (photo_store.PHOTO_MAX_PER_ITEM + 1))
+    with pytest.raises(photo_store.InvalidPhoto, match='Unknown photo'):
+        photo_store.normalize_photos([inline, '12' * 32])
+    assert stored == []
+
+    assert photo_store.normalize_photos([inline, 'https://example.com/a.jpg', inline]) == (
+        '["' + 'ef' * 32 + '", "https://example.com/a.jpg"]'
+    )
+    assert stored == [b'hello', b'hello']
@@ -0,0 +1,101 @@
+import io
+
+import pytest
+
+from app.product_import import (
+    FORM_FIELD_MAX_BYTES, InvalidImport, UploadReader, clean_record, detect_format, iter_records
+)
+
+BOUNDARY = 'test-boundary'
+
+
+def multipart(*parts):
+    """Encode (name, value, filename) parts as a multipart/form-data body."""
+    body = b''
+    for name, value, filename in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename:
+            disposition += f'; filename="{filename}"'
+        body += f'--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode() + value + b'\r\n'
+    return body + f'--{BOUNDARY}--\r\n'.encode()
+
+
+def test_clean_record_strips_and_stringifies():
+    product, error = clean_record({'product_code': ' A1 ', 'product_name': 'Tea', 'category': 12, 'description': ''})
+    assert error is None
+    assert product == {'product_code': 'A1', 'product_name': 'Tea', 'category': '12', 'description': None}
+
+
+@pytest.mark.parametrize('record, message', [
+    ({'product_name': 'Tea'}, 'product_code is required'),
+    ({'product_code': 'A1', 'product_name': '  '}, 'product_name is required'),
+    ({'product_code': 'A1', 'product_name': 'x' * 256}, 'product_name is longer than 255 characters'),
+])
+def test_clean_record_rejects(record, message):
+    assert clean_record(record) == (None, message)
+
+
+def test_detect_format():
+    assert detect_format('NDJSON', None, None) == 'jsonl'
+    assert detect_format(None, 'products.CSV', None) == 'csv'
+    assert detect_format(None, None, 'application/x-ndjson; charset=utf-8') == 'jsonl'
+    with pytest.raises(InvalidImport):
+        detect_format('xml', None, None)
+    with pytest.raises(InvalidImport):
+        detect_format(None, 'products.txt', 'text/plain')
+
+
+def test_iter_records_csv_lowercases_header_and_skips_blank_rows():
+    stream = io.BytesIO('﻿Product_Code,Product_Name\nA1,Tea\n,\nA2,Honey\n'.encode('utf-8'))
+    assert list(iter_records(stream, 'csv')) == [
+        (1, {'product_code': 'A1', 'product_name': 'Tea'}),
+        (3, {'product_code': 'A2', 'product_name': 'Honey'}),
+    ]
+    assert not stream.closed
+
+
+def test_iter_records_jsonl_reports_bad_lines():
+    stream = io.BytesIO(b'{"Product_Code": "A1"}\n\nnot json\n[1]\n')
+    assert list(iter_records(stream, 'jsonl')) == [
+        (1, {'product_code': 'A1'}),
+        (3, 'Invalid JSON'),
+        (4, 'Each line must be a JSON object'),
+    ]
+
+
+def test_upload_reader_raw_body():
+    reader = UploadReader(io.BytesIO(b'product_code,product_name\nA1,Tea\n'))
+    assert list(iter_records(reader, 'csv')) == [(1, {'product_code': 'A1', 'product_name': 'Tea'})]
+    assert reader.bytes_read == 33
+
+
+def test_upload_reader_raw_body_limit():
+    reader = UploadReader(io.BytesIO(b'x' * 100), max_bytes=10)
+    with pytest.raises(InvalidImport):
+        reader.read()
+
+
+def test_upload_reader_multipart_collects_fields_before_file():
+    body = multipart(('format', b'jsonl', None), ('file', b'{"product_code": "A1"}\n', 'items.jsonl'))
+    reader = UploadReader(io.BytesIO(body), BOUNDARY)
+    assert reader.fields == {'format': 'jsonl'}
+    assert reader.filename == 'items.jsonl'
+    assert list(iter_records(reader, 'jsonl')) == [(1, {'product_code': 'A1'})]
+
+
+def test_upload_reader_multipart_missing_file():
+    body = multipart(('format', b'csv', None))
+    with pytest.raises(InvalidImport, match="No 'file' file"):
+        UploadReader(io.BytesIO(body), BOUNDARY)
+
+
+def test_upload_reader_multipart_truncated():
+    body = multipart(('file', b'a,b\n1,2\n', 'items.csv'))
+    with pytest.raises(InvalidImport):
+        UploadReader(io.BytesIO(body[:-30]), BOUNDARY).read()
+
+
+def test_upload_reader_multipart_field_limit():
+    body = multipart(('notes', b'x' * (FORM_FIELD_MAX_BYTES + 1), None), ('file', b'', 'items.csv'))
+    with pytest.raises(InvalidImport, match='Form fields are limited'):
+        UploadReader(io.BytesIO(body), BOUNDARY)
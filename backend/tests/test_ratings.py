@@ -0,0 +1,32 @@
+import pytest
+
+from app.ratings import normalize_rating, record_rating
+
+
+@pytest.mark.parametrize('submitted, stored', [
+    (1, 1), (5, 5), ('3', 3), (1.5, 2), (2.5, 3), (4.5, 5), (4.49, 4),
+])
+def test_normalize_rating_rounds_halves_up_like_mysql(submitted, stored):
+    assert normalize_rating(submitted) == stored
+
+
+@pytest.mark.parametrize('submitted', [0, 0.9, 5.5, 6, 'four', None, True, float('nan'), [4]])
+def test_normalize_rating_rejects(submitted):
+    assert normalize_rating(submitted) is None
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+        self.rowcount = 1
+
+    def execute(self, query, params=None):
+        self.statements.append((' '.join(query.split()), params))
+
+
+def test_record_rating_applies_the_stored_value():
+    cursor = RecordingCursor()
+    record_rating(cursor, [('product', 7)], normalize_rating(4.5), 2)
+    retract, apply = cursor.statements
+    assert 'rating_2 = rating_2 - 1' in retract[0] and retract[1][0] == 2
+    assert 'rating_5' in apply[0] and apply[1] == ('product', 7, 1, 5, 1)
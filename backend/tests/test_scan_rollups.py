@@ -0,0 +1,51 @@
+from app.scan_rollups import ScanRollup
+
+
+class RecordingCursor:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append((' '.join(query.split()), params))
+
+    def executemany(self, query, params):
+        self.statements.append((' '.join(query.split()), list(params)))
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_missing_ids_are_recorded_as_gaps():
+    cursor = RecordingCursor()
+    ScanRollup()._record_gaps(cursor, 10, 15, {11, 12, 15})
+    (query, params), = cursor.statements
+    assert query.startswith('INSERT IGNORE INTO rollup_gaps')
+    assert params == [('scan_rollups', 13), ('scan_rollups', 14)]
+
+
+def test_no_gaps_no_insert():
+    cursor = RecordingCursor()
+    ScanRollup()._record_gaps(cursor, 10, 12, {11, 12})
+    assert cursor.statements == []
+
+
+def test_gap_tracking_keeps_the_newest_ids():
+    cursor = RecordingCursor()
+    ScanRollup(max_gaps=2)._record_gaps(cursor, 0, 10, {1})
+    assert cursor.statements[0][1] == [('scan_rollups', 9), ('scan_rollups', 10)]
+
+
+def test_late_rows_are_counted_once_and_cleared():
+    rollup = ScanRollup()
+    cursor = RecordingCursor([{'id': 13}, {'id': 14}])
+    assert rollup._count_late(cursor) == 2
+    select, hourly, daily, delete = cursor.statements
+    assert 'WHERE pv.id IN (%s, %s)' in hourly[0] and hourly[1] == [13, 14]
+    assert 'WHERE pv.id IN (%s, %s)' in daily[0]
+    assert delete == (
+        'DELETE FROM rollup_gaps WHERE name = %s AND verification_id IN (%s, %s)', ('scan_rollups', 13, 14)
+    )
+    assert rollup.stats()['late_rows'] == 2
+
+    assert rollup._count_late(RecordingCursor()) == 0
@@ -0,0 +1,51 @@
+import pytest
+
+from app import search
+from app.search import Vocabulary, boolean_query, parse_query
+
+
+def make_vocabulary(counts):
+    vocabulary = Vocabulary()
+    vocabulary._counts = dict(counts)
+    vocabulary._terms = sorted(counts)
+    return vocabulary
+
+
+@pytest.fixture
+def vocabulary(monkeypatch):
+    vocabulary = make_vocabulary({'organic': 50, 'orgasmic': 1, 'coffee': 30, 'cocoa': 10, 'honey': 5})
+    monkeypatch.setattr(search, 'vocabulary', vocabulary)
+    return vocabulary
+
+
+def test_correct_picks_most_frequent_single_edit(vocabulary):
+    assert vocabulary.correct('orgnic') == 'organic'
+    assert vocabulary.correct('cofee') == 'coffee'
+
+
+def test_correct_leaves_known_short_and_distant_tokens(vocabulary):
+    assert vocabulary.correct('organic') is None
+    assert vocabulary.correct('hny') is None
+    assert vocabulary.correct('zzzzzz') is None
+
+
+def test_correct_before_build():
+    assert Vocabulary().correct('orgnic') is None
+
+
+def test_complete_ranks_by_frequency(vocabulary):
+    assert vocabulary.complete('co') == ['coffee', 'cocoa']
+    assert vocabulary.complete('c') == []
+
+
+def test_parse_query_corrects_and_keeps_prefix(vocabulary):
+    terms, corrected = parse_query('orgnic cof')
+    assert terms == [('organic', False), ('cof', True)]
+    assert corrected
+    assert boolean_query(terms) == '+organic +cof*'
+
+
+def test_parse_query_without_prefix(vocabulary):
+    terms, corrected = parse_query('Honey', prefix=False)
+    assert terms == [('honey', False)]
+    assert not corrected
@@ -0,0 +1,229 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from app import steps
+from app.database import PoolTimeout
+from app.product_cache import product_cache
+from app.steps import Blocking, Query, Reply, drive
+
+PRODUCT = {
+    'id': 7, 'business_id': 3, 'product_name': 'Jaggery', 'product_code': 'JAG-001', 'category': 'food',
+    'description': None, 'certification_status': 'certified', 'certification_details': None,
+    'created_at': datetime(2024, 5, 1, 9, 30), 'updated_at': datetime(2024, 5, 2, 10, 0),
+    'listing_id': 11, 'business_name': 'Village Foods', 'business_certification_status': 'approved',
+    'certified_date': '2024-04-01'
+}
+
+
+class FakeCursor:
+    """Answers each execute() with the next queued result."""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.executed = []
+        self.closed = False
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        self._result = self.results.pop(0)
+        if isinstance(self._result, Exception):
+            raise self._result
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result
+
+    def close(self):
+        self.closed = True
+
+
+def test_drive_sends_results_and_returns_reply():
+    def handler():
+        row = yield Query('SELECT 1', fetch='one')
+        doubled = yield Blocking(lambda n: n * 2, row['n'])
+        return Reply({'n': doubled})
+
+    cursor = FakeCursor([{'n': 21}])
+    assert drive(handler(), cursor).body == {'n': 42}
+    assert cursor.executed == [('SELECT 1', None)]
+    assert not cursor.closed
+
+
+def test_drive_throws_query_errors_into_handler():
+    def handler():
+        try:
+            yield Query('SELECT broken')
+        except RuntimeError as e:
+            return Reply({'message': str(e)}, 500)
+
+    reply = drive(handler(), FakeCursor([RuntimeError('syntax error')]))
+    assert (reply.status, reply.body) == (500, {'message': 'syntax error'})
+
+
+def test_drive_raises_pool_timeout_to_caller(monkeypatch):
+    def exhausted():
+        raise PoolTimeout('No database connection available after 5s')
+    monkeypatch.setattr(steps, 'get_db_connection', exhausted)
+
+    def handler():
+        try:
+            yield Query('SELECT 1')
+        except Exception:
+            return Reply(status=500)
+
+    with pytest.raises(PoolTimeout):
+        drive(handler())
+
+
+def test_run_answers_pool_timeout_with_503(monkeypatch):
+    def exhausted():
+        raise PoolTimeout('No database connection available after 5s')
+    monkeypatch.setattr(steps, 'get_db_connection', exhausted)
+
+    def handler():
+        yield Query('SELECT 1')
+
+    with Flask(__name__).test_request_context():
+        response = steps.run(handler())
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+# ---------------------- Flask and ASGI serve the same handler ---------------------- #
+
+starlette = pytest.importorskip('starlette')
+pytest.importorskip('a2wsgi')
+
+from starlette.testclient import TestClient  # noqa: E402
+
+from app import asgi, auth_middleware, json_provider  # noqa: E402
+from app.consumer import consumer_bp  # noqa: E402
+from app.feedback import feedback_bp  # noqa: E402
+from app.products import products_bp  # noqa: E402
+
+
+class FakeAsyncCursor(FakeCursor):
+    async def execute(self, sql, params=None):
+        FakeCursor.execute(self, sql, params)
+
+    async def executemany(self, sql, rows):
+        self.executed.append((sql, rows))
+
+    async def fetchall(self):
+        return self._result
+
+    async def fetchone(self):
+        return self._result
+
+
+class FakeAsyncDatabase:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @asynccontextmanager
+    async def cursor(self):
+        yield self._cursor
+
+
+class FakeWriter:
+    def __init__(self):
+        self.rows = []
+
+    def offer(self, product_id, user_id, method):
+        self.rows.append((product_id, user_id, method))
+
+
+@pytest.fixture
+def flask_app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'test-secret'
+    json_provider.init_app(app)
+    auth_middleware.init_app(app)
+    app.register_blueprint(products_bp, url_prefix='/api/products')
+    app.register_blueprint(consumer_bp, url_prefix='/api/consumer')
+    app.register_blueprint(feedback_bp, url_prefix='/api/feedback')
+    return app
+
+
+@pytest.fixture
+def serve(flask_app, monkeypatch):
+    """serve(mode, results, method, path, **kwargs) -> (response, executed statements, verifications)."""
+    asgi_client = TestClient(asgi.create_asgi_app(flask_app))
+    flask_client = flask_app.test_client()
+
+    def call(mode, results, method, path, **kwargs):
+        product_cache.clear()
+        recorded = []
+        if mode == 'flask':
+            cursor = FakeCursor(results)
+            monkeypatch.setattr(steps, 'get_db_connection', lambda: type('Conn', (), {'cursor': lambda self: cursor})())
+            monkeypatch.setattr(steps, 'record_verification', lambda *row: recorded.append(row))
+            response = flask_client.open(path, method=method, **kwargs)
+            return response.status_code, response.get_json(), response.headers, cursor.executed, recorded
+
+        cursor = FakeAsyncCursor(results)
+        writer = FakeWriter()
+        monkeypatch.setattr(asgi, 'async_db', FakeAsyncDatabase(cursor))
+        monkeypatch.setattr(asgi, 'verification_writer', writer)
+        response = asgi_client.request(method, path, **kwargs)
+        body = response.json() if response.content else None
+        return response.status_code, body, response.headers, cursor.executed, writer.rows
+
+    return call
+
+
+def auth_header(role='consumer', user_id=5):
+    return {'Authorization': f'Bearer {auth_middleware.encode_token({"user_id": user_id, "role": role})}'}
+
+
+@pytest.mark.parametrize('mode', ['flask', 'asgi'])
+def test_code_verification(serve, mode):
+    status, body, _, executed, recorded = serve(mode, [PRODUCT], 'GET', '/api/products/verify?code=JAG-001')
+    assert status == 200
+    assert body['product']['certification_status'] == 'approved'
+    assert body['product']['created_at'] == serve('flask', [PRODUCT], 'GET', '/api/products/verify?code=JAG-001')[1]['product']['created_at']
+    assert len(executed) == 1
+    assert recorded == [(7, None, 'manual_code')]
+
+
+@pytest.mark.parametrize('mode', ['flask', 'asgi'])
+def test_code_verification_error_shape(serve, mode):
+    status, body, *_ = serve(mode, [RuntimeError('boom')], 'GET', '/api/products/verify?code=JAG-002')
+    assert (status, body) == (500, {'success': False, 'message': 'Error verifying product: boom'})
+
+
+@pytest.mark.parametrize('mode', ['flask', 'asgi'])
+def test_barcode_verification_rejects_non_object_body(serve, mode):
+    status, body, *_ = serve(mode, [], 'POST', '/api/products/verify', json=['JAG-001'], headers=auth_header())
+    assert (status, body) == (400, {'message': 'No barcode provided'})
+
+
+@pytest.mark.parametrize('mode', ['flask', 'asgi'])
+def test_product_scan_records_user(serve, mode):
+    status, body, _, _, recorded = serve(
+        mode, [PRODUCT], 'POST', '/api/consumer/verify-product', json={'barcode': 'JAG-001'}, headers=auth_header()
+    )
+    assert status == 200 and body['product']['business_id'] == 11
+    assert recorded == [(7, 5, 'barcode_scan')]
+
+
+@pytest.mark.parametrize('mode', ['flask', 'asgi'])
+def test_feedback_listing_etag(serve, mode):
+    aggregate = {'rating_count': 2, 'rating_sum': 9, 'rating_1': 0, 'rating_2': 0, 'rating_3': 0,
+                 'rating_4': 1, 'rating_5': 1, 'version': 4}
+    headers = dict(auth_header(), **{'Accept-Encoding': 'identity'})
+    status, body, response_headers, executed, _ = serve(mode, [aggregate, []], 'GET', '/api/feedback/get/7', headers=headers)
+    assert status == 200 and body['average_rating'] == 4.5 and len(executed) == 2
+    etag = response_headers['ETag']
+
+    status, body, response_headers, executed, _ = serve(
+        mode, [aggregate], 'GET', '/api/feedback/get/7', headers=dict(headers, **{'If-None-Match': etag})
+    )
+    assert status == 304 and response_headers['ETag'] == etag
+    # The page itself is never queried
+    assert len(executed) == 1
@@ -0,0 +1,49 @@
+import pytest
+
+from app.verification_log import VerificationWriter
+
+
+class RecordingWriter(VerificationWriter):
+    """Writer whose inserts are recorded instead of sent to MySQL."""
+
+    def __init__(self, failures=0, **kwargs):
+        kwargs.setdefault('retry_backoff', 0)
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.inserts = []
+
+    def _insert(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('server has gone away')
+        self.inserts.append(list(rows))
+
+
+@pytest.fixture
+def writer():
+    writer = RecordingWriter(batch_size=2, flush_interval=10)
+    yield writer
+    writer.stop()
+
+
+def test_stop_flushes_remaining_rows_once(writer):
+    for product_id in range(3):
+        writer.record(product_id, None, 'manual_code')
+    writer.stop()
+    assert sorted(row[0] for batch in writer.inserts for row in batch) == [0, 1, 2]
+    assert all(writer.inserts)
+    assert writer.stats()['written'] == 3
+    assert writer.pending() == 0
+
+
+def test_failed_batch_is_retried():
+    writer = RecordingWriter(failures=2, max_retries=3)
+    assert writer._write([(1, None, None, 'qr_scan')])
+    assert writer.inserts == [[(1, None, None, 'qr_scan')]]
+    assert writer.stats() == {'written': 1, 'retries': 2, 'dropped': 0, 'pending': 0}
+
+
+def test_batch_is_dropped_after_retries():
+    writer = RecordingWriter(failures=5, max_retries=2)
+    assert not writer._write([(1, None, None, 'qr_scan'), (2, None, None, 'qr_scan')])
+    assert writer.stats() == {'written': 0, 'retries': 2, 'dropped': 2, 'pending': 0}